@@ -0,0 +1,93 @@
+"""
+Compares FAISS index types on one company's chunks: recall@NUM_OF_DOCS_TO_RETRIEVE
+against exact search, single-query latency and serialized index size.
+
+    python -m app.benchmarks.ann_index --company NASDAQ_AAPL_2024
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from app.components.vector_db import load_vector_db, new_faiss_index, apply_search_params
+from app.components.resources import get_embeddings
+from app.components.vector_db import INDEX_TYPES
+from app.config.config import NUM_OF_DOCS_TO_RETRIEVE, FAISS_TRAIN_SAMPLE_SIZE
+from app.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+SAMPLE_QUERIES = [
+    "What was total net sales for the fiscal year?",
+    "How much did operating income change compared to the prior year?",
+    "What is the diluted earnings per share?",
+    "What are the main risk factors related to competition?",
+    "How much cash was returned to shareholders through buybacks and dividends?",
+    "What was the gross margin percentage?",
+    "How much did research and development expenses grow?",
+    "What is the total long-term debt outstanding?",
+    "What were net cash flows from operating activities?",
+    "How did revenue from services compare to products?",
+    "What is the effective tax rate?",
+    "What legal proceedings are disclosed in Item 3?",
+    "How many employees does the company have?",
+    "What were capital expenditures during the year?",
+    "What are the total assets on the balance sheet?",
+    "What does management say about liquidity and capital resources?",
+]
+
+def _percentile(values, q):
+    return float(np.percentile(np.asarray(values), q))
+
+def benchmark_index_type(index_type, vectors, queries, ground_truth, k):
+    train_vectors = vectors[:FAISS_TRAIN_SAMPLE_SIZE]
+    build_start = time.perf_counter()
+    index = new_faiss_index(vectors.shape[1], train_vectors, index_type=index_type)
+    index.add(vectors)
+    apply_search_params(index)
+    build_seconds = time.perf_counter() - build_start
+
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, ground_truth):
+        start = time.perf_counter()
+        _, found = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(found[0]) & set(expected))
+
+    return {
+        "index_type": index_type,
+        f"recall@{k}": hits / (len(queries) * k),
+        "latency_ms_p50": _percentile(latencies, 50),
+        "latency_ms_p99": _percentile(latencies, 99),
+        "index_bytes": int(faiss.serialize_index(index).nbytes),
+        "build_seconds": build_seconds,
+    }
+
+def run_benchmark(company, index_types=INDEX_TYPES, k=NUM_OF_DOCS_TO_RETRIEVE):
+    db = load_vector_db(company)
+    if db is None:
+        raise SystemExit(f"No index for {company}, run create_index first")
+
+    # Vectors come from the embedding cache, so this doesn't re-run the model
+    texts = [db.docstore.search(doc_id).page_content for doc_id in db.index_to_docstore_id.values()]
+    embedding_model = get_embeddings()
+    vectors = np.asarray(embedding_model.embed_documents(texts), dtype=np.float32)
+    queries = np.asarray([embedding_model.embed_query(q) for q in SAMPLE_QUERIES], dtype=np.float32)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, k)
+
+    logger.info(f"Benchmarking {len(index_types)} index types on {len(vectors)} chunks of {company}")
+    return [benchmark_index_type(index_type, vectors, queries, ground_truth, k) for index_type in index_types]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--company", default="NASDAQ_AAPL_2024")
+    parser.add_argument("--index-types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    args = parser.parse_args()
+    for result in run_benchmark(args.company, args.index_types):
+        print(json.dumps(result))
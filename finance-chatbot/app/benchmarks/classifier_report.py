@@ -0,0 +1,101 @@
+"""
+Accuracy and latency of the local definition-query classifier on a labeled query
+set: how many queries it decides, how many of those it gets right, and how long
+rules and embeddings take. --with-llm also scores the LLM fallback (needs API keys).
+
+    python -m app.benchmarks.classifier_report [--with-llm]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.components.query_classifier import DefinitionQueryClassifier
+from app.components.resources import get_embeddings, get_llm
+
+LABELED_QUERIES = [
+    ("What is the P/E ratio?", True),
+    ("What is an operating lease?", True),
+    ("Define gross margin", True),
+    ("What does EPS mean?", True),
+    ("What is meant by amortization?", True),
+    ("Explain the term accrued liabilities", True),
+    ("What is a dividend yield?", True),
+    ("Meaning of current ratio", True),
+    ("What does capex stand for?", True),
+    ("What is EBIT?", True),
+    ("What is operating leverage?", True),
+    ("Definition of book value per share", True),
+    ("What is unearned revenue?", True),
+    ("What are treasury shares?", True),
+    ("What is the debt to equity ratio?", True),
+    ("What was total revenue in fiscal 2024?", False),
+    ("How much did operating income increase?", False),
+    ("What is the percentage increase or decrease in operating income?", False),
+    ("How many employees does the company have?", False),
+    ("What were net sales for iPhone?", False),
+    ("Did the company repurchase shares this year?", False),
+    ("What is the company's effective tax rate?", False),
+    ("How much cash and cash equivalents were reported?", False),
+    ("Compare services revenue to products revenue", False),
+    ("What is the diluted earnings per share for 2024?", False),
+    ("What was the gross margin percentage?", False),
+    ("What are the risks related to supply chain?", False),
+    ("How did advertising revenue change?", False),
+    ("What is the total long-term debt?", False),
+    ("What legal proceedings are disclosed?", False),
+]
+
+def _latency_stats(latencies):
+    values = np.asarray(latencies) * 1e6
+    return {"p50_us": float(np.percentile(values, 50)), "p99_us": float(np.percentile(values, 99))}
+
+def run_report(with_llm=False):
+    classifier = DefinitionQueryClassifier(get_embeddings())
+    classifier.classify("warm up")
+
+    decided = correct = 0
+    by_method = {}
+    latencies = {"rules": [], "embedding": [], "llm": []}
+    misses = []
+    for query, expected in LABELED_QUERIES:
+        start = time.perf_counter()
+        label, method = classifier.classify(query)
+        latencies[method].append(time.perf_counter() - start)
+        by_method[method] = by_method.get(method, 0) + 1
+        if label is not None:
+            decided += 1
+            correct += label == expected
+            if label != expected:
+                misses.append(query)
+
+    report = {
+        "queries": len(LABELED_QUERIES),
+        "decided_locally": decided,
+        "coverage": decided / len(LABELED_QUERIES),
+        "local_accuracy": correct / decided if decided else None,
+        "by_method": by_method,
+        "latency": {method: _latency_stats(values) for method, values in latencies.items() if values},
+        "local_errors": misses,
+    }
+
+    if with_llm:
+        from app.components.agentic_rag import IsDefinitionResponse, _definition_prompt
+        llm = get_llm()
+        llm_correct = 0
+        llm_latencies = []
+        for query, expected in LABELED_QUERIES:
+            start = time.perf_counter()
+            response = llm.with_structured_output(IsDefinitionResponse).invoke(_definition_prompt(query))
+            llm_latencies.append(time.perf_counter() - start)
+            llm_correct += response.is_definition_query == expected
+        report["llm_accuracy"] = llm_correct / len(LABELED_QUERIES)
+        report["llm_latency"] = _latency_stats(llm_latencies)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--with-llm", action="store_true")
+    args = parser.parse_args()
+    print(json.dumps(run_report(with_llm=args.with_llm), indent=2))
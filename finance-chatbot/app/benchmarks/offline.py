@@ -0,0 +1,162 @@
+"""
+Component benchmarks that need no API keys or model downloads: a fake chat model
+and deterministic hash embeddings stand in for the real ones. For each bundled
+10-K it measures PDF loading, chunking, index build, cold and warm index load,
+retrieval latency and the overhead of the agentic pipeline around the LLM.
+Prints one JSON report; --compare adds the relative change against an earlier one.
+
+    python -m app.benchmarks.offline [--companies NASDAQ_AAPL_2024 ...] [--output run.json] [--compare baseline.json]
+"""
+import os
+
+# Set before app.config is imported; the benchmark must never reach a live service
+os.environ["LLM_MODEL"] = "fake"
+os.environ["EMBEDDING_BACKEND"] = "hash"
+os.environ["TAVILY_BACKEND"] = "stub"
+os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import time
+
+import numpy as np
+
+from app.benchmarks.ann_index import SAMPLE_QUERIES
+from app.components.agentic_rag import agentic_rag_pipeline
+from app.components.create_index import list_companies
+from app.components.pdf_loader import load_pdf_files, create_text_chunks
+from app.components.retriever import get_retriever
+from app.components.vector_db import create_vector_db, load_vector_db, get_db_path
+from app.components.vector_db_cache import vector_db_cache
+from app.config.config import DATA_PATH, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_BATCH_SIZE, NUM_OF_DOCS_TO_RETRIEVE
+from app.config.config import FAISS_INDEX_TYPE, RETRIEVAL_MODE, HASH_EMBEDDING_DIM, FAKE_LLM_LATENCY_SECONDS
+
+def _latency_stats(latencies):
+    values = np.asarray(latencies) * 1e3
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+    }
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_company(company, rounds):
+    index_name = f"_bench_{company}"
+    pdf_mb = os.path.getsize(os.path.join(DATA_PATH, f"{company}.pdf")) / 2**20
+    result = {}
+
+    pages, seconds = _timed(load_pdf_files, company)
+    result["load_pdf_files"] = {
+        "seconds": seconds, "pages": len(pages),
+        "pages_per_second": len(pages) / seconds, "mb_per_second": pdf_mb / seconds
+    }
+
+    chunks, seconds = _timed(create_text_chunks, pages)
+    result["create_text_chunks"] = {
+        "seconds": seconds, "chunks": len(chunks), "chunks_per_second": len(chunks) / seconds
+    }
+
+    try:
+        _, seconds = _timed(create_vector_db, chunks, index_name)
+        result["create_vector_db"] = {"seconds": seconds, "chunks_per_second": len(chunks) / seconds}
+
+        _, seconds = _timed(load_vector_db, index_name)
+        vector_db_cache.invalidate(index_name)
+        _, cache_miss_seconds = _timed(vector_db_cache.get, index_name)
+        db, cache_hit_seconds = _timed(vector_db_cache.get, index_name)
+        result["load_vector_db"] = {
+            "cold_seconds": seconds,
+            "cache_miss_seconds": cache_miss_seconds,
+            "warm_seconds": cache_hit_seconds,
+        }
+
+        retriever = get_retriever(db, NUM_OF_DOCS_TO_RETRIEVE)
+        retriever.invoke(SAMPLE_QUERIES[0])
+        latencies = []
+        for _ in range(rounds):
+            for query in SAMPLE_QUERIES:
+                latencies.append(_timed(retriever.invoke, query)[1])
+        result["retrieval"] = {"queries": len(latencies), **_latency_stats(latencies)}
+
+        # Each question once: repeats would be served by the answer cache
+        latencies = [_timed(agentic_rag_pipeline, query, file_name=index_name)[1] for query in SAMPLE_QUERIES]
+        result["agentic_rag_pipeline"] = {
+            "queries": len(latencies),
+            "llm_latency_seconds": FAKE_LLM_LATENCY_SECONDS,
+            **_latency_stats(latencies)
+        }
+    finally:
+        vector_db_cache.invalidate(index_name)
+        shutil.rmtree(get_db_path(index_name), ignore_errors=True)
+    return result
+
+def _flatten(report, prefix=""):
+    values = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            values.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+def compare(baseline, current):
+    """Relative change of every metric present in both reports' results."""
+    old, new = _flatten(baseline["results"]), _flatten(current["results"])
+    return {
+        key: {"baseline": old[key], "current": new[key], "change": (new[key] - old[key]) / old[key]}
+        for key in sorted(old.keys() & new.keys())
+        if old[key]
+    }
+
+def run_benchmarks(companies, rounds=5):
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {
+                "chunk_size": CHUNK_SIZE,
+                "chunk_overlap": CHUNK_OVERLAP,
+                "embedding_batch_size": EMBEDDING_BATCH_SIZE,
+                "embedding_dim": HASH_EMBEDDING_DIM,
+                "faiss_index_type": FAISS_INDEX_TYPE,
+                "retrieval_mode": RETRIEVAL_MODE,
+                "k": NUM_OF_DOCS_TO_RETRIEVE,
+            },
+        },
+        "results": {company: bench_company(company, rounds) for company in companies},
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", nargs="*", help="defaults to every PDF in data/")
+    parser.add_argument("--rounds", type=int, default=5, help="passes over the sample queries for retrieval latency")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.companies or list_companies(), rounds=args.rounds)
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(json.load(f), report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
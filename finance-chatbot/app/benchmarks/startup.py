@@ -0,0 +1,94 @@
+"""
+Startup cost of a server process: time and memory to import the app (what
+gunicorn boot and CLI entry points pay now that models load lazily), to warm it
+up (what importing used to cost when the models loaded at import), and the
+memory a forked worker adds on top of a preloaded master (gunicorn --preload).
+Each measurement runs in a fresh interpreter.
+
+    python -m app.benchmarks.startup [--module app.main_agent] [--with-llm]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+def _memory_mb():
+    """Rss, and on Linux the part of it private to this process."""
+    memory = {}
+    if os.path.exists("/proc/self/smaps_rollup"):
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    memory[key] = int(value.split()[0]) / 1024
+        return {
+            "rss_mb": memory["Rss"],
+            "pss_mb": memory["Pss"],
+            "private_mb": memory["Private_Clean"] + memory["Private_Dirty"],
+        }
+    return {"rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+def _measure(module, with_llm):
+    start = time.perf_counter()
+    __import__(module)
+    report = {"import": {"seconds": time.perf_counter() - start, **_memory_mb()}}
+
+    from app.components.resources import warmup
+    start = time.perf_counter()
+    warmup(llm=with_llm)
+    report["import_and_warmup"] = {
+        "seconds": report["import"]["seconds"] + time.perf_counter() - start,
+        **_memory_mb()
+    }
+    return report
+
+def _measure_fork(module, with_llm):
+    """A preloaded master as gunicorn.conf.py sets it up, then one forked worker."""
+    __import__(module)
+    from app.components.resources import warmup
+    warmup(llm=False, probe=False)
+    report = {"master": _memory_mb()}
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        start = time.perf_counter()
+        warmup(llm=with_llm)
+        worker = {"warmup_seconds": time.perf_counter() - start, **_memory_mb()}
+        os.write(write_fd, json.dumps(worker).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        report["worker"] = json.loads(f.read())
+    os.waitpid(pid, 0)
+    return report
+
+def _run_child(mode, module, with_llm):
+    command = [sys.executable, "-m", "app.benchmarks.startup", "--child", mode, "--module", module]
+    if with_llm:
+        command.append("--with-llm")
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def run_report(module, with_llm=False):
+    report = {"module": module, **_run_child("measure", module, with_llm)}
+    if hasattr(os, "fork"):
+        report["preload_fork"] = _run_child("fork", module, with_llm)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main_agent")
+    parser.add_argument("--with-llm", action="store_true", help="also create the LLM client (needs API keys)")
+    parser.add_argument("--child", choices=["measure", "fork"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child == "measure":
+        print(json.dumps(_measure(args.module, args.with_llm)))
+    elif args.child == "fork":
+        print(json.dumps(_measure_fork(args.module, args.with_llm)))
+    else:
+        print(json.dumps(run_report(args.module, with_llm=args.with_llm), indent=2))
@@ -0,0 +1,94 @@
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+from app.common.tracing import registry
+from app.config.config import LLM_CONCURRENCY, SEARCH_CONCURRENCY, EMBEDDING_CONCURRENCY
+from app.config.config import MAX_QUEUED_CALLS, QUEUE_TIMEOUT_SECONDS
+
+
+class CapacityExceeded(Exception):
+    """Raised when a call can't get a slot; status_code is what the server should return."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class AsyncLimiter:
+    """
+    Caps how many calls of one kind (LLM, search, embedding) run at once. Calls
+    beyond the cap wait in a bounded queue; a full queue is rejected straight away
+    (429) and a call that waits longer than the timeout is rejected (503).
+    """
+
+    def __init__(self, name, limit, max_queued=MAX_QUEUED_CALLS, timeout=QUEUE_TIMEOUT_SECONDS):
+        self.name = name
+        self.limit = limit
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.waiting = 0
+        self.in_flight = 0
+        self.rejected = 0
+        # asyncio semaphores belong to one loop, and the ASGI server and the
+        # background loop used by the sync apps are different loops
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        return semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        semaphore = self._semaphore()
+        if semaphore.locked() and self.waiting >= self.max_queued:
+            self.rejected += 1
+            raise CapacityExceeded(f"Too many queued {self.name} calls", status_code=429)
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise CapacityExceeded(f"Timed out waiting for a {self.name} slot", status_code=503)
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+llm_limiter = AsyncLimiter("llm", LLM_CONCURRENCY)
+search_limiter = AsyncLimiter("search", SEARCH_CONCURRENCY)
+embedding_limiter = AsyncLimiter("embedding", EMBEDDING_CONCURRENCY)
+
+def limiter_stats():
+    return {limiter.name: limiter.stats() for limiter in (llm_limiter, search_limiter, embedding_limiter)}
+
+def _limiter_metrics():
+    stats = limiter_stats()
+    return [
+        (metric, kind, help_text, [({"limiter": name}, values[key]) for name, values in stats.items()])
+        for metric, kind, key, help_text in (
+            ("finchat_limiter_in_flight", "gauge", "in_flight", "Calls holding a limiter slot"),
+            ("finchat_limiter_waiting", "gauge", "waiting", "Calls queued for a limiter slot"),
+            ("finchat_limiter_rejected_total", "counter", "rejected", "Calls rejected with 429/503"),
+        )
+    ]
+
+registry.add_collector(_limiter_metrics)
@@ -0,0 +1,39 @@
+import asyncio
+import contextvars
+import os
+import threading
+
+# One long-lived event loop per process for running async pipelines from sync code.
+# A fresh loop per call (asyncio.run) would strand the async HTTP clients that the
+# LLM objects keep between calls on a closed loop.
+_loop = None
+_lock = threading.Lock()
+
+def get_event_loop():
+    global _loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-pipeline-loop", daemon=True).start()
+        return _loop
+
+def _after_fork_in_child():
+    # The loop's thread doesn't exist in a forked child; start a new loop on first use
+    global _loop, _lock
+    _loop = None
+    _lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+async def _in_context(coro, context):
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+def run_coroutine(coro):
+    """
+    Runs coro on the shared background loop and blocks until it finishes. The
+    caller's context variables (e.g. the request trace) are visible to coro.
+    """
+    context = contextvars.copy_context()
+    return asyncio.run_coroutine_threadsafe(_in_context(coro, context), get_event_loop()).result()
@@ -0,0 +1,17 @@
+import json
+
+def sse_event(event, data):
+    """Formats one Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def format_sources(source_documents, max_chars):
+    sources = []
+    for i, doc in enumerate(source_documents, 1):
+        sources.append({
+            "number": i,
+            "content": doc.page_content[:max_chars] + "..." if len(doc.page_content) > max_chars else doc.page_content,
+            "metadata": {
+                "page": doc.metadata.get("page")
+            }
+        })
+    return sources
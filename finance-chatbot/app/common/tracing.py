@@ -0,0 +1,318 @@
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import nullcontext
+
+from app.common.logger import get_logger
+from app.config.config import TRACING_ENABLED, TRACE_LOG_THRESHOLD_SECONDS
+
+logger = get_logger(__name__)
+
+# Spans time the stages of a request (classifier, search, rewrite, retrieval,
+# generation, index loads...) into a latency histogram, and a trace collects the
+# spans of one request so a slow one can be logged stage by stage. Metrics are kept
+# per process and rendered in the Prometheus text format for /metrics.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # per-bucket counts, then sum and count
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, counts in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", labels + (("le", bound),), cumulative))
+                samples.append((f"{self.name}_bucket", labels + (("le", "+Inf"),), counts[-1]))
+                samples.append((f"{self.name}_sum", labels, counts[-2]))
+                samples.append((f"{self.name}_count", labels, counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Holds this process's metrics. Collectors are called at render time for values
+    other components already keep, such as cache hit counts.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name, help_text):
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def add_collector(self, collector):
+        """collector() returns [(name, kind, help, [(labels dict, value), ...]), ...]."""
+        self._collectors.append(collector)
+
+    def render(self):
+        families = {}
+        for metric in self._metrics:
+            families[metric.name] = [metric.kind, metric.help_text, metric.samples()]
+        for collector in self._collectors:
+            try:
+                collected = collector()
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help_text, values in collected:
+                family = families.setdefault(name, [kind, help_text, []])
+                family[2].extend((name, tuple(sorted(labels.items())), value) for labels, value in values)
+
+        lines = []
+        for name, (kind, help_text, samples) in families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{sample}{_format_labels(labels)} {value}" for sample, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+span_seconds = registry.histogram("finchat_span_seconds", "Time spent in each traced stage")
+request_seconds = registry.histogram("finchat_http_request_seconds", "HTTP request latency by endpoint")
+requests_total = registry.counter("finchat_http_requests_total", "HTTP requests by endpoint and status")
+requests_in_flight = registry.gauge("finchat_http_requests_in_flight", "HTTP requests being served")
+llm_calls = registry.counter("finchat_llm_calls_total", "LLM calls")
+llm_tokens = registry.counter("finchat_llm_tokens_total", "LLM tokens by type (prompt, completion)")
+
+def cache_metrics(cache, stats):
+    """Collector output for a cache whose stats() has hits and misses."""
+    lookups = stats["hits"] + stats["misses"]
+    return [
+        ("finchat_cache_hits_total", "counter", "Cache hits", [({"cache": cache}, stats["hits"])]),
+        ("finchat_cache_misses_total", "counter", "Cache misses", [({"cache": cache}, stats["misses"])]),
+        ("finchat_cache_hit_ratio", "gauge", "Cache hits / lookups",
+         [({"cache": cache}, stats["hits"] / lookups if lookups else 0.0)]),
+    ]
+
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record_span(self.name, time.perf_counter() - self.start)
+        return False
+
+def _record_span(name, duration):
+    span_seconds.observe(duration, span=name)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((name, duration))
+
+
+_NOOP_SPAN = nullcontext()
+
+def span(name):
+    """Times a block as stage name. A shared no-op when tracing is disabled."""
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    return _Span(name)
+
+def traced(name):
+    """Decorator form of span; leaves the function untouched when tracing is disabled."""
+    def decorator(fn):
+        if not TRACING_ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with _Span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def traced_iter(name, iterable):
+    """
+    Yields from iterable and records the time spent producing its items, not the
+    consumer's time in between, as one stage once iteration ends. For lazy
+    generators, whose factory returns before any work is done.
+    """
+    if not TRACING_ENABLED:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        if hasattr(iterator, "close"):
+            iterator.close()
+        _record_span(name, elapsed)
+
+def start_trace():
+    """Starts collecting spans for the current request; pass the result to end_trace."""
+    if not TRACING_ENABLED:
+        return None
+    return _trace.set([]), time.perf_counter()
+
+def end_trace(name, started):
+    """Stops the trace and logs its stages if the request was slow. Returns its duration."""
+    if started is None:
+        return None
+    token, start = started
+    total = time.perf_counter() - start
+    spans = _trace.get()
+    try:
+        _trace.reset(token)
+    except ValueError:
+        # Ended from another context than it started in, e.g. after a streamed response
+        _trace.set(None)
+    if spans and total >= TRACE_LOG_THRESHOLD_SECONDS:
+        stages = ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in spans)
+        logger.info(f"Trace {name}: {total:.3f}s | {stages}")
+    return total
+
+def instrument_flask_app(app):
+    """Adds request tracing, in-flight and latency metrics, and a /metrics route."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_request_trace():
+        g.trace = start_trace()
+        requests_in_flight.inc()
+
+    @app.after_request
+    def _record_status(response):
+        g.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _end_request_trace(exc):
+        if "trace" not in g:
+            return
+        requests_in_flight.dec()
+        endpoint = request.endpoint or "unknown"
+        requests_total.inc(endpoint=endpoint, status=g.get("status", 500))
+        total = end_trace(f"{request.method} {request.path}", g.trace)
+        if total is not None:
+            request_seconds.observe(total, endpoint=endpoint)
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+class TracingMiddleware:
+    """ASGI counterpart of instrument_flask_app; the app serves /metrics itself."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        trace = start_trace()
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            requests_in_flight.dec()
+            # The router stores the matched endpoint in the scope
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unknown")
+            requests_total.inc(endpoint=endpoint, status=status)
+            total = end_trace(f"{scope['method']} {scope['path']}", trace)
+            if total is not None:
+                request_seconds.observe(total, endpoint=endpoint)
@@ -1,62 +1,109 @@
-from app.components.retriever import build_qa_chain
+import asyncio
+import re
+import time
+
+from app.components.retriever import build_qa_chain, stream_qa_answer, astream_qa_answer
 from app.components.tavily_search import tavily_lookup
+from app.components.answer_cache import answer_cache
+from app.components.fact_answers import answer_from_facts
+from app.components.query_classifier import DefinitionQueryClassifier
+from app.components.sections import cache_namespace
+from app.components.resources import get_resource, get_embeddings, get_llm
 from app.common.logger import get_logger
-from app.components.llm_setup import initialize_llm
+from app.common.event_loop import run_coroutine
+from app.common.tracing import span
+from app.common.concurrency import CapacityExceeded, llm_limiter, search_limiter, embedding_limiter
+from app.config.config import AGENTIC_CONCURRENT, AGENTIC_SPECULATION_THRESHOLD, LOCAL_CLASSIFIER_ENABLED
 
 logger = get_logger(__name__)
-llm = initialize_llm()
 from pydantic import BaseModel, Field
 
 
 class IsDefinitionResponse(BaseModel):
     is_definition_query: bool = Field(..., description="Is the query a request for a definition of a financial term or concept?")
 
-def is_definition_query(user_query):
-    prompt = (
+def _definition_prompt(user_query):
+    return (
         f"User query: {user_query}\n"
         "Is this a request for a definition of a financial term or concept? "
         "Answer True or False."
     )
-    response = llm.with_structured_output(IsDefinitionResponse).invoke(prompt)
+
+def get_query_classifier():
+    return get_resource("query_classifier", lambda: DefinitionQueryClassifier(get_embeddings()))
+
+def _classify_locally(user_query):
+    if not LOCAL_CLASSIFIER_ENABLED:
+        return None
+    label, method = get_query_classifier().classify(user_query)
+    if label is not None:
+        logger.info(f"Is definition query: {label} (local {method})")
+    return label
+
+def is_definition_query(user_query):
+    label = _classify_locally(user_query)
+    if label is not None:
+        return label
+    response = get_llm().with_structured_output(IsDefinitionResponse).invoke(_definition_prompt(user_query))
+    logger.info(f"Is definition query: {response.is_definition_query}")
+    return response.is_definition_query
+
+async def ais_definition_query(user_query):
+    async with embedding_limiter.slot():
+        label = await asyncio.to_thread(_classify_locally, user_query)
+    if label is not None:
+        return label
+    async with llm_limiter.slot():
+        response = await get_llm().with_structured_output(IsDefinitionResponse).ainvoke(_definition_prompt(user_query))
     logger.info(f"Is definition query: {response.is_definition_query}")
     return response.is_definition_query
 
+def _rewrite_prompt(query, history, definition):
+    return (
+        f"Definition based on web search: {definition}\n"
+        f"Conversation so far:\n{history}\n"
+        f"Original Question: {query}\n"
+        "Rewrite the original question as a clear, concise, natural-language query suitable for searching a financial report.\n"
+        "\n"
+        "### Guidelines:\n"
+        "- Use standard financial definitions for all terms (e.g., use 'net income' for 'earnings', 'revenue' for 'sales', etc.).\n"
+        "- Only use information from the conversation history if the original question refers to previous discussion. \n"
+        "- If the original question is clear and self-contained, ignore the conversation history and rewrite based only on the current question.\n"
+        "- Do NOT use or substitute values or components from previous questions or answers unless the user explicitly refers to them.\n"
+        "- Only include financial components that are explicitly mentioned or required by the original question.\n"
+        "- If the question requires a calculation (e.g., a financial ratio), rewrite it to explicitly request the necessary input values and the final result, using standard definitions.\n"
+        "- Briefly describe the calculation logic in plain English (e.g., 'net income divided by number of shares'), but do NOT provide step-by-step instructions or formulas.\n"
+        "- Do NOT ask the user to provide any values or make assumptions.\n"
+        "- Refer only to actual company data as reported—no examples or hypotheticals.\n"
+        "- Format the rewritten query as a single, well-formed question that could be answered using a financial document.\n"
+    )
+
+def _rewritten_content(response):
+    # Validate response
+    if not response or not hasattr(response, 'content'):
+        logger.error("Invalid response from llm in rewrite_query")
+        return None
+        
+    content = response.content
+    if not isinstance(content, str):
+        content = str(content)
+        logger.warning(f"Content was not a string, converted to: {content}")
+    
+    logger.info(f"Rewritten query: {content}")
+    return content
+
 def rewrite_query(query, history, definition):
     try:
-        prompt = (
-            f"Definition based on web search: {definition}\n"
-            f"Conversation so far:\n{history}\n"
-            f"Original Question: {query}\n"
-            "Rewrite the original question as a clear, concise, natural-language query suitable for searching a financial report.\n"
-            "\n"
-            "### Guidelines:\n"
-            "- Use standard financial definitions for all terms (e.g., use 'net income' for 'earnings', 'revenue' for 'sales', etc.).\n"
-            "- Only use information from the conversation history if the original question refers to previous discussion. \n"
-            "- If the original question is clear and self-contained, ignore the conversation history and rewrite based only on the current question.\n"
-            "- Do NOT use or substitute values or components from previous questions or answers unless the user explicitly refers to them.\n"
-            "- Only include financial components that are explicitly mentioned or required by the original question.\n"
-            "- If the question requires a calculation (e.g., a financial ratio), rewrite it to explicitly request the necessary input values and the final result, using standard definitions.\n"
-            "- Briefly describe the calculation logic in plain English (e.g., 'net income divided by number of shares'), but do NOT provide step-by-step instructions or formulas.\n"
-            "- Do NOT ask the user to provide any values or make assumptions.\n"
-            "- Refer only to actual company data as reported—no examples or hypotheticals.\n"
-            "- Format the rewritten query as a single, well-formed question that could be answered using a financial document.\n"
-        )
+        response = get_llm().invoke(_rewrite_prompt(query, history, definition))
+        return _rewritten_content(response)
+    except Exception as e:
+        logger.error(f"Error rewriting query: {e}")
+        return None
 
-        response = llm.invoke(prompt)
-        
-        # Validate response
-        if not response or not hasattr(response, 'content'):
-            logger.error("Invalid response from llm in rewrite_query")
-            return None
-            
-        content = response.content
-        if not isinstance(content, str):
-            content = str(content)
-            logger.warning(f"Content was not a string, converted to: {content}")
-        
-        logger.info(f"Rewritten query: {content}")
-        return content
-        
+async def arewrite_query(query, history, definition):
+    try:
+        response = await get_llm().ainvoke(_rewrite_prompt(query, history, definition))
+        return _rewritten_content(response)
     except Exception as e:
         logger.error(f"Error rewriting query: {e}")
         return None
@@ -69,26 +116,56 @@ def format_history(history):
         f"{m["role"]} : {m['content']}" for m in history
     )
 
-def agentic_rag_pipeline(user_query, file_name, history=None):
+def agentic_rag_pipeline(user_query, file_name, history=None, sections=None):
+    if AGENTIC_CONCURRENT:
+        return run_coroutine(agentic_rag_pipeline_async(user_query, file_name, history=history, sections=sections))
+    definition = ''
+    namespace = cache_namespace("agent", sections)
     try:
-        if is_definition_query(user_query):
+        # Lookups and ratios of statement line items need no retrieval or LLM call
+        fact_answer = answer_from_facts(file_name, user_query)
+        if fact_answer is not None:
+            return {**fact_answer, "tool_response": ""}
+
+        # A question with no history is self-contained and can be answered from the
+        # cache before any LLM call. Otherwise it only becomes self-contained after
+        # rewrite_query, so the rewritten query is the cache key.
+        cache_query = user_query if not history else None
+        if cache_query:
+            cached = answer_cache.lookup(file_name, cache_query, namespace=namespace)
+            if cached is not None:
+                return cached
+
+        with span("is_definition_query"):
+            needs_search = is_definition_query(user_query)
+        if needs_search:
             logger.info("Search Needed")
-            definition = tavily_lookup(user_query)
+            with span("tavily_lookup"):
+                definition = tavily_lookup(user_query)
         else:
             logger.info("Search Not Needed")
             definition = ''
         formatted_history = format_history(history)
-        retrieval_query = rewrite_query(user_query, formatted_history, definition)
-        qa_chain = build_qa_chain(file_name=file_name)
+        with span("rewrite_query"):
+            retrieval_query = rewrite_query(user_query, formatted_history, definition)
+        if not cache_query and retrieval_query:
+            cache_query = retrieval_query
+            cached = answer_cache.lookup(file_name, cache_query, namespace=namespace)
+            if cached is not None:
+                return cached
+
+        qa_chain = build_qa_chain(file_name=file_name, sections=sections)
         formatted_query = (
             "### Rewritten query based on history:\n"
             f"{retrieval_query}\n"
             f"Original Question: {user_query}"
         )
         logger.info(f"Formatted Query: {formatted_query}")
-        response = qa_chain.invoke({
-            "query": formatted_query
-        })
+        # Retrieval and generation in one chain call; the retriever's own spans split it
+        with span("qa_chain"):
+            response = qa_chain.invoke({
+                "query": formatted_query
+            })
         if not response or not isinstance(response, dict):
             logger.error("Invalid response from qa_chain")
             return {"response": "Sorry, I encountered an error processing your request.", 
@@ -98,9 +175,12 @@ def agentic_rag_pipeline(user_query, file_name, history=None):
         if not isinstance(result, str):
             result = str(result)
             logger.warning(f"Result was not a string, converted to: {result}")
-        return {"response": result, 
+        answer = {"response": result, 
         "tool_response": definition,
         "sources": response.get("source_documents", [])}
+        if cache_query:
+            answer_cache.store(file_name, cache_query, answer, namespace=namespace)
+        return answer
         
     except Exception as e:
         logger.error(f"Error in agentic_rag_pipeline: {e}")
@@ -108,6 +188,253 @@ def agentic_rag_pipeline(user_query, file_name, history=None):
         "tool_response": definition,
         "sources": []}
 
+def _token_similarity(a, b):
+    a_tokens = set(re.findall(r"\w+", a.lower()))
+    b_tokens = set(re.findall(r"\w+", b.lower()))
+    if not a_tokens or not b_tokens:
+        return 0.0
+    return len(a_tokens & b_tokens) / len(a_tokens | b_tokens)
+
+async def _aretrieve(retriever, query):
+    async with embedding_limiter.slot():
+        return await retriever.ainvoke(query)
+
+async def _acached_answer(file_name, query, namespace="agent"):
+    async with embedding_limiter.slot():
+        return await asyncio.to_thread(answer_cache.lookup, file_name, query, namespace)
+
+async def agentic_rag_pipeline_async(user_query, file_name, history=None, sections=None):
+    """
+    Same answers as the sequential pipeline, but the definition classifier and a
+    speculative retrieval on the raw query start together. Tavily starts as soon as
+    the classifier asks for it, and the speculative documents are reused when the
+    rewritten query barely differs from the raw one. Per-stage timings are returned
+    under "timings".
+
+    Blocking work runs in threads and every LLM, search and embedding call takes a
+    slot from its limiter; CapacityExceeded is raised for the server to turn into
+    a 429/503 instead of an answer.
+    """
+    definition = ''
+    namespace = cache_namespace("agent", sections)
+    timings = {}
+    pipeline_start = time.perf_counter()
+
+    async def timed(stage, awaitable):
+        start = time.perf_counter()
+        try:
+            with span(stage):
+                return await awaitable
+        finally:
+            timings[stage] = time.perf_counter() - start
+
+    speculative_task = None
+    try:
+        fact_answer = await asyncio.to_thread(answer_from_facts, file_name, user_query)
+        if fact_answer is not None:
+            return {**fact_answer, "tool_response": ""}
+
+        cache_query = user_query if not history else None
+        if cache_query:
+            cached = await _acached_answer(file_name, cache_query, namespace)
+            if cached is not None:
+                return cached
+
+        qa_chain = await asyncio.to_thread(build_qa_chain, file_name=file_name, sections=sections)
+        classify_task = asyncio.create_task(timed("is_definition_query", ais_definition_query(user_query)))
+        speculative_task = asyncio.create_task(timed("speculative_retrieval", _aretrieve(qa_chain.retriever, user_query)))
+
+        if await classify_task:
+            logger.info("Search Needed")
+            async with search_limiter.slot():
+                definition = await timed("tavily_lookup", asyncio.to_thread(tavily_lookup, user_query))
+        else:
+            logger.info("Search Not Needed")
+
+        formatted_history = format_history(history)
+        async with llm_limiter.slot():
+            retrieval_query = await timed("rewrite_query", arewrite_query(user_query, formatted_history, definition))
+        if not cache_query and retrieval_query:
+            cache_query = retrieval_query
+            cached = await _acached_answer(file_name, cache_query, namespace)
+            if cached is not None:
+                speculative_task.cancel()
+                return cached
+
+        formatted_query = (
+            "### Rewritten query based on history:\n"
+            f"{retrieval_query}\n"
+            f"Original Question: {user_query}"
+        )
+        logger.info(f"Formatted Query: {formatted_query}")
+        if retrieval_query and _token_similarity(retrieval_query, user_query) >= AGENTIC_SPECULATION_THRESHOLD:
+            logger.info("Reusing speculative retrieval")
+            source_documents = await speculative_task
+        else:
+            speculative_task.cancel()
+            source_documents = await timed("retrieval", _aretrieve(qa_chain.retriever, formatted_query))
+
+        async with llm_limiter.slot():
+            response = await timed("generation", qa_chain.combine_documents_chain.ainvoke({
+                "input_documents": source_documents,
+                "question": formatted_query
+            }))
+        result = response.get("output_text", "No response")
+        if not isinstance(result, str):
+            result = str(result)
+            logger.warning(f"Result was not a string, converted to: {result}")
+
+        timings["total"] = time.perf_counter() - pipeline_start
+        timings["saved"] = max(0.0, sum(v for k, v in timings.items() if k != "total") - timings["total"])
+        logger.info(f"Agentic pipeline timings: {timings}")
+        answer = {"response": result,
+        "tool_response": definition,
+        "sources": source_documents}
+        if cache_query:
+            await asyncio.to_thread(answer_cache.store, file_name, cache_query, answer, namespace)
+        return {**answer, "timings": timings}
+
+    except CapacityExceeded:
+        if speculative_task is not None:
+            speculative_task.cancel()
+        raise
+    except Exception as e:
+        logger.error(f"Error in agentic_rag_pipeline_async: {e}")
+        if speculative_task is not None:
+            speculative_task.cancel()
+        return {"response": "Sorry, I encountered an error processing your request.",
+        "tool_response": definition,
+        "sources": []}
+
+def agentic_rag_stream(user_query, file_name, history=None, sections=None):
+    """
+    Streaming form of agentic_rag_pipeline. Yields ("sources", documents) once
+    retrieval finishes, ("token", text) as the answer is generated and finally
+    ("done", {"response", "tool_response"}).
+    """
+    namespace = cache_namespace("agent", sections)
+    fact_answer = answer_from_facts(file_name, user_query)
+    if fact_answer is not None:
+        yield "sources", fact_answer["sources"]
+        yield "token", fact_answer["response"]
+        yield "done", {"response": fact_answer["response"], "tool_response": ""}
+        return
+
+    cache_query = user_query if not history else None
+    if cache_query:
+        cached = answer_cache.lookup(file_name, cache_query, namespace=namespace)
+        if cached is not None:
+            yield "sources", cached["sources"]
+            yield "token", cached["response"]
+            yield "done", {"response": cached["response"], "tool_response": cached["tool_response"]}
+            return
+
+    definition = ''
+    with span("is_definition_query"):
+        needs_search = is_definition_query(user_query)
+    if needs_search:
+        logger.info("Search Needed")
+        with span("tavily_lookup"):
+            definition = tavily_lookup(user_query)
+    else:
+        logger.info("Search Not Needed")
+    with span("rewrite_query"):
+        retrieval_query = rewrite_query(user_query, format_history(history), definition)
+    if not cache_query and retrieval_query:
+        cache_query = retrieval_query
+
+    formatted_query = (
+        "### Rewritten query based on history:\n"
+        f"{retrieval_query}\n"
+        f"Original Question: {user_query}"
+    )
+    logger.info(f"Formatted Query: {formatted_query}")
+    qa_chain = build_qa_chain(file_name=file_name, sections=sections)
+    with span("retrieval"):
+        source_documents = qa_chain.retriever.invoke(formatted_query)
+    yield "sources", source_documents
+
+    tokens = []
+    # Includes the time the client takes to read each token
+    with span("generation"):
+        for text in stream_qa_answer(formatted_query, source_documents):
+            tokens.append(text)
+            yield "token", text
+
+    answer = {"response": "".join(tokens),
+    "tool_response": definition,
+    "sources": source_documents}
+    if cache_query:
+        answer_cache.store(file_name, cache_query, answer, namespace=namespace)
+    yield "done", {"response": answer["response"], "tool_response": definition}
+
+async def agentic_rag_astream(user_query, file_name, history=None, sections=None):
+    """
+    Async form of agentic_rag_stream for the ASGI app, with the same events. Every
+    LLM, search and embedding call takes a slot from its limiter, and the slot for
+    generating the answer is taken before the first event, so CapacityExceeded is
+    raised before anything has been streamed.
+    """
+    namespace = cache_namespace("agent", sections)
+    fact_answer = await asyncio.to_thread(answer_from_facts, file_name, user_query)
+    if fact_answer is not None:
+        yield "sources", fact_answer["sources"]
+        yield "token", fact_answer["response"]
+        yield "done", {"response": fact_answer["response"], "tool_response": ""}
+        return
+
+    cache_query = user_query if not history else None
+    if cache_query:
+        cached = await _acached_answer(file_name, cache_query, namespace)
+        if cached is not None:
+            yield "sources", cached["sources"]
+            yield "token", cached["response"]
+            yield "done", {"response": cached["response"], "tool_response": cached["tool_response"]}
+            return
+
+    definition = ''
+    with span("is_definition_query"):
+        needs_search = await ais_definition_query(user_query)
+    if needs_search:
+        logger.info("Search Needed")
+        async with search_limiter.slot():
+            with span("tavily_lookup"):
+                definition = await asyncio.to_thread(tavily_lookup, user_query)
+    else:
+        logger.info("Search Not Needed")
+    async with llm_limiter.slot():
+        with span("rewrite_query"):
+            retrieval_query = await arewrite_query(user_query, format_history(history), definition)
+    if not cache_query and retrieval_query:
+        cache_query = retrieval_query
+
+    formatted_query = (
+        "### Rewritten query based on history:\n"
+        f"{retrieval_query}\n"
+        f"Original Question: {user_query}"
+    )
+    logger.info(f"Formatted Query: {formatted_query}")
+    qa_chain = await asyncio.to_thread(build_qa_chain, file_name=file_name, sections=sections)
+    with span("retrieval"):
+        source_documents = await _aretrieve(qa_chain.retriever, formatted_query)
+
+    tokens = []
+    async with llm_limiter.slot():
+        yield "sources", source_documents
+        # Includes the time the client takes to read each token
+        with span("generation"):
+            async for text in astream_qa_answer(formatted_query, source_documents):
+                tokens.append(text)
+                yield "token", text
+
+    answer = {"response": "".join(tokens),
+    "tool_response": definition,
+    "sources": source_documents}
+    if cache_query:
+        await asyncio.to_thread(answer_cache.store, file_name, cache_query, answer, namespace)
+    yield "done", {"response": answer["response"], "tool_response": definition}
+
+
 
 if __name__ == "__main__":
     from app.components.create_index import create_index
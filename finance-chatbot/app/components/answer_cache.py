@@ -0,0 +1,167 @@
+import re
+import threading
+import time
+
+import numpy as np
+
+from app.components.vector_db import get_index_version
+from app.components.resources import get_embeddings
+from app.common.logger import get_logger
+from app.common.tracing import registry, cache_metrics
+
+from app.config.config import ANSWER_CACHE_ENABLED, ANSWER_CACHE_SIMILARITY_THRESHOLD
+from app.config.config import ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES
+
+logger = get_logger(__name__)
+
+# Queries that differ only in a year, quarter or figure embed almost identically,
+# so a cached answer must also have been asked about the same periods and numbers
+_NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_SHORT_YEAR = re.compile(r"\b(?:fy|cy)\s?'?(\d{2})\b|(?<![\w'])'(\d{2})\b")
+_QUARTER = re.compile(r"\bq([1-4])\b|\b(first|second|third|fourth)\s+(?:fiscal\s+)?quarter\b")
+_HALF = re.compile(r"\bh([12])\b|\b(first|second)\s+half\b")
+_RELATIVE_PERIOD = re.compile(
+    r"\b(last|prior|previous|preceding|this|current|next|coming)\s+(?:fiscal\s+)?(year|quarter|month)\b"
+)
+_PERIOD_WORDS = {
+    "annual": "year", "annually": "year", "yearly": "year", "year": "year", "years": "year",
+    "quarter": "quarter", "quarterly": "quarter", "quarters": "quarter",
+    "month": "month", "monthly": "month", "months": "month", "ytd": "ytd",
+}
+_ORDINALS = {"first": "1", "second": "2", "third": "3", "fourth": "4"}
+_RELATIVE = {
+    "last": "prior", "prior": "prior", "previous": "prior", "preceding": "prior",
+    "this": "current", "current": "current", "next": "next", "coming": "next",
+}
+
+def period_tokens(query):
+    """The years, quarters, relative periods, period words and other numbers in query, normalized."""
+    query = query.lower().replace("year-to-date", "ytd").replace("year to date", "ytd")
+    tokens = set()
+    for match in _SHORT_YEAR.finditer(query):
+        tokens.add(f"20{match.group(1) or match.group(2)}")
+    query = _SHORT_YEAR.sub(" ", query)
+    for match in _QUARTER.finditer(query):
+        tokens.add(f"q{match.group(1) or _ORDINALS[match.group(2)]}")
+    query = _QUARTER.sub(" quarter ", query)
+    for match in _HALF.finditer(query):
+        tokens.add(f"h{match.group(1) or _ORDINALS[match.group(2)]}")
+    query = _HALF.sub(" ", query)
+    for match in _RELATIVE_PERIOD.finditer(query):
+        tokens.add(f"{_RELATIVE[match.group(1)]}_{match.group(2)}")
+    for match in _NUMBER.finditer(query):
+        number = match.group(0).replace(",", "")
+        tokens.add(number.rstrip("0").rstrip(".") if "." in number else number)
+    tokens.update(_PERIOD_WORDS[word] for word in re.findall(r"[a-z]+", query) if word in _PERIOD_WORDS)
+    return frozenset(tokens)
+
+
+class _CompanyAnswers:
+    def __init__(self, version):
+        self.version = version
+        self.vectors = []
+        self.periods = []
+        self.answers = []
+        self.created = []
+        self.last_used = []
+
+    def remove(self, i):
+        for values in (self.vectors, self.periods, self.answers, self.created, self.last_used):
+            del values[i]
+
+
+class SemanticAnswerCache:
+    """
+    Caches answers per company keyed by the query embedding, so rephrasings of a
+    question already answered ("revenue growth" / "how much did sales grow") are
+    served without retrieval or an LLM call. A hit also needs the same years,
+    quarters and numbers as the cached question, since "revenue in 2023" and
+    "revenue in 2024" are near neighbours. A company's answers are dropped as soon
+    as its index is rebuilt; entries also expire after a TTL and are evicted LRU.
+    """
+
+    def __init__(self, threshold, ttl_seconds, max_entries, embedding_model=None):
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._companies = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _embed(self, query):
+        # None means the process-wide model, resolved on first use rather than at import
+        embedding_model = self.embedding_model or get_embeddings()
+        vector = np.asarray(embedding_model.embed_query(query), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _answers_for(self, key, company):
+        """Returns the answers for key, starting afresh if the company's index changed."""
+        version = get_index_version(company)
+        answers = self._companies.get(key)
+        if answers is None or answers.version != version:
+            if answers is not None:
+                logger.info(f"Index for {company} was rebuilt, dropping {len(answers.answers)} cached answers")
+            answers = self._companies[key] = _CompanyAnswers(version)
+        return answers
+
+    def lookup(self, company, query, namespace="rag"):
+        if not ANSWER_CACHE_ENABLED:
+            return None
+        vector = self._embed(query)
+        periods = period_tokens(query)
+        now = time.time()
+        with self._lock:
+            answers = self._answers_for((namespace, company), company)
+            expired = [i for i, created in enumerate(answers.created) if now - created > self.ttl_seconds]
+            for i in reversed(expired):
+                answers.remove(i)
+
+            candidates = [i for i, entry_periods in enumerate(answers.periods) if entry_periods == periods]
+            if candidates:
+                similarities = np.stack([answers.vectors[i] for i in candidates]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    answers.last_used[candidates[best]] = now
+                    logger.info(f"Answer cache hit for {company} (similarity {similarities[best]:.3f})")
+                    return answers.answers[candidates[best]]
+            self.misses += 1
+            return None
+
+    def store(self, company, query, answer, namespace="rag"):
+        if not ANSWER_CACHE_ENABLED:
+            return
+        vector = self._embed(query)
+        now = time.time()
+        with self._lock:
+            answers = self._answers_for((namespace, company), company)
+            if len(answers.answers) >= self.max_entries:
+                answers.remove(int(np.argmin(answers.last_used)))
+                self.evictions += 1
+            answers.vectors.append(vector)
+            answers.periods.append(period_tokens(query))
+            answers.answers.append(answer)
+            answers.created.append(now)
+            answers.last_used.append(now)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": sum(len(answers.answers) for answers in self._companies.values()),
+            }
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES
+)
+registry.add_collector(lambda: cache_metrics("answer", answer_cache.stats()))
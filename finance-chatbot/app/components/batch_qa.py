@@ -0,0 +1,259 @@
+"""
+Answers a questions x companies matrix in one run, e.g. the standard quarterly
+review questions against every filing in data/:
+
+    python -m app.components.batch_qa --questions questions.txt [--companies NASDAQ_AAPL_2024 ...] [--output results.jsonl]
+
+--sections risk_factors,mda limits retrieval to those 10-K sections for every question.
+
+Results are written as JSON lines, in the order they complete.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from app.components.create_index import create_index, list_companies
+from app.components.retriever import get_prompt, retrieve_by_vector
+from app.components.fact_answers import answer_from_facts
+from app.components.sections import resolve_sections
+from app.components.vector_db_cache import vector_db_cache
+from app.components.resources import get_embeddings, get_llm
+from app.common.concurrency import llm_limiter, embedding_limiter
+from app.config.config import NUM_OF_DOCS_TO_RETRIEVE, BATCH_LLM_CONCURRENCY, BATCH_MAX_PAIRS
+
+from app.common.logger import get_logger
+from app.common.custom_exception import CustomException
+
+logger = get_logger(__name__)
+
+# Retrieved pairs waiting for an LLM call, per parallel call; retrieval pauses
+# beyond this so a large batch doesn't hold every pair's documents at once
+PENDING_PER_LLM_CALL = 2
+
+def validate_batch(questions, companies, sections=None):
+    """Returns an error message for a malformed batch request, or None."""
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+        return "questions must be a non-empty list of strings"
+    if not isinstance(companies, list) or not companies:
+        return "companies must be a non-empty list"
+    unknown = sorted(set(companies) - set(list_companies()))
+    if unknown:
+        return f"Unknown companies: {', '.join(map(str, unknown))}"
+    if len(questions) * len(companies) > BATCH_MAX_PAIRS:
+        return f"At most {BATCH_MAX_PAIRS} question x company pairs per batch"
+    if sections:
+        try:
+            resolve_sections(sections)
+        except ValueError as e:
+            return str(e)
+    return None
+
+def embed_queries(questions):
+    embedding_model = get_embeddings()
+    if hasattr(embedding_model, "embed_queries"):
+        return embedding_model.embed_queries(questions)
+    return embedding_model.embed_documents(questions)
+
+def _citations(docs):
+    return [
+        {"source": os.path.basename(doc.metadata.get("source", "")), "page": doc.metadata.get("page")}
+        for doc in docs
+    ]
+
+def _generate(chain, question, docs):
+    start = time.perf_counter()
+    context = "\n\n".join(doc.page_content for doc in docs)
+    response = chain.invoke({"context": context, "question": question})
+    answer = response.content if hasattr(response, "content") else str(response)
+    return answer, time.perf_counter() - start
+
+def _fact_result(company, question):
+    """The result for a question the fact index answers, or None."""
+    start = time.perf_counter()
+    fact_answer = answer_from_facts(company, question)
+    if fact_answer is None:
+        return None
+    return {
+        "company": company, "question": question, "answer": fact_answer["response"],
+        "sources": _citations(fact_answer["sources"]), "seconds": round(time.perf_counter() - start, 3)
+    }
+
+def _completed(futures, wait):
+    """Yields results for finished futures, or for all of them when wait is set."""
+    ready = as_completed(list(futures)) if wait else [future for future in list(futures) if future.done()]
+    for future in ready:
+        company, question, docs = futures.pop(future)
+        result = {"company": company, "question": question}
+        try:
+            answer, seconds = future.result()
+            result.update(answer=answer, sources=_citations(docs), seconds=round(seconds, 3))
+        except Exception as e:
+            error_message = CustomException(f"Failed to answer '{question}' for {company}", e)
+            logger.error(str(error_message))
+            result["error"] = str(e)
+        yield result
+
+def batch_answer(questions, companies, k=NUM_OF_DOCS_TO_RETRIEVE, max_parallel=BATCH_LLM_CONCURRENCY, sections=None):
+    """
+    Yields one result per (company, question) as soon as its answer is ready.
+    All questions are embedded in one batch up front. Each company's index is
+    loaded once and searched for every question while earlier answers are still
+    being generated, with at most max_parallel LLM calls in flight and retrieval
+    kept only a few pairs ahead of them. Questions the fact index answers skip
+    retrieval and the LLM. sections limits retrieval to those 10-K sections. A pair
+    that fails yields a result with "error" instead of stopping the sweep. Closing
+    the generator early cancels the calls not yet started.
+    """
+    sections = resolve_sections(sections) if sections else None
+    start = time.perf_counter()
+    query_vectors = embed_queries(questions)
+    logger.info(f"Embedded {len(questions)} questions in {time.perf_counter() - start:.2f}s")
+
+    chain = get_prompt() | get_llm()
+    num_results = 0
+    max_pending = max_parallel * PENDING_PER_LLM_CALL
+    executor = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="batch-qa")
+    try:
+        futures = {}
+        for company in companies:
+            vector_db = vector_db_cache.get(company)
+            for question, query_vector in zip(questions, query_vectors):
+                if vector_db is None:
+                    num_results += 1
+                    yield {"company": company, "question": question, "error": f"No index for {company}"}
+                    continue
+                fact_result = _fact_result(company, question)
+                if fact_result is not None:
+                    num_results += 1
+                    yield fact_result
+                    continue
+                docs = retrieve_by_vector(vector_db, question, query_vector, k=k, sections=sections)
+                futures[executor.submit(_generate, chain, question, docs)] = (company, question, docs)
+                while len(futures) >= max_pending:
+                    wait(list(futures), return_when=FIRST_COMPLETED)
+                    for result in _completed(futures, wait=False):
+                        num_results += 1
+                        yield result
+            # Hand out what has finished so far instead of holding it until the last company
+            for result in _completed(futures, wait=False):
+                num_results += 1
+                yield result
+        for result in _completed(futures, wait=True):
+            num_results += 1
+            yield result
+    finally:
+        # Also reached when the consumer stops early (e.g. the client disconnected):
+        # drop the queued calls instead of blocking until all of them have run
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    seconds = time.perf_counter() - start
+    logger.info(f"Answered {num_results} question x company pairs in {seconds:.1f}s ({num_results / seconds:.2f}/s)")
+
+async def abatch_answer(questions, companies, k=NUM_OF_DOCS_TO_RETRIEVE, max_parallel=BATCH_LLM_CONCURRENCY, sections=None):
+    """
+    Async form of batch_answer for the ASGI app, with the same results. Embedding
+    the questions and every LLM call take a slot from the shared limiters, so a
+    batch competes with chat traffic for the same capacity. CapacityExceeded while
+    embedding is raised before the first result; an LLM call that is rejected
+    later yields a result with "error" like any other failed pair.
+    """
+    sections = resolve_sections(sections) if sections else None
+    start = time.perf_counter()
+    async with embedding_limiter.slot():
+        query_vectors = await asyncio.to_thread(embed_queries, questions)
+    logger.info(f"Embedded {len(questions)} questions in {time.perf_counter() - start:.2f}s")
+
+    chain = get_prompt() | get_llm()
+    # Keeps one batch from filling the llm limiter's queue on its own
+    batch_slots = asyncio.Semaphore(max_parallel)
+    max_pending = max_parallel * PENDING_PER_LLM_CALL
+
+    async def answer(company, question, docs):
+        result = {"company": company, "question": question}
+        try:
+            async with batch_slots, llm_limiter.slot():
+                call_start = time.perf_counter()
+                context = "\n\n".join(doc.page_content for doc in docs)
+                response = await chain.ainvoke({"context": context, "question": question})
+            answer = response.content if hasattr(response, "content") else str(response)
+            result.update(answer=answer, sources=_citations(docs), seconds=round(time.perf_counter() - call_start, 3))
+        except Exception as e:
+            error_message = CustomException(f"Failed to answer '{question}' for {company}", e)
+            logger.error(str(error_message))
+            result["error"] = str(e)
+        return result
+
+    num_results = 0
+    tasks = set()
+    try:
+        for company in companies:
+            vector_db = await asyncio.to_thread(vector_db_cache.get, company)
+            for question, query_vector in zip(questions, query_vectors):
+                if vector_db is None:
+                    num_results += 1
+                    yield {"company": company, "question": question, "error": f"No index for {company}"}
+                    continue
+                fact_result = await asyncio.to_thread(_fact_result, company, question)
+                if fact_result is not None:
+                    num_results += 1
+                    yield fact_result
+                    continue
+                docs = await asyncio.to_thread(
+                    retrieve_by_vector, vector_db, question, query_vector, k=k, sections=sections
+                )
+                tasks.add(asyncio.create_task(answer(company, question, docs)))
+                while len(tasks) >= max_pending:
+                    done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        num_results += 1
+                        yield task.result()
+            # Hand out what has finished so far instead of holding it until the last company
+            for task in [task for task in tasks if task.done()]:
+                tasks.discard(task)
+                num_results += 1
+                yield task.result()
+        for next_result in asyncio.as_completed(tasks):
+            num_results += 1
+            yield await next_result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    seconds = time.perf_counter() - start
+    logger.info(f"Answered {num_results} question x company pairs in {seconds:.1f}s ({num_results / seconds:.2f}/s)")
+
+def read_questions(path):
+    """One question per line; blank lines and lines starting with # are skipped."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", required=True, help="text file with one question per line")
+    parser.add_argument("--companies", nargs="*", help="defaults to every filing in data/")
+    parser.add_argument("--output", default="-", help="JSON lines file, - for stdout")
+    parser.add_argument("--k", type=int, default=NUM_OF_DOCS_TO_RETRIEVE)
+    parser.add_argument("--parallel", type=int, default=BATCH_LLM_CONCURRENCY, help="concurrent LLM calls")
+    parser.add_argument("--sections", help="comma-separated 10-K sections to retrieve from")
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    companies = args.companies or list_companies()
+    for company in companies:
+        # Builds missing indexes; up-to-date ones are skipped
+        create_index(file_name=company, refresh_combined=False)
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        for result in batch_answer(
+            questions, companies, k=args.k, max_parallel=args.parallel, sections=args.sections
+        ):
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
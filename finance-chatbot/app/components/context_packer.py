@@ -0,0 +1,125 @@
+import re
+from typing import Any
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.common.logger import get_logger
+
+from app.config.config import CONTEXT_TOKEN_BUDGET, CONTEXT_DUPLICATE_THRESHOLD
+
+logger = get_logger(__name__)
+
+# Shortest shared run of characters treated as chunk overlap when start_index is missing
+MIN_OVERLAP_CHARS = 50
+
+_encoding = None
+
+def count_tokens(text):
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable, estimating tokens from characters: {e}")
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // 4
+
+def _span(doc):
+    start = doc.metadata.get("start_index")
+    if start is None:
+        return None
+    return start, start + len(doc.page_content)
+
+def _merge_text(first, second):
+    """Joins two chunks that overlap or touch, or returns None if they don't."""
+    first_span, second_span = _span(first), _span(second)
+    if first_span and second_span:
+        if first_span[0] > second_span[0]:
+            first, second = second, first
+            first_span, second_span = second_span, first_span
+        if second_span[0] > first_span[1]:
+            return None
+        return first.page_content + second.page_content[first_span[1] - second_span[0]:], first_span[0]
+
+    # Older indexes have no start_index: look for the tail of one chunk at the head of the other
+    for a, b in ((first, second), (second, first)):
+        head = b.page_content[:MIN_OVERLAP_CHARS]
+        pos = a.page_content.find(head)
+        if len(head) == MIN_OVERLAP_CHARS and pos != -1 and b.page_content.startswith(a.page_content[pos:]):
+            return a.page_content[:pos] + b.page_content, a.metadata.get("start_index")
+    return None
+
+def _shingles(text, size=5):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def pack_documents(docs, token_budget=CONTEXT_TOKEN_BUDGET, duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD):
+    """
+    Assembles retrieved chunks (best first) into the context for the prompt:
+    chunks from the same page that overlap or touch are merged so the shared
+    CHUNK_OVERLAP text is sent once, near-duplicate passages are dropped, and
+    passages are kept in relevance order until token_budget is spent.
+    """
+    packed = []
+    for doc in docs:
+        for i, kept in enumerate(packed):
+            same_page = (
+                kept.metadata.get("source") == doc.metadata.get("source")
+                and kept.metadata.get("page") == doc.metadata.get("page")
+            )
+            merged = _merge_text(kept, doc) if same_page else None
+            if merged is not None:
+                text, start_index = merged
+                metadata = dict(kept.metadata)
+                if start_index is not None:
+                    metadata["start_index"] = start_index
+                packed[i] = Document(page_content=text, metadata=metadata, id=kept.id)
+                break
+        else:
+            packed.append(doc)
+
+    result = []
+    kept_shingles = []
+    tokens_used = 0
+    for doc in packed:
+        shingles = _shingles(doc.page_content)
+        if any(_similarity(shingles, other) >= duplicate_threshold for other in kept_shingles):
+            continue
+        tokens = count_tokens(doc.page_content)
+        if tokens_used + tokens > token_budget:
+            if result:
+                break
+            # Always send something: cut the best passage down to the budget
+            doc = Document(
+                page_content=doc.page_content[:len(doc.page_content) * token_budget // tokens],
+                metadata=doc.metadata,
+                id=doc.id
+            )
+            tokens = token_budget
+        result.append(doc)
+        kept_shingles.append(shingles)
+        tokens_used += tokens
+
+    logger.info(f"Packed {len(docs)} retrieved chunks into {len(result)} passages ({tokens_used} tokens)")
+    return result
+
+
+class PackedRetriever(BaseRetriever):
+    """Runs the wrapped retriever and packs its results with pack_documents."""
+
+    retriever: Any
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return pack_documents(docs, token_budget=self.token_budget)
@@ -0,0 +1,188 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app.components.resources import get_llm
+from app.config.config import CONVERSATION_DB_PATH, CONVERSATION_RECENT_TURNS
+from app.config.config import CONVERSATION_SUMMARY_MAX_WORDS, CONVERSATION_TTL_SECONDS
+from app.common.logger import get_logger
+from app.common.custom_exception import CustomException
+
+logger = get_logger(__name__)
+
+def _summary_prompt(summary, messages):
+    transcript = "\n".join(f"{m['role']} : {m['content']}" for m in messages)
+    return (
+        f"Summary of the conversation so far:\n{summary or 'None'}\n\n"
+        f"New messages:\n{transcript}\n\n"
+        f"Update the summary so it also covers the new messages, in at most {CONVERSATION_SUMMARY_MAX_WORDS} words. "
+        "Keep the company, periods, financial figures and terms the user asked about, since later "
+        "questions may refer back to them. Return only the summary."
+    )
+
+def summarize_messages(summary, messages):
+    """Folds messages into the running summary with one LLM call."""
+    response = get_llm().invoke(_summary_prompt(summary, messages))
+    return str(getattr(response, "content", response)).strip()
+
+def turn_messages(user_input, tool_response, response):
+    """The messages one chat turn adds to the history."""
+    messages = [{"role": "user", "content": user_input}]
+    if tool_response:
+        messages.append({"role": "Search_Tool", "content": tool_response})
+    messages.append({"role": "bot", "content": response})
+    return messages
+
+
+class ConversationStore:
+    """
+    Server-side chat history keyed by a conversation id, so the session cookie
+    only carries the id. Prompts get a rolling summary plus the last few turns;
+    older turns are folded into the summary in the background after each turn,
+    keeping the history part of the prompt the same size however long the chat.
+    """
+
+    def __init__(self, path, recent_turns, ttl_seconds):
+        self.recent_turns = recent_turns
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-compaction")
+        self.path = path
+        self._connection = None
+        self._conn_pid = None
+
+    def _connect(self):
+        store_dir = os.path.dirname(self.path)
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id TEXT PRIMARY KEY, summary TEXT NOT NULL DEFAULT '', "
+            "summarized_upto INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+            "PRIMARY KEY (conversation_id, seq))"
+        )
+        conn.commit()
+        return conn
+
+    @property
+    def _conn(self):
+        # Opened on first use, and again in a forked child (gunicorn --preload):
+        # a sqlite connection must not be shared between processes
+        if self._conn_pid != os.getpid():
+            self._connection = self._connect()
+            self._conn_pid = os.getpid()
+        return self._connection
+
+    def create(self):
+        conversation_id = uuid.uuid4().hex
+        with self._lock:
+            self._purge_expired()
+            self._conn.execute(
+                "INSERT INTO conversations (id, updated) VALUES (?, ?)", (conversation_id, time.time())
+            )
+            self._conn.commit()
+        return conversation_id
+
+    def _purge_expired(self):
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT id FROM conversations WHERE updated < ?", (time.time() - self.ttl_seconds,)
+        )]
+        for conversation_id in expired:
+            self._delete(conversation_id)
+
+    def _delete(self, conversation_id):
+        self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    def delete(self, conversation_id):
+        with self._lock:
+            self._delete(conversation_id)
+            self._conn.commit()
+
+    def exists(self, conversation_id):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row is not None
+
+    def append(self, conversation_id, messages):
+        """Stores a turn's messages and schedules compaction of older turns."""
+        with self._lock:
+            # Take the write lock before reading MAX(seq) so two server processes can't pick the same seq
+            self._conn.execute("BEGIN IMMEDIATE")
+            last_seq = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO messages (conversation_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [(conversation_id, last_seq + n, m["role"], m["content"]) for n, m in enumerate(messages, start=1)]
+            )
+            self._conn.execute("UPDATE conversations SET updated = ? WHERE id = ?", (time.time(), conversation_id))
+            self._conn.commit()
+        self._executor.submit(self.compact, conversation_id)
+
+    def get_messages(self, conversation_id):
+        """Full transcript, for rendering the page."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY seq", (conversation_id,)
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def _unsummarized(self, conversation_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, summarized_upto FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None:
+                return "", 0, []
+            summary, summarized_upto = row
+            rows = self._conn.execute(
+                "SELECT seq, role, content FROM messages WHERE conversation_id = ? AND seq > ? ORDER BY seq",
+                (conversation_id, summarized_upto)
+            ).fetchall()
+        return summary, summarized_upto, rows
+
+    def get_history(self, conversation_id):
+        """
+        Messages for the prompt: the summary of older turns (as a "summary" message)
+        followed by the turns not yet folded into it.
+        """
+        summary, _, rows = self._unsummarized(conversation_id)
+        history = [{"role": "summary", "content": summary}] if summary else []
+        return history + [{"role": role, "content": content} for _, role, content in rows]
+
+    def compact(self, conversation_id):
+        """Folds every turn but the last recent_turns into the summary."""
+        summary, summarized_upto, rows = self._unsummarized(conversation_id)
+        turn_starts = [seq for seq, role, _ in rows if role == "user"]
+        if len(turn_starts) <= self.recent_turns:
+            return
+        keep_from = turn_starts[-self.recent_turns]
+        folded = [{"role": role, "content": content} for seq, role, content in rows if seq < keep_from]
+        try:
+            new_summary = summarize_messages(summary, folded)
+        except Exception as e:
+            error_message = CustomException("Failed to summarize conversation history", e)
+            logger.error(str(error_message))
+            return
+
+        with self._lock:
+            # Another worker may have compacted the same turns meanwhile; only the first update wins
+            self._conn.execute(
+                "UPDATE conversations SET summary = ?, summarized_upto = ? WHERE id = ? AND summarized_upto = ?",
+                (new_summary, keep_from - 1, conversation_id, summarized_upto)
+            )
+            self._conn.commit()
+        logger.info(f"Folded {len(folded)} messages into the summary of conversation {conversation_id}")
+
+
+conversation_store = ConversationStore(CONVERSATION_DB_PATH, CONVERSATION_RECENT_TURNS, CONVERSATION_TTL_SECONDS)
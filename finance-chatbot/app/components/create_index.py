@@ -1,39 +1,186 @@
 import os
+import glob
+import json
 
-from app.components.pdf_loader import load_pdf_files, create_text_chunks
-from app.components.vector_db import create_vector_db
-from app.config.config import DB_FAISS_PATH
+from app.components.pdf_loader import load_pdf_files, load_pdf_pages, stream_text_chunks
+from app.components.sections import SectionTagger
+from app.components.vector_db import create_vector_db, update_vector_db, merge_vector_dbs, get_index_version
+from app.components.vector_db import UPDATABLE_INDEX_TYPES
+from app.components.index_manifest import load_manifest, save_manifest, new_file_entry, record_page
+from app.components.index_manifest import is_file_unchanged, text_sha256, CHUNK_METADATA_VERSION
+from app.components.fact_index import FactCollector, fact_store, extract_facts
+from app.config.config import DB_FAISS_PATH, DATA_PATH, PARALLEL_PDF_LOADING, FAISS_INDEX_TYPE
 
 from app.common.logger import get_logger
 from app.common.custom_exception import CustomException
+from app.common.tracing import traced, traced_iter, span
 
 logger = get_logger(__name__)
 
-def create_index(file_name=None, force_reindex=False):
+# Versions of the per-company indexes the combined index was merged from
+SOURCES_MANIFEST = "sources.json"
+
+def list_companies():
+    return sorted(
+        os.path.splitext(os.path.basename(path))[0]
+        for path in glob.glob(os.path.join(DATA_PATH, "*.pdf"))
+    )
+
+def _load_pages(file_name):
+    if PARALLEL_PDF_LOADING:
+        # Pages are parsed as they are consumed, so time the iteration
+        return traced_iter("load_pdf_pages", load_pdf_pages(file_name))
+    with span("load_pdf_pages"):
+        return load_pdf_files(file_name)
+
+def _build_index(file_name, pdf_path, index_path):
+    manifest = {"index_type": FAISS_INDEX_TYPE, "chunk_metadata": CHUNK_METADATA_VERSION, "files": {}}
+    file_entry = manifest["files"][pdf_path] = new_file_entry(pdf_path)
+    facts = FactCollector(file_name)
+
+    def on_page(page, chunks):
+        record_page(file_entry, page, chunks)
+        facts.add_page(page)
+
+    text_chunks = stream_text_chunks(_load_pages(file_name), on_page=on_page)
+    if create_vector_db(text_chunks, file_name) is None:
+        raise CustomException(f"Failed to create vector database for {file_name}")
+    facts.save()
+    save_manifest(index_path, manifest)
+
+def _update_index(file_name, pdf_path, index_path, manifest):
+    """Re-embeds only the pages whose text hash changed and drops pages that disappeared."""
+    old_pages = manifest["files"].get(pdf_path, {"pages": {}})["pages"]
+    file_entry = new_file_entry(pdf_path)
+    # Every page passes through here, so the facts are re-extracted in full and
+    # the tagger sees the section headings of the unchanged pages too
+    facts = FactCollector(file_name)
+    tagger = SectionTagger()
+
+    changed_pages = []
+    for page in _load_pages(file_name):
+        facts.add_page(page)
+        tagger.observe(page)
+        page_key = str(page.metadata["page"])
+        old_page = old_pages.get(page_key)
+        if old_page and old_page["sha256"] == text_sha256(page.page_content):
+            file_entry["pages"][page_key] = old_page
+        else:
+            changed_pages.append(page)
+
+    delete_ids = [
+        chunk_id
+        for page_key, old_page in old_pages.items()
+        if page_key not in file_entry["pages"]
+        for chunk_id in old_page["ids"]
+    ]
+    logger.info(
+        f"{len(changed_pages)} changed pages, {len(delete_ids)} stale chunks "
+        f"out of {len(old_pages)} indexed pages in {pdf_path}"
+    )
+
+    if changed_pages or delete_ids:
+        text_chunks = stream_text_chunks(
+            changed_pages,
+            on_page=lambda page, chunks: record_page(file_entry, page, chunks),
+            tagger=tagger
+        )
+        if update_vector_db(text_chunks, delete_ids, file_name) is None:
+            raise CustomException(f"Failed to update vector database for {file_name}")
+
+    facts.save()
+    manifest["files"][pdf_path] = file_entry
+    save_manifest(index_path, manifest)
+    return bool(changed_pages or delete_ids)
+
+@traced("create_index")
+def create_index(file_name=None, force_reindex=False, refresh_combined=True):
     """
     Creates a vector index for the given file or all files.
-    If the index already exists and force_reindex is False, skips creation.
+    If the index exists and its PDF is unchanged, skips creation. If the PDF changed,
+    only the changed pages are re-embedded, unless force_reindex rebuilds everything.
+    The "all" index is merged from the per-company indexes, see create_combined_index.
     """
+    if file_name is None:
+        return create_combined_index(force_reindex=force_reindex)
     try:
         # Determine the index path
-        index_name = file_name if file_name else "all"
-        index_path = os.path.join(DB_FAISS_PATH, index_name)
+        index_path = os.path.join(DB_FAISS_PATH, file_name)
+        pdf_path = os.path.join(DATA_PATH, f"{file_name}.pdf")
         logger.info(f"Index path: {index_path}")
-        # Check if index already exists
+
+        manifest = load_manifest(index_path) if os.path.exists(index_path) else None
+        if manifest and manifest.get("index_type", "flat") != FAISS_INDEX_TYPE:
+            logger.info(f"Index type changed to {FAISS_INDEX_TYPE}. Rebuilding {index_path}.")
+            manifest = None
+            force_reindex = True
+        elif manifest and manifest.get("chunk_metadata", 1) != CHUNK_METADATA_VERSION:
+            logger.info(f"Chunk metadata changed since {index_path} was built. Rebuilding it.")
+            manifest = None
+            force_reindex = True
+        # Check if index already exists and is up to date
         if os.path.exists(index_path) and not force_reindex:
-            logger.info(f"Index already exists at {index_path}. Skipping re-indexing.")
-            return
-        
+            if not os.path.exists(pdf_path) or (manifest and is_file_unchanged(manifest, pdf_path)):
+                logger.info(f"Index already exists at {index_path}. Skipping re-indexing.")
+                if os.path.exists(pdf_path) and not fact_store.has_company(file_name):
+                    # Indexed before the fact index existed, or by an older extractor
+                    logger.info(f"Extracting financial statement facts for {file_name}")
+                    extract_facts(file_name, _load_pages(file_name))
+                return
+
         logger.info("Loading data")
-        documents = load_pdf_files(file_name)
-        text_chunks = create_text_chunks(documents)
-        create_vector_db(text_chunks, file_name)
+        # HNSW and IVF indexes can't drop vectors cleanly, so changed filings are rebuilt in full
+        if manifest and not force_reindex and FAISS_INDEX_TYPE in UPDATABLE_INDEX_TYPES:
+            logger.info(f"{pdf_path} changed since it was indexed. Updating changed pages only.")
+            changed = _update_index(file_name, pdf_path, index_path, manifest)
+        else:
+            _build_index(file_name, pdf_path, index_path)
+            changed = True
         logger.info("Index created successfully")
+
+        # Keep an existing combined index in step with the company index we just rebuilt
+        if changed and refresh_combined and os.path.exists(os.path.join(DB_FAISS_PATH, "all")):
+            create_combined_index()
     except Exception as e:
         error_message = CustomException("Failed to create index", e)
         logger.error(str(error_message))
         raise error_message
 
+@traced("create_combined_index")
+def create_combined_index(force_reindex=False):
+    """
+    Builds the "all" index by merging the per-company indexes and their docstores.
+    Only companies without an index are parsed and embedded. The merge is redone
+    whenever any per-company index has changed since the last merge.
+    """
+    try:
+        index_path = os.path.join(DB_FAISS_PATH, "all")
+        manifest_path = os.path.join(index_path, SOURCES_MANIFEST)
+        logger.info(f"Index path: {index_path}")
+
+        companies = list_companies()
+        if not companies:
+            raise CustomException(f"No PDF files found in the data path {DATA_PATH}")
+        for company in companies:
+            create_index(company, force_reindex=force_reindex, refresh_combined=False)
+
+        source_versions = {company: get_index_version(company) for company in companies}
+        if os.path.exists(manifest_path) and not force_reindex:
+            with open(manifest_path) as f:
+                if json.load(f) == source_versions:
+                    logger.info(f"Index at {index_path} is up to date. Skipping re-indexing.")
+                    return
+
+        if merge_vector_dbs(companies) is None:
+            raise CustomException("Failed to merge company indexes")
+        with open(manifest_path, "w") as f:
+            json.dump(source_versions, f, indent=2)
+        logger.info("Combined index created successfully")
+    except Exception as e:
+        error_message = CustomException("Failed to create combined index", e)
+        logger.error(str(error_message))
+        raise error_message
+
 if __name__ == "__main__":
     file_name = "NASDAQ_MSFT_2024"
-    create_index(file_name)
\ No newline at end of file
+    create_index(file_name)
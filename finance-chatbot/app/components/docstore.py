@@ -0,0 +1,120 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+# Chunk text and metadata live here instead of the pickled index.pkl, one row per
+# FAISS position, so a loaded index only reads the rows for the hits it returns.
+DOCSTORE_FILE = "docstore.sqlite"
+
+
+def write_docstore(db, db_path):
+    """Writes the chunks of a LangChain FAISS store to db_path/docstore.sqlite atomically."""
+    path = os.path.join(db_path, DOCSTORE_FILE)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute(
+            "CREATE TABLE docs ("
+            "pos INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, "
+            "page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        rows = []
+        for pos, doc_id in db.index_to_docstore_id.items():
+            doc = db.docstore.search(doc_id)
+            rows.append((pos, doc_id, doc.page_content, json.dumps(doc.metadata)))
+        conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+
+class _SQLiteReader:
+    """
+    One read-only connection per thread and process; sqlite connections aren't
+    shareable across threads, nor across a fork (gunicorn --preload).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+class SQLiteDocstore(Docstore):
+    """Read-only docstore that fetches a chunk from SQLite only when a search hits it."""
+
+    def __init__(self, reader):
+        self._reader = reader
+
+    def search(self, search):
+        row = self._reader.conn.execute(
+            "SELECT page_content, metadata FROM docs WHERE id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]), id=search)
+
+    def delete(self, ids):
+        raise NotImplementedError("SQLiteDocstore is read-only, load the index with writable=True")
+
+
+class PositionMap(Mapping):
+    """Maps FAISS positions to docstore ids lazily, standing in for index_to_docstore_id."""
+
+    def __init__(self, reader):
+        self._reader = reader
+
+    def __getitem__(self, pos):
+        row = self._reader.conn.execute("SELECT id FROM docs WHERE pos = ?", (int(pos),)).fetchone()
+        if row is None:
+            raise KeyError(pos)
+        return row[0]
+
+    def __iter__(self):
+        for (pos,) in self._reader.conn.execute("SELECT pos FROM docs ORDER BY pos"):
+            yield pos
+
+    def __len__(self):
+        return self._reader.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+
+def load_docstore(db_path, writable=False):
+    """
+    Returns (docstore, index_to_docstore_id) for a saved index. The read-only form
+    is backed by SQLite and costs nothing up front; the writable form materializes
+    everything in memory so the index can be updated and re-saved.
+    """
+    path = os.path.join(db_path, DOCSTORE_FILE)
+    if not writable:
+        reader = _SQLiteReader(path)
+        return SQLiteDocstore(reader), PositionMap(reader)
+
+    docs = {}
+    index_to_docstore_id = {}
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for pos, doc_id, page_content, metadata in conn.execute(
+            "SELECT pos, id, page_content, metadata FROM docs ORDER BY pos"
+        ):
+            docs[doc_id] = Document(page_content=page_content, metadata=json.loads(metadata), id=doc_id)
+            index_to_docstore_id[pos] = doc_id
+    finally:
+        conn.close()
+    return InMemoryDocstore(docs), index_to_docstore_id
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.common.logger import get_logger
+
+logger = get_logger(__name__)
+
+# SQLite caps the number of bound parameters per statement
+SQLITE_BATCH_SIZE = 500
+# Hits only record last-used times in memory; they are written with the next
+# store, or once this many keys are waiting
+LAST_USED_FLUSH_SIZE = 256
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model with a persistent, content-addressed store.
+    Vectors are keyed by a hash of the model name and the text, so an unchanged
+    chunk costs a lookup instead of a forward pass, whichever index it ends up in.
+    """
+
+    def __init__(self, embedding_model, model_name, cache_path, max_entries):
+        self.embedding_model = embedding_model
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._conn_pid = None
+        # Running row count, so a store doesn't scan the table. Replaced keys make
+        # it overcount and other processes' inserts make it undercount, so it is
+        # recounted when it passes the limit and after every tenth of the limit
+        self._count = 0
+        self._stored_since_count = 0
+        self._touched = {}
+
+    def _connect(self):
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        conn = sqlite3.connect(self.cache_path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        conn.commit()
+        self._count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return conn
+
+    @property
+    def _conn(self):
+        # Opened on first use, and again in a forked child (gunicorn --preload):
+        # a sqlite connection must not be shared between processes
+        if self._conn_pid != os.getpid():
+            self._connection = self._connect()
+            self._conn_pid = os.getpid()
+        return self._connection
+
+    def _key(self, text, kind):
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys):
+        """Read only: hits are timestamped in memory so a cached query costs no write transaction."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), SQLITE_BATCH_SIZE):
+                batch = keys[i:i + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+                    self._touched[key] = now
+            if len(self._touched) >= LAST_USED_FLUSH_SIZE:
+                self._flush_last_used()
+                self._conn.commit()
+        return found
+
+    def _flush_last_used(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()]
+            )
+            self._touched = {}
+
+    def _store(self, items):
+        now = time.time()
+        with self._lock:
+            # Pending hits go in the same transaction, before eviction picks the oldest rows
+            self._flush_last_used()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+            )
+            self._conn.commit()
+            self._count += len(items)
+            self._stored_since_count += len(items)
+            if self._count > self.max_entries or self._stored_since_count >= self.max_entries // 10:
+                self._evict()
+
+    def _evict(self):
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._stored_since_count = 0
+        overflow = self._count - self.max_entries
+        if overflow <= 0:
+            return
+        # Evict a little past the limit so we don't pay for eviction on every insert
+        to_evict = overflow + self.max_entries // 10
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (to_evict,)
+        )
+        self._conn.commit()
+        self._count = max(self._count - to_evict, 0)
+        self.evictions += to_evict
+        logger.info(f"Evicted {to_evict} entries from embedding cache")
+
+    def _embed(self, texts, kind, batch_queries=False):
+        keys = [self._key(text, kind) for text in texts]
+        vectors = self._lookup(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            if kind == "query" and not batch_queries:
+                new_vectors = [self.embedding_model.embed_query(text) for text in missing.values()]
+            else:
+                new_vectors = self.embedding_model.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), new_vectors))
+            self._store(new_items)
+            vectors.update((key, list(vector)) for key, vector in new_items)
+
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts):
+        return self._embed(list(texts), "document")
+
+    def embed_query(self, text):
+        return self._embed([text], "query")[0]
+
+    def embed_queries(self, texts):
+        """
+        Many queries in one forward pass. The finance embedding model has no query
+        instruction, so a query encodes exactly like a document; cached under the
+        query keys so embed_query finds them.
+        """
+        return self._embed(list(texts), "query", batch_queries=True)
+
+    def stats(self):
+        with self._lock:
+            hits, misses, evictions = self.hits, self.misses, self.evictions
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate": hits / total if total else 0.0,
+        }
@@ -1,20 +1,41 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-
 from app.common.logger import get_logger
 from app.common.custom_exception import CustomException
+from app.common.tracing import registry, cache_metrics
+
+from app.components.embedding_cache import CachedEmbeddings
 
-from app.config.config import HF_EMBEDDING_MODEL
+from app.config.config import HF_EMBEDDING_MODEL, EMBEDDING_BACKEND, HASH_EMBEDDING_DIM
+from app.config.config import EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
 
 logger = get_logger(__name__)
 
 def get_embedding_model():
     try:
-        logger.info("Loading embedding model")
-        embedding_model = HuggingFaceEmbeddings(
-            model_name=HF_EMBEDDING_MODEL,
-            model_kwargs={"device": "cpu"}
-        )
-        logger.info("Successfully loaded embedding model")
+        if EMBEDDING_BACKEND == "hash":
+            from app.components.offline_models import HashEmbeddings
+            logger.info("Using deterministic hash embeddings (offline)")
+            embedding_model = HashEmbeddings()
+            model_name = f"hash-{HASH_EMBEDDING_DIM}"
+        else:
+            # Imported here: pulls in torch, which only processes that embed should pay for
+            from langchain_huggingface import HuggingFaceEmbeddings
+            logger.info("Loading embedding model")
+            embedding_model = HuggingFaceEmbeddings(
+                model_name=HF_EMBEDDING_MODEL,
+                model_kwargs={"device": "cpu"}
+            )
+            model_name = HF_EMBEDDING_MODEL
+            logger.info("Successfully loaded embedding model")
+        if EMBEDDING_CACHE_ENABLED:
+            logger.info(f"Using embedding cache at {EMBEDDING_CACHE_PATH}")
+            embedding_model = CachedEmbeddings(
+                embedding_model,
+                model_name=model_name,
+                cache_path=EMBEDDING_CACHE_PATH,
+                max_entries=EMBEDDING_CACHE_MAX_ENTRIES
+            )
+            cached_model = embedding_model
+            registry.add_collector(lambda: cache_metrics("embedding", cached_model.stats()))
         return embedding_model
     except Exception as e:
         error_message = CustomException("Error loading embedding model", e)
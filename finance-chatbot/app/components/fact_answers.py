@@ -0,0 +1,330 @@
+import os
+import re
+
+from langchain_core.documents import Document
+
+from app.components.fact_index import fact_store
+from app.components.sections import STATEMENT_TITLES
+from app.config.config import DATA_PATH, FACT_ANSWERS_ENABLED
+from app.common.logger import get_logger
+from app.common.tracing import traced
+
+logger = get_logger(__name__)
+
+# Line items the fact path can answer for: (display name, statement, line item
+# names as the filings print them, normalized). The first name found wins.
+CONCEPTS = {
+    "revenue": ("Revenue", "income_statement", (
+        "total net sales", "net sales", "total revenues", "total revenue", "revenues", "revenue", "net revenues",
+    )),
+    "cost_of_revenue": ("Cost of revenue", "income_statement", (
+        "total cost of sales", "cost of sales", "total cost of revenue", "cost of revenue", "cost of revenues",
+    )),
+    "gross_profit": ("Gross profit", "income_statement", ("gross margin", "gross profit", "total gross margin")),
+    "research_and_development": ("Research and development", "income_statement", (
+        "research and development", "operating expenses research and development",
+    )),
+    "operating_expenses": ("Operating expenses", "income_statement", (
+        "total operating expenses", "operating expenses",
+    )),
+    "operating_income": ("Operating income", "income_statement", (
+        "operating income", "income from operations", "total operating income",
+    )),
+    "income_taxes": ("Provision for income taxes", "income_statement", (
+        "provision for income taxes", "provision for income taxes net", "income taxes",
+    )),
+    "net_income": ("Net income", "income_statement", ("net income",)),
+    "eps_diluted": ("Diluted earnings per share", "income_statement", (
+        "earnings per share diluted", "diluted earnings per share", "net income per share diluted",
+    )),
+    "cash": ("Cash and cash equivalents", "balance_sheet", (
+        "cash and cash equivalents", "current assets cash and cash equivalents",
+    )),
+    "current_assets": ("Total current assets", "balance_sheet", ("total current assets",)),
+    "total_assets": ("Total assets", "balance_sheet", ("total assets",)),
+    "current_liabilities": ("Total current liabilities", "balance_sheet", ("total current liabilities",)),
+    "total_liabilities": ("Total liabilities", "balance_sheet", ("total liabilities",)),
+    # Only when the balance sheet prints a total; summing the debt lines is left to the llm
+    "total_debt": ("Total debt", "balance_sheet", ("total debt",)),
+    "equity": ("Shareholders' equity", "balance_sheet", (
+        "total shareholders equity", "total stockholders equity", "total equity",
+    )),
+    "operating_cash_flow": ("Operating cash flow", "cash_flow", (
+        "cash generated by operating activities", "net cash provided by operating activities",
+        "net cash from operations", "net cash provided by operations",
+    )),
+    "capital_expenditures": ("Capital expenditures", "cash_flow", (
+        "payments for acquisition of property plant and equipment", "purchases of property and equipment",
+        "additions to property and equipment", "capital expenditures",
+    )),
+}
+
+# How questions name the concepts
+CONCEPT_PHRASES = {
+    "revenue": ("revenue", "revenues", "net sales", "total net sales", "sales", "net revenue", "top line"),
+    "cost_of_revenue": ("cost of sales", "cost of revenue", "cost of revenues", "cost of goods sold", "cogs"),
+    "gross_profit": ("gross profit",),
+    "research_and_development": ("research and development", "r d", "r and d"),
+    "operating_expenses": ("operating expenses", "opex"),
+    "operating_income": ("operating income", "operating profit", "income from operations"),
+    "income_taxes": ("income taxes", "provision for income taxes", "tax expense", "income tax expense"),
+    "net_income": ("net income", "net earnings", "earnings", "net profit", "profit", "bottom line"),
+    "eps_diluted": ("earnings per share", "eps", "diluted eps", "diluted earnings per share"),
+    "cash": ("cash and cash equivalents", "cash"),
+    "current_assets": ("current assets", "total current assets"),
+    "total_assets": ("total assets", "assets"),
+    "current_liabilities": ("current liabilities", "total current liabilities"),
+    "total_liabilities": ("total liabilities", "liabilities"),
+    "total_debt": ("total debt", "debt"),
+    "equity": ("shareholders equity", "stockholders equity", "total equity", "equity"),
+    "operating_cash_flow": (
+        "operating cash flow", "cash flow from operations", "cash from operations", "cash from operating activities",
+        "cash generated by operating activities", "cash provided by operating activities",
+    ),
+    "capital_expenditures": ("capital expenditures", "capex"),
+}
+
+# Named ratios: (display name, numerator, denominator, shown as a percentage)
+RATIOS = {
+    "gross_margin_pct": ("Gross margin percentage", "gross_profit", "revenue", True),
+    "operating_margin": ("Operating margin", "operating_income", "revenue", True),
+    "net_margin": ("Net profit margin", "net_income", "revenue", True),
+    "current_ratio": ("Current ratio", "current_assets", "current_liabilities", False),
+    "debt_to_equity": ("Debt to equity ratio", "total_debt", "equity", False),
+    "liabilities_to_equity": ("Liabilities to equity ratio", "total_liabilities", "equity", False),
+    "return_on_equity": ("Return on equity", "net_income", "equity", True),
+    "return_on_assets": ("Return on assets", "net_income", "total_assets", True),
+}
+
+RATIO_PHRASES = {
+    # A "gross margin" question wants the percentage, though some filings print the dollar line as "Gross margin"
+    "gross_margin_pct": (
+        "gross margin", "gross margin percentage", "gross margin ratio", "gross profit margin", "gross margin percent",
+    ),
+    "operating_margin": ("operating margin", "operating profit margin"),
+    "net_margin": ("net profit margin", "net margin", "profit margin", "net income margin"),
+    "current_ratio": ("current ratio",),
+    "debt_to_equity": ("debt to equity", "debt to equity ratio"),
+    "liabilities_to_equity": ("liabilities to equity", "liabilities to equity ratio", "total liabilities to equity"),
+    "return_on_equity": ("return on equity", "roe"),
+    "return_on_assets": ("return on assets", "roa"),
+}
+
+GROWTH_WORDS = {
+    "growth", "grow", "grew", "increase", "increased", "decrease", "decreased", "decline", "declined",
+    "change", "changed", "rise", "rose", "fall", "fell", "yoy",
+}
+GENERIC_RATIO_WORDS = {"ratio", "divided"}
+
+# Words that don't change what is being asked. Any other word left over after the
+# concepts and years are matched means the question asks for more than a lookup.
+FILLER_WORDS = {
+    "a", "an", "the", "and", "or", "of", "in", "for", "to", "from", "by", "on", "at", "as", "with", "between",
+    "what", "whats", "was", "were", "is", "are", "how", "much", "did", "does", "do", "has", "have", "had",
+    "tell", "me", "give", "show", "find", "calculate", "compute", "please", "value", "amount", "figure",
+    "company", "companys", "its", "their", "reported", "report", "fiscal", "year", "years", "fy", "annual",
+    "total", "latest", "last", "current", "most", "recent", "previous", "prior", "percentage", "percent", "rate",
+    "over", "compared", "vs", "versus", "ratio", "divided", "s", "inc", "corporation", "corp",
+}
+
+_WORD_SPLIT = re.compile(r"[^a-z0-9]+")
+_YEAR = re.compile(r"\b(?:19|20)\d{2}\b")
+
+def normalize(text):
+    text = text.lower().replace("’", "'").replace("%", " percent ")
+    text = re.sub(r"\([^)]*\)", " ", text)
+    text = re.sub(r"'s\b", "", text)
+    text = re.sub(r"\bfy ?((?:19|20)\d{2})\b", r"fiscal \1", text)
+    return " ".join(word for word in _WORD_SPLIT.split(text) if word)
+
+def _phrase_table():
+    phrases = [(normalize(p), "ratio", name) for name, ps in RATIO_PHRASES.items() for p in ps]
+    phrases += [(normalize(p), "concept", name) for name, ps in CONCEPT_PHRASES.items() for p in ps]
+    # Longest first, so "gross profit margin" is a ratio and "earnings per share" isn't "earnings"
+    return sorted(phrases, key=lambda phrase: len(phrase[0].split()), reverse=True)
+
+_PHRASES = _phrase_table()
+
+def parse_query(query, names=()):
+    """
+    Returns (matches, years, words, leftover) for a question: the (kind, name,
+    phrase) of the ratios and concepts it names in order of appearance, the years
+    it mentions, its other words, and those of them that aren't filler or one of
+    names (the company's). None when nothing is recognised.
+    """
+    text = f" {normalize(query)} "
+    matches = []
+    for phrase, kind, name in _PHRASES:
+        pattern = f" {phrase} "
+        while pattern in text:
+            start = text.index(pattern)
+            matches.append((start, kind, name, phrase))
+            text = text[:start] + " " + "#" * len(phrase) + " " + text[start + len(pattern):]
+    if not matches:
+        return None
+    years = _YEAR.findall(text)
+    ignored = FILLER_WORDS | GROWTH_WORDS | {word for name in names for word in normalize(name or "").split()}
+    words = [word for word in _YEAR.sub(" ", text).split() if not word.startswith("#")]
+    leftover = [word for word in words if word not in ignored]
+    return [match[1:] for match in sorted(matches)], years, words, leftover
+
+def _fact_key(fact):
+    return normalize(fact["line_item"]), normalize(f"{fact['section']} {fact['line_item']}")
+
+def find_concept(facts, concept):
+    """{period: fact} for a concept, from the first line item that matches one of its names."""
+    _, statement, names = CONCEPTS[concept]
+    candidates = [fact for fact in facts if fact["statement"] == statement]
+    for name in names:
+        found = {}
+        for fact in candidates:
+            if name in _fact_key(fact) and fact["period"] not in found:
+                found[fact["period"]] = fact
+        if found:
+            return found
+    return {}
+
+def format_value(fact):
+    value = fact["value"]
+    sign = "-" if value < 0 else ""
+    if fact["unit"] == "per share":
+        return f"{sign}${abs(value):,.2f} per share"
+    amount = f"{abs(value):,.0f}" if float(value).is_integer() else f"{abs(value):,.2f}"
+    if fact["unit"] in ("thousands", "millions", "billions"):
+        return f"{sign}${amount} {fact['unit'][:-1]}"
+    return f"{sign}${amount}"
+
+def _cite(*facts):
+    pages = dict.fromkeys(f"{STATEMENT_TITLES[fact['statement']]}, page {fact['page']}" for fact in facts)
+    return "; ".join(pages)
+
+def _source(company, fact):
+    return Document(
+        page_content=f"{STATEMENT_TITLES[fact['statement']]}: {fact['line_item']} ({fact['period']}) {format_value(fact)}",
+        metadata={"source": os.path.join(DATA_PATH, f"{company}.pdf"), "page": fact["page"], "statement": fact["statement"]}
+    )
+
+def _periods(values, years, count):
+    """The periods to answer for: the years asked about, else the latest count periods."""
+    available = sorted(values, reverse=True)
+    if years:
+        return sorted(years, reverse=True) if all(year in values for year in years) else None
+    return available[:count] if len(available) >= count else None
+
+def _lookup(concept, values, years):
+    periods = _periods(values, years, 1)
+    if periods is None:
+        return None
+    name = CONCEPTS[concept][0]
+    facts = [values[period] for period in periods]
+    lines = [f"{name} was {format_value(fact)} in {fact['period']} ({_cite(fact)})." for fact in facts]
+    return lines, facts
+
+def _growth(concept, values, years):
+    if len(years) > 2:
+        return None
+    if len(years) == 1:
+        earlier = [period for period in sorted(values, reverse=True) if period < years[0]]
+        years = years + earlier[:1]
+    periods = _periods(values, years, 2)
+    if periods is None or len(periods) != 2:
+        return None
+    new, old = values[periods[0]], values[periods[1]]
+    if old["value"] == 0 or (old["value"] < 0) != (new["value"] < 0):
+        return None
+    change = (new["value"] - old["value"]) / abs(old["value"]) * 100
+    direction = "increased" if change >= 0 else "decreased"
+    line = (
+        f"{CONCEPTS[concept][0]} {direction} {abs(change):.1f}% from {format_value(old)} in {old['period']} "
+        f"to {format_value(new)} in {new['period']} ({_cite(old, new)})."
+    )
+    return [line], [old, new]
+
+def _ratio(name, numerator, denominator, as_percentage, values, years):
+    shared = {period: None for period in values[0] if period in values[1]}
+    periods = _periods(shared, years, 1)
+    if periods is None:
+        return None
+    lines, facts = [], []
+    for period in periods:
+        top, bottom = values[0][period], values[1][period]
+        if bottom["value"] == 0:
+            return None
+        ratio = top["value"] / bottom["value"]
+        shown = f"{ratio * 100:.1f}%" if as_percentage else f"{ratio:.2f}"
+        lines.append(
+            f"{name} was {shown} in {period}: {CONCEPTS[numerator][0]} {format_value(top)} divided by "
+            f"{CONCEPTS[denominator][0]} {format_value(bottom)} ({_cite(top, bottom)})."
+        )
+        facts += [top, bottom]
+    return lines, facts
+
+@traced("fact_lookup")
+def answer_from_facts(company, query):
+    """
+    Answers a direct lookup, a named or two-item ratio, or a growth rate from the
+    facts extracted out of the company's financial statements, citing the pages.
+    Returns {"response", "sources"}, or None when the question needs more than that
+    (other wording left over, a missing period, an unknown line item) so the caller
+    falls back to retrieval and the LLM.
+    """
+    if not FACT_ANSWERS_ENABLED or not company:
+        return None
+    parsed = parse_query(query, names=(fact_store.get_entity(company), company))
+    if parsed is None:
+        return None
+    matches, years, words, leftover = parsed
+    if leftover:
+        return None
+    facts = fact_store.get_facts(company)
+    if not facts:
+        return None
+
+    concepts = [(name, phrase) for kind, name, phrase in matches if kind == "concept"]
+    ratios = [name for kind, name, _ in matches if kind == "ratio"]
+    wants_growth = any(word in GROWTH_WORDS for word in words)
+    # "x to y ratio", "x divided by y", or "x as a percentage of y"
+    wants_ratio = any(word in GENERIC_RATIO_WORDS for word in words)
+    wants_share = "percent" in words or "percentage" in words
+
+    if ratios:
+        if concepts or wants_growth:
+            return None
+        results = []
+        for ratio in ratios:
+            name, numerator, denominator, as_percentage = RATIOS[ratio]
+            results.append(_ratio(name, numerator, denominator, as_percentage,
+                                  [find_concept(facts, numerator), find_concept(facts, denominator)], years))
+    elif wants_growth:
+        results = [_growth(concept, find_concept(facts, concept), years) for concept, _ in concepts]
+    elif wants_ratio or wants_share:
+        if len(concepts) != 2:
+            return None
+        (numerator, _), (denominator, phrase) = concepts
+        if wants_share:
+            text = normalize(query)
+            if re.search(rf"\bpercent(age)? of (the )?(total )?{concepts[0][1]}\b", text):
+                (denominator, _), (numerator, _) = concepts
+            elif not re.search(rf"\bpercent(age)? of (the )?(total )?{phrase}\b", text):
+                return None
+        if wants_share:
+            name = f"{CONCEPTS[numerator][0]} as a percentage of {CONCEPTS[denominator][0].lower()}"
+        else:
+            name = f"{CONCEPTS[numerator][0]} to {CONCEPTS[denominator][0].lower()} ratio"
+        results = [_ratio(name, numerator, denominator, wants_share,
+                          [find_concept(facts, numerator), find_concept(facts, denominator)], years)]
+    else:
+        results = [_lookup(concept, find_concept(facts, concept), years) for concept, _ in concepts]
+    if any(result is None for result in results):
+        return None
+
+    lines = [line for result_lines, _ in results for line in result_lines]
+    cited = {}
+    for _, result_facts in results:
+        for fact in result_facts:
+            cited.setdefault((fact["statement"], fact["line_item"], fact["period"]), fact)
+    logger.info(f"Answered from the fact index: {query}")
+    return {
+        "response": "\n".join(lines),
+        "sources": [_source(company, fact) for fact in cited.values()],
+    }
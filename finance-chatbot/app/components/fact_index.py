@@ -0,0 +1,230 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from app.components.sections import find_statement_heading
+from app.config.config import FACT_DB_PATH
+from app.common.logger import get_logger
+from app.common.custom_exception import CustomException
+
+logger = get_logger(__name__)
+
+_TRAILING_VALUE = re.compile(r"\s+(?:\$\s*)?(\(?\$?\s*\d[\d,]*(?:\.\d+)?\s*\)?|[—–-])$")
+_YEAR = re.compile(r"\b(?:19|20)\d{2}\b")
+_SCALE = re.compile(r"\bin (thousands|millions|billions)\b", re.IGNORECASE)
+_REGISTRANT = re.compile(r"\(?\s*exact name of (the )?registrant", re.IGNORECASE)
+COVER_PAGES = 3
+# Bumped when extraction changes, so stored facts are re-extracted on the next create_index
+EXTRACTOR_VERSION = 2
+
+def _split_values(line):
+    """Splits a table row into its label and the numbers at the end of it."""
+    label = " " + line.strip()
+    values = []
+    while True:
+        match = _TRAILING_VALUE.search(label)
+        if match is None:
+            break
+        values.append(match.group(1))
+        label = label[:match.start()]
+    return label.strip(" .$"), values[::-1]
+
+def _parse_value(token):
+    token = token.replace("$", "").replace(" ", "")
+    if token in ("—", "–", "-"):
+        return None
+    number = float(token.strip("()").replace(",", ""))
+    return -number if token.startswith("(") else number
+
+def cover_page_entity(page):
+    """
+    The registrant's name from a 10-K cover page: the line printed above "(Exact
+    name of registrant as specified in its charter)". None on any other page.
+    """
+    lines = [line.strip() for line in page.page_content.splitlines()]
+    lines = [line for line in lines if line]
+    for i, line in enumerate(lines):
+        match = _REGISTRANT.search(line)
+        if match is None:
+            continue
+        name = line[:match.start()].strip() or (lines[i - 1] if i > 0 else "")
+        return name if name and len(name) < 80 else None
+    return None
+
+def extract_page_facts(page):
+    """
+    Reads the line items of an income statement, balance sheet or cash flow
+    statement page. Returns (statement, facts), or (None, []) for any other page.
+    The period columns come from the years in the table header, and a row is a
+    line item when it ends in exactly one number per period. Share counts are
+    skipped since their scale differs from the dollar amounts.
+    """
+    lines = [line.strip() for line in page.page_content.splitlines()]
+    lines = [line for line in lines if line]
+    statement, heading_index = find_statement_heading(lines)
+    if statement is None:
+        return None, []
+
+    scale = None
+    periods = []
+    section = ""
+    facts = []
+    for line in lines[heading_index + 1:]:
+        label, values = _split_values(line)
+        if scale is None and (match := _SCALE.search(line)):
+            scale = match.group(1).lower()
+
+        if not facts and _YEAR.search(line):
+            # Still in the table header: collect the period columns
+            periods.extend(year for year in _YEAR.findall(line) if year not in periods)
+            continue
+        if len(periods) < 2 or len(values) != len(periods) or not re.search(r"[A-Za-z]", label):
+            if label.endswith(":") and not values:
+                section = label.rstrip(":")
+            continue
+
+        # Share counts first: rows under "Shares used in computing earnings per
+        # share:" are counts, not per-share amounts
+        context = f"{section} {label}".lower()
+        if "shares" in context:
+            continue
+        elif "per share" in context:
+            unit = "per share"
+        else:
+            unit = scale or "dollars"
+        for period, value in zip(periods, values):
+            value = _parse_value(value)
+            if value is not None:
+                facts.append({
+                    "statement": statement,
+                    "section": section,
+                    "line_item": label,
+                    "period": period,
+                    "value": value,
+                    "unit": unit,
+                    "page": page.metadata.get("page"),
+                    "position": len(facts),
+                })
+        if label.lower().startswith("total"):
+            section = ""
+    return statement, facts
+
+
+class FactStore:
+    """
+    Financial statement line items per company, one row per (line item, period),
+    in SQLite next to the vector indexes. Rows are replaced whenever the company's
+    index is built or updated.
+    """
+
+    COLUMNS = ("statement", "section", "line_item", "period", "value", "unit", "page", "position")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._conn_pid = None
+
+    def _connect(self):
+        store_dir = os.path.dirname(self.path)
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS companies ("
+            "company TEXT PRIMARY KEY, entity TEXT, extracted REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS facts ("
+            "company TEXT NOT NULL, statement TEXT NOT NULL, section TEXT NOT NULL, line_item TEXT NOT NULL, "
+            "period TEXT NOT NULL, value REAL NOT NULL, unit TEXT NOT NULL, page INTEGER, position INTEGER NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS facts_company ON facts (company)")
+        if "version" not in {row[1] for row in conn.execute("PRAGMA table_info(companies)")}:
+            # Stores written before extraction was versioned
+            conn.execute("ALTER TABLE companies ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        conn.commit()
+        return conn
+
+    @property
+    def _conn(self):
+        # Opened on first use, and again in a forked child: a sqlite connection
+        # must not be shared between processes
+        if self._conn_pid != os.getpid():
+            self._connection = self._connect()
+            self._conn_pid = os.getpid()
+        return self._connection
+
+    def replace(self, company, entity, facts):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM facts WHERE company = ?", (company,))
+            self._conn.executemany(
+                f"INSERT INTO facts (company, {', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * (len(self.COLUMNS) + 1))})",
+                [(company, *(fact[column] for column in self.COLUMNS)) for fact in facts]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO companies (company, entity, extracted, version) VALUES (?, ?, ?, ?)",
+                (company, entity, time.time(), EXTRACTOR_VERSION)
+            )
+            self._conn.commit()
+
+    def has_company(self, company):
+        """True once company's facts are stored by the current extractor."""
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM companies WHERE company = ?", (company,)).fetchone()
+        return row is not None and row[0] == EXTRACTOR_VERSION
+
+    def get_entity(self, company):
+        with self._lock:
+            row = self._conn.execute("SELECT entity FROM companies WHERE company = ?", (company,)).fetchone()
+        return row[0] if row else None
+
+    def get_facts(self, company):
+        """The company's facts as dicts, in statement order."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM facts WHERE company = ? ORDER BY page, position",
+                (company,)
+            ).fetchall()
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+
+
+fact_store = FactStore(FACT_DB_PATH)
+
+
+class FactCollector:
+    """Gathers facts page by page while a filing is indexed, then stores them."""
+
+    def __init__(self, company):
+        self.company = company
+        self.entity = None
+        self.facts = []
+
+    def add_page(self, page):
+        try:
+            # The name printed on statement pages is often a section heading
+            # ("Financial Statements and Supplementary Data"), so take the cover page's
+            if self.entity is None and page.metadata.get("page", 0) < COVER_PAGES:
+                self.entity = cover_page_entity(page)
+            statement, facts = extract_page_facts(page)
+        except Exception as e:
+            error_message = CustomException(f"Error extracting facts from page {page.metadata.get('page')}", e)
+            logger.error(str(error_message))
+            return
+        if statement is not None:
+            self.facts.extend(facts)
+
+    def save(self):
+        fact_store.replace(self.company, self.entity, self.facts)
+        logger.info(f"Stored {len(self.facts)} financial statement facts for {self.company}")
+
+def extract_facts(company, pages):
+    """Extracts and stores the facts of an already indexed filing."""
+    collector = FactCollector(company)
+    for page in pages:
+        collector.add_page(page)
+    collector.save()
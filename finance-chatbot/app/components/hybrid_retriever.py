@@ -0,0 +1,89 @@
+from typing import Any
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from app.components.sections import route_query
+from app.components.vector_db import search_index
+from app.common.tracing import traced, span
+from app.config.config import HYBRID_CANDIDATES, HYBRID_RRF_K
+from app.config.config import SECTION_ROUTING_ENABLED, SECTION_FILTER_MIN_CHUNKS
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=HYBRID_RRF_K):
+    """Fuses ranked lists of FAISS positions; a position scores sum(1 / (rrf_k + rank))."""
+    scores = {}
+    for ranking in rankings:
+        for rank, pos in enumerate(ranking, 1):
+            scores[pos] = scores.get(pos, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves the top candidates from the dense FAISS index and from the BM25
+    lexical index, fuses both rankings with reciprocal rank fusion and returns k
+    chunks. Exact line-item terms surface through the lexical side, so a smaller
+    k is enough. Without a lexical index only the dense ranking is used.
+
+    With a section index, both searches are limited to the chunks of the given
+    sections, or of the sections the query routes to.
+    """
+
+    vector_db: Any
+    lexical_index: Any = None
+    section_index: Any = None
+    sections: Any = None
+    k: int
+    candidates: int = HYBRID_CANDIDATES
+
+    def allowed_positions(self, query):
+        """(sections, positions) to limit the search to, or (None, None) to search everything."""
+        if self.section_index is None:
+            return None, None
+        if self.sections:
+            positions = self.section_index.positions(self.sections)
+            # A filing without item headings has nothing to filter on
+            return (self.sections, positions) if len(positions) else (None, None)
+        sections = route_query(query) if SECTION_ROUTING_ENABLED else None
+        if not sections:
+            return None, None
+        positions = self.section_index.positions(sections)
+        if len(positions) < SECTION_FILTER_MIN_CHUNKS:
+            return None, None
+        return sections, positions
+
+    @traced("faiss_search")
+    def dense_search(self, query_vector, k, positions=None):
+        query = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        _, hits = search_index(self.vector_db.index, query, k, positions)
+        return [int(pos) for pos in hits[0] if pos != -1]
+
+    @traced("bm25_search")
+    def lexical_search(self, query, k, allowed_positions=None):
+        return [pos for pos, _ in self.lexical_index.search(query, k, allowed_positions)]
+
+    @traced("docstore_fetch")
+    def get_documents(self, positions):
+        docs = []
+        for pos in positions:
+            doc = self.vector_db.docstore.search(self.vector_db.index_to_docstore_id[pos])
+            if not isinstance(doc, str):
+                docs.append(doc)
+        return docs
+
+    def retrieve(self, query, query_vector):
+        """Hybrid search with a precomputed query embedding."""
+        sections, positions = self.allowed_positions(query)
+        if self.lexical_index is None:
+            return self.get_documents(self.dense_search(query_vector, self.k, positions))
+        dense = self.dense_search(query_vector, self.candidates, positions)
+        allowed = self.section_index.position_set(sections) if sections else None
+        lexical = self.lexical_search(query, self.candidates, allowed)
+        return self.get_documents(reciprocal_rank_fusion([dense, lexical])[:self.k])
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        with span("embed_query"):
+            query_vector = self.vector_db.embedding_function.embed_query(query)
+        return self.retrieve(query, query_vector)
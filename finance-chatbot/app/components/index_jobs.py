@@ -0,0 +1,179 @@
+import fcntl
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.components.create_index import create_index, list_companies
+from app.components.vector_db import get_index_version
+from app.config.config import DB_FAISS_PATH, INDEX_JOB_WORKERS, INDEX_JOB_NICE
+
+from app.common.logger import get_logger
+from app.common.tracing import registry, start_trace, end_trace
+
+logger = get_logger(__name__)
+
+index_job_seconds = registry.histogram("finchat_index_job_seconds", "Background indexing job duration")
+
+def validate_company(company):
+    """Returns an error message unless company is a filing in data/, or None."""
+    if company not in list_companies():
+        return f"Unknown company: {company}"
+    return None
+
+def _lock_path(company):
+    return os.path.join(DB_FAISS_PATH, f".{company}.lock")
+
+def _init_worker():
+    # Indexing is batch work; leave the CPU to the processes serving chat
+    os.nice(INDEX_JOB_NICE)
+
+def _run_index_job(company):
+    """
+    Runs in the job pool. The file lock makes a build started by another server
+    process wait for that one to finish, after which create_index finds the index
+    up to date and returns straight away.
+    """
+    os.makedirs(DB_FAISS_PATH, exist_ok=True)
+    with open(_lock_path(company), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Spans here land in the job process; the trace logs their breakdown
+        trace = start_trace()
+        try:
+            create_index(file_name=company, force_reindex=False)
+        except Exception as e:
+            # Plain exception so the error message survives the trip back from the worker
+            raise RuntimeError(str(e)) from None
+        finally:
+            end_trace(f"index job {company}", trace)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _is_locked(company):
+    """True while any process is indexing company."""
+    try:
+        with open(_lock_path(company), "r") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            return False
+    except FileNotFoundError:
+        return False
+    except BlockingIOError:
+        return True
+
+def is_index_ready(company):
+    return get_index_version(company) is not None
+
+
+class IndexJob:
+    def __init__(self, company, future):
+        self.company = company
+        self.future = future
+        self.submitted = time.time()
+        self.finished = None
+        self.error = None
+
+    @property
+    def state(self):
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        return "failed" if self.error else "done"
+
+    def _finish(self, future):
+        self.finished = time.time()
+        self.error = future.exception()
+        index_job_seconds.observe(self.finished - self.submitted, state="failed" if self.error else "done")
+        if self.error:
+            logger.error(f"Indexing {self.company} failed: {self.error}")
+        else:
+            logger.info(f"Indexed {self.company} in {self.finished - self.submitted:.1f}s")
+
+
+class IndexJobQueue:
+    """
+    Runs create_index for a company in a separate process pool so a first-time
+    build doesn't hold a web worker. A request for a company that is already
+    queued or running joins that job instead of starting another.
+    """
+
+    def __init__(self, max_workers=INDEX_JOB_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn: forking a server process that already runs threads can deadlock the child
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+        return self._executor
+
+    def _on_done(self, job, future):
+        job._finish(future)
+        if isinstance(job.error, BrokenProcessPool):
+            with self._lock:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+
+    def submit(self, company):
+        # company names a lock file, so only filings in data/ get this far
+        error = validate_company(company)
+        if error:
+            raise ValueError(error)
+        with self._lock:
+            job = self._jobs.get(company)
+            if job is not None and not job.future.done():
+                logger.info(f"Joining the running index job for {company}")
+                return job
+            future = self._get_executor().submit(_run_index_job, company)
+            job = self._jobs[company] = IndexJob(company, future)
+        logger.info(f"Queued index job for {company}")
+        future.add_done_callback(lambda future: self._on_done(job, future))
+        return job
+
+    def status(self, company):
+        """
+        Job state for company as shown to the UI. Builds started by another server
+        process are seen through their lock file.
+        """
+        job = self._jobs.get(company)
+        if job is not None and not job.future.done():
+            state = job.state
+        elif _is_locked(company):
+            state = "running"
+        elif job is not None and job.error:
+            state = "failed"
+        elif is_index_ready(company):
+            state = "done"
+        else:
+            state = "not_indexed"
+
+        if state in ("queued", "running"):
+            message = f"Indexing {company} documents in the background..."
+        elif state == "done":
+            message = f"Successfully indexed {company} documents!"
+        elif state == "failed":
+            message = f"Error indexing {company}: {job.error}"
+        else:
+            message = f"{company} has not been indexed yet."
+        return {
+            "company": company,
+            "state": state,
+            "pending": state in ("queued", "running"),
+            "success": state != "failed",
+            "message": message,
+        }
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {job.company: job.state for job in jobs}
+
+
+index_jobs = IndexJobQueue()
@@ -0,0 +1,47 @@
+import hashlib
+import json
+import os
+
+# Stored next to index.faiss: per-file and per-page content hashes plus the
+# chunk ids each page produced, so changed pages can be replaced in place.
+MANIFEST_FILE = "manifest.json"
+# Bumped whenever chunks gain metadata that retrieval relies on; indexes built
+# with an older version are rebuilt. 2: 10-K section and statement tags.
+CHUNK_METADATA_VERSION = 2
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def new_file_entry(path):
+    return {"sha256": file_sha256(path), "pages": {}}
+
+def record_page(file_entry, page, chunks):
+    file_entry["pages"][str(page.metadata["page"])] = {
+        "sha256": text_sha256(page.page_content),
+        "ids": [chunk.id for chunk in chunks],
+    }
+
+def is_file_unchanged(manifest, path):
+    entry = manifest["files"].get(path)
+    return entry is not None and entry["sha256"] == file_sha256(path)
+
+def load_manifest(index_path):
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def save_manifest(index_path, manifest):
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
@@ -0,0 +1,104 @@
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from app.config.config import BM25_K1, BM25_B
+
+# Postings for every term, stored next to index.faiss and keyed by FAISS position
+LEXICAL_INDEX_FILE = "lexical.npz"
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/'][a-z0-9]+)*")
+
+def tokenize(text):
+    """Lowercased word tokens plus adjacent-word bigrams, so "operating income" matches as a phrase."""
+    words = TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class LexicalIndex:
+    """BM25 over a compact inverted index: one sorted vocabulary and flat postings arrays."""
+
+    def __init__(self, vocab, offsets, postings, term_freqs, doc_lengths):
+        self.term_ids = {term: i for i, term in enumerate(vocab)}
+        self.offsets = offsets
+        self.postings = postings
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.num_docs = len(doc_lengths)
+        self.avg_doc_length = float(doc_lengths.mean()) if self.num_docs else 0.0
+
+    @property
+    def nbytes(self):
+        arrays = self.offsets.nbytes + self.postings.nbytes + self.term_freqs.nbytes + self.doc_lengths.nbytes
+        # The term -> id dict is often as large as the postings
+        vocab = sys.getsizeof(self.term_ids) + sum(sys.getsizeof(term) for term in self.term_ids)
+        return arrays + vocab
+
+    def search(self, query, k, allowed_positions=None):
+        """Returns up to k (faiss position, bm25 score) pairs, best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            positions = self.postings[start:end]
+            tfs = self.term_freqs[start:end].astype(np.float32)
+            idf = np.log(1 + (self.num_docs - len(positions) + 0.5) / (len(positions) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[positions] / self.avg_doc_length)
+            for pos, score in zip(positions.tolist(), (idf * tfs * (BM25_K1 + 1) / (tfs + norm)).tolist()):
+                scores[pos] += score
+
+        if allowed_positions is not None:
+            scores = {pos: score for pos, score in scores.items() if pos in allowed_positions}
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def write_lexical_index(db, db_path):
+    """Builds the inverted index for every chunk of a LangChain FAISS store and saves it."""
+    term_postings = defaultdict(list)
+    doc_lengths = np.zeros(len(db.index_to_docstore_id), dtype=np.int32)
+    for pos, doc_id in db.index_to_docstore_id.items():
+        tokens = tokenize(db.docstore.search(doc_id).page_content)
+        doc_lengths[pos] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            term_postings[term].append((pos, tf))
+
+    vocab = sorted(term_postings)
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    postings, term_freqs = [], []
+    for i, term in enumerate(vocab):
+        entries = sorted(term_postings[term])
+        postings.extend(pos for pos, _ in entries)
+        term_freqs.extend(min(tf, np.iinfo(np.uint16).max) for _, tf in entries)
+        offsets[i + 1] = len(postings)
+
+    path = os.path.join(db_path, LEXICAL_INDEX_FILE)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        vocab=np.frombuffer("\n".join(vocab).encode("utf-8"), dtype=np.uint8),
+        offsets=offsets,
+        postings=np.asarray(postings, dtype=np.int32),
+        term_freqs=np.asarray(term_freqs, dtype=np.uint16),
+        doc_lengths=doc_lengths,
+    )
+    os.replace(tmp_path, path)
+
+
+def load_lexical_index(db_path):
+    path = os.path.join(db_path, LEXICAL_INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        vocab_text = data["vocab"].tobytes().decode("utf-8")
+        return LexicalIndex(
+            vocab=vocab_text.split("\n") if vocab_text else [],
+            offsets=data["offsets"],
+            postings=data["postings"],
+            term_freqs=data["term_freqs"],
+            doc_lengths=data["doc_lengths"],
+        )
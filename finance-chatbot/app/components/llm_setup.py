@@ -1,7 +1,8 @@
-from langchain_openai import ChatOpenAI
-from langchain_huggingface import HuggingFaceEndpoint
+from langchain_core.callbacks import BaseCallbackHandler
+
 from app.common.logger import get_logger
 from app.common.custom_exception import CustomException
+from app.common.tracing import llm_calls, llm_tokens
 
 from app.config.config import OPENAI_API_KEY, OPENAI_LLM_MODEL
 from app.config.config import HF_TOKEN, HF_LLM_MODEL
@@ -10,13 +11,39 @@ import os
 
 logger = get_logger(__name__)
 
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Counts LLM calls and the prompt/completion tokens they report, for /metrics."""
+
+    def on_llm_end(self, response, **kwargs):
+        llm_calls.inc()
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+        if not (prompt_tokens or completion_tokens):
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = token_usage.get("prompt_tokens", 0)
+            completion_tokens = token_usage.get("completion_tokens", 0)
+        if prompt_tokens:
+            llm_tokens.inc(prompt_tokens, type="prompt")
+        if completion_tokens:
+            llm_tokens.inc(completion_tokens, type="completion")
+
+
 def initialize_openai_llm():
     """Setup LLM components - renamed to match app.py expectations"""
     try:
+        from langchain_openai import ChatOpenAI
         logger.info(f"Initializing OpenAI LLM: {OPENAI_LLM_MODEL}")
         llm = ChatOpenAI(
             model=OPENAI_LLM_MODEL,
-            api_key=OPENAI_API_KEY
+            api_key=OPENAI_API_KEY,
+            # Report token usage on streamed answers too
+            stream_usage=True
         )
         logger.info(f"OpenAI LLM initialized successfully")
         return llm
@@ -27,6 +54,7 @@ def initialize_openai_llm():
 
 def initialize_hf_llm():
     try:
+        from langchain_huggingface import HuggingFaceEndpoint
         logger.info(f"Initializing HF LLM: {HF_LLM_MODEL}")
         llm = HuggingFaceEndpoint(
             repo_id=HF_LLM_MODEL,
@@ -42,6 +70,12 @@ def initialize_hf_llm():
         logger.error(str(error_message))
         raise error_message
 
+def initialize_fake_llm():
+    """Offline stand-in for benchmarks, see app/components/offline_models.py"""
+    from app.components.offline_models import FakeChatModel
+    logger.info("Initializing fake LLM (offline)")
+    return FakeChatModel()
+
 def initialize_llm():
     """Setup LLM components - renamed to match app.py expectations"""
     try:
@@ -49,10 +83,13 @@ def initialize_llm():
             llm = initialize_openai_llm()
         elif LLM_MODEL == "hf":
             llm = initialize_hf_llm()
+        elif LLM_MODEL == "fake":
+            llm = initialize_fake_llm()
         else:
             raise CustomException(f"Invalid LLM model: {LLM_MODEL}")
         if llm is None:
             raise CustomException(f"Failed to initialize LLM")
+        llm.callbacks = [TokenUsageHandler()]
         return llm
     except Exception as e:
         error_message = CustomException("Failed to initialize LLMs", e)
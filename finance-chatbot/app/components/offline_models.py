@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import re
+import time
+from typing import get_origin
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from app.components.lexical_index import tokenize
+from app.config.config import HASH_EMBEDDING_DIM, FAKE_LLM_LATENCY_SECONDS
+
+# Stand-ins for the embedding model and the LLM so benchmarks run without model
+# downloads or API keys (EMBEDDING_BACKEND=hash, LLM_MODEL=fake).
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic embeddings from signed, hashed word and bigram counts. Texts that
+    share terms land close together, so retrieval still behaves plausibly, and the
+    vectors are identical on every machine and run.
+    """
+
+    def __init__(self, dim=HASH_EMBEDDING_DIM):
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for term in tokenize(text):
+            digest = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+ORIGINAL_QUESTION = re.compile(r"Original Question:\s*(.+)")
+
+def _placeholder(annotation):
+    if annotation is bool:
+        return False
+    if annotation in (int, float):
+        return annotation(0)
+    if annotation is str:
+        return ""
+    if get_origin(annotation) is list:
+        return []
+    return None
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers after latency_seconds without calling anything. The
+    query-rewrite prompt is answered with its original question, so retrieval in the
+    pipeline still searches for something meaningful; every other prompt gets a
+    fixed reply. with_structured_output fills the schema with defaults (False for
+    the definition classifier).
+    """
+
+    latency_seconds: float = FAKE_LLM_LATENCY_SECONDS
+
+    @property
+    def _llm_type(self):
+        return "fake-offline"
+
+    def _reply(self, messages):
+        prompt = str(messages[-1].content) if messages else ""
+        match = ORIGINAL_QUESTION.search(prompt)
+        if match:
+            return match.group(1).strip()
+        return f"Offline answer ({len(prompt)} prompt characters)."
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        for word in re.findall(r"\S+\s*", self._reply(messages)):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    def with_structured_output(self, schema, **kwargs):
+        def respond(_):
+            if self.latency_seconds:
+                time.sleep(self.latency_seconds)
+            return schema(**{name: _placeholder(field.annotation) for name, field in schema.model_fields.items()})
+        return RunnableLambda(respond)
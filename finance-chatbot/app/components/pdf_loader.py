@@ -1,12 +1,19 @@
 import os
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from pypdf import PdfReader
 import numpy as np
 
 from app.common.logger import get_logger
 from app.common.custom_exception import CustomException
+from app.components.sections import SectionTagger
 
 from app.config.config import DATA_PATH, CHUNK_SIZE, CHUNK_OVERLAP
+from app.config.config import PDF_LOADER_WORKERS, PDF_PAGES_PER_TASK
 
 logger = get_logger(__name__)
 
@@ -38,6 +45,129 @@ def load_pdf_files(file_name=None):
         logger.error(str(error_message))
         raise error_message
 
+def _list_pdf_files(file_name=None):
+    if file_name:
+        data_path = os.path.join(DATA_PATH, f"{file_name}.pdf")
+        if not os.path.exists(data_path):
+            raise CustomException(f"Data path {data_path} does not exist")
+        return [data_path]
+    if not os.path.exists(DATA_PATH):
+        raise CustomException(f"Data path {DATA_PATH} does not exist")
+    return sorted(glob.glob(os.path.join(DATA_PATH, "*.pdf")))
+
+def _extract_pages(file_path, start, end):
+    """Runs in a worker process: extracts pages [start, end) of one PDF."""
+    reader = PdfReader(file_path)
+    total_pages = len(reader.pages)
+    pages = []
+    for page_number in range(start, end):
+        text = reader.pages[page_number].extract_text() or ""
+        pages.append(Document(
+            page_content=text,
+            metadata={"source": file_path, "page": page_number, "total_pages": total_pages}
+        ))
+    return pages
+
+def load_pdf_pages(file_name=None, num_workers=PDF_LOADER_WORKERS, pages_per_task=PDF_PAGES_PER_TASK):
+    """
+    Extracts PDF pages across a process pool and yields them in page order as
+    batches finish, so chunking and embedding overlap with parsing. Pages come in
+    order because a 10-K section runs on from the page its heading is on.
+    Logs pages per second for each file once all of its pages are done.
+    """
+    try:
+        logger.info(f"File name: {file_name}")
+        file_paths = _list_pdf_files(file_name)
+        if not file_paths:
+            logger.warning(f"No PDF files found in the data path {DATA_PATH}")
+            return
+
+        tasks = []
+        progress = {}
+        for file_path in file_paths:
+            total_pages = len(PdfReader(file_path).pages)
+            progress[file_path] = {"pages": total_pages, "remaining": total_pages, "start": None}
+            for start in range(0, total_pages, pages_per_task):
+                tasks.append((file_path, start, min(start + pages_per_task, total_pages)))
+
+        # Keep a bounded number of tasks in flight so extracted pages never pile up
+        # in memory when the consumer (splitting and embedding) is the slower side.
+        # Batches that finish ahead of an earlier one wait in ready and count too.
+        num_workers = max(1, num_workers)
+        max_in_flight = num_workers * 2
+        logger.info(f"Extracting {len(tasks)} page batches from {len(file_paths)} PDF files with {num_workers} workers")
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            pending = {}
+            ready = {}
+            next_task = 0
+            next_to_yield = 0
+            while next_to_yield < len(tasks):
+                while next_task < len(tasks) and len(pending) + len(ready) < max_in_flight:
+                    file_path, start, end = tasks[next_task]
+                    if progress[file_path]["start"] is None:
+                        progress[file_path]["start"] = time.perf_counter()
+                    pending[executor.submit(_extract_pages, file_path, start, end)] = next_task
+                    next_task += 1
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ready[pending.pop(future)] = future.result()
+
+                while next_to_yield in ready:
+                    file_path = tasks[next_to_yield][0]
+                    pages = ready.pop(next_to_yield)
+                    next_to_yield += 1
+                    yield from pages
+
+                    stats = progress[file_path]
+                    stats["remaining"] -= len(pages)
+                    if stats["remaining"] == 0:
+                        elapsed = time.perf_counter() - stats["start"]
+                        pages_per_second = stats["pages"] / elapsed if elapsed > 0 else float("inf")
+                        logger.info(
+                            f"Extracted {stats['pages']} pages from {file_path} "
+                            f"in {elapsed:.2f}s ({pages_per_second:.1f} pages/s)"
+                        )
+    except Exception as e:
+        error_message = CustomException("Error loading PDF pages", e)
+        logger.error(str(error_message))
+        raise error_message
+
+def get_chunk_id(page, chunk_number):
+    """Deterministic chunk id, so a page's chunks can be found and replaced later."""
+    return f"{os.path.basename(page.metadata['source'])}:{page.metadata['page']}:{chunk_number}"
+
+def stream_text_chunks(pages, on_page=None, tagger=None):
+    """
+    Splits pages into chunks one page at a time, as they arrive, and tags each
+    chunk with its 10-K section. Pass a tagger that has already observed the
+    earlier pages when pages is only part of a file.
+    on_page, if given, is called with each page and the chunks it produced.
+    """
+    try:
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            add_start_index=True)
+
+        tagger = tagger or SectionTagger()
+        num_pages = 0
+        num_chunks = 0
+        for page in pages:
+            num_pages += 1
+            chunks = tagger.tag(page, text_splitter.split_documents([page]))
+            for chunk_number, chunk in enumerate(chunks):
+                chunk.id = get_chunk_id(page, chunk_number)
+            if on_page:
+                on_page(page, chunks)
+            num_chunks += len(chunks)
+            yield from chunks
+        logger.info(f"Successfully created {num_chunks} text chunks from {num_pages} pages")
+    except Exception as e:
+        error_message = CustomException("Error creating text chunks", e)
+        logger.error(str(error_message))
+        raise error_message
+
 def create_text_chunks(documents):
     try:
         if not documents:
@@ -45,9 +175,13 @@ def create_text_chunks(documents):
         logger.info(f"Creating text chunks for {len(documents)} documents")
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=CHUNK_SIZE, 
-            chunk_overlap=CHUNK_OVERLAP)
+            chunk_overlap=CHUNK_OVERLAP,
+            add_start_index=True)
 
-        text_chunks = text_splitter.split_documents(documents)
+        tagger = SectionTagger()
+        text_chunks = []
+        for document in documents:
+            text_chunks.extend(tagger.tag(document, text_splitter.split_documents([document])))
         logger.info(f"Successfully created {len(text_chunks)} text chunks")
         return text_chunks
     except Exception as e:
@@ -0,0 +1,99 @@
+import re
+import threading
+
+import numpy as np
+
+from app.common.logger import get_logger
+
+from app.config.config import CLASSIFIER_EMBEDDING_MARGIN
+
+logger = get_logger(__name__)
+
+# Phrasings that only make sense as a request for a definition
+DEFINITION_PATTERNS = re.compile(
+    r"\b(define|definition of|meaning of|what is meant by|what does .{1,40} (mean|stand for)"
+    r"|explain (the )?(term|concept)|^(what|who) (is|are) (a|an) )",
+    re.IGNORECASE,
+)
+
+# Cues that the question asks about the company's reported numbers
+DATA_PATTERNS = re.compile(
+    r"\b(how (much|many)|did|was|were|has|have|increase[ds]?|decrease[ds]?|grow(th)?|grew|change[ds]?"
+    r"|compare[ds]?|total|reported|fiscal|quarter|year|(19|20)\d\d|company|its|their|percentage)\b",
+    re.IGNORECASE,
+)
+
+# Prototypes for the embedding fallback. Kept apart from the labeled set in
+# app/benchmarks/classifier_report.py so the report measures generalization.
+DEFINITION_PROTOTYPES = [
+    "What is EBITDA?",
+    "What does free cash flow mean?",
+    "Define working capital",
+    "What is a price to earnings ratio?",
+    "Explain the concept of goodwill impairment",
+    "What is deferred revenue?",
+    "What does diluted EPS stand for?",
+    "Meaning of return on equity",
+]
+DATA_PROTOTYPES = [
+    "What was the net income in 2024?",
+    "How much did revenue grow compared to last year?",
+    "What is the company's total debt?",
+    "How much cash did the company generate from operations?",
+    "What were research and development expenses?",
+    "What is the gross margin this year?",
+    "How many shares were repurchased?",
+    "What are the main risk factors?",
+]
+
+
+class DefinitionQueryClassifier:
+    """
+    Decides clear definition / company-data questions locally: keyword rules
+    first, then nearest-centroid over the finance embeddings. Returns None when
+    neither is confident, so the caller can fall back to the LLM.
+    """
+
+    def __init__(self, embedding_model, margin=CLASSIFIER_EMBEDDING_MARGIN):
+        self.embedding_model = embedding_model
+        self.margin = margin
+        self._centroids = None
+        self._lock = threading.Lock()
+
+    def _get_centroids(self):
+        with self._lock:
+            if self._centroids is None:
+                centroids = []
+                for prototypes in (DEFINITION_PROTOTYPES, DATA_PROTOTYPES):
+                    vectors = np.asarray(self.embedding_model.embed_documents(prototypes), dtype=np.float32)
+                    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                    centroid = vectors.mean(axis=0)
+                    centroids.append(centroid / np.linalg.norm(centroid))
+                self._centroids = np.stack(centroids)
+            return self._centroids
+
+    def classify_by_rules(self, query):
+        is_definition = bool(DEFINITION_PATTERNS.search(query))
+        is_data = bool(DATA_PATTERNS.search(query))
+        if is_definition != is_data:
+            return is_definition
+        return None
+
+    def classify_by_embedding(self, query):
+        vector = np.asarray(self.embedding_model.embed_query(query), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        definition_score, data_score = self._get_centroids() @ vector
+        if abs(definition_score - data_score) < self.margin:
+            return None
+        return bool(definition_score > data_score)
+
+    def classify(self, query):
+        """Returns (is_definition or None, method)."""
+        label = self.classify_by_rules(query)
+        if label is not None:
+            return label, "rules"
+        if self.embedding_model is not None:
+            label = self.classify_by_embedding(query)
+            if label is not None:
+                return label, "embedding"
+        return None, "llm"
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+
+from app.components.embeddings import get_embedding_model
+from app.components.llm_setup import initialize_llm
+from app.common.logger import get_logger
+from app.common.custom_exception import CustomException
+
+logger = get_logger(__name__)
+
+# One instance of each heavy resource per process, created on first use. Importing
+# a module no longer loads models, so CLI entry points and server boot only pay for
+# what they actually use.
+_resources = {}
+# Reentrant: a factory may itself need another resource (the classifier needs the embeddings)
+_lock = threading.RLock()
+
+# Resources that hold sockets or threads and must be recreated in a forked child.
+# The embedding model is plain memory and stays shared copy-on-write after a fork.
+FORK_UNSAFE = ("llm",)
+
+def get_resource(name, factory):
+    """Returns this process's instance of name, creating it with factory the first time."""
+    resource = _resources.get(name)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(name)
+            if resource is None:
+                start = time.perf_counter()
+                resource = factory()
+                _resources[name] = resource
+                logger.info(f"Loaded {name} in {time.perf_counter() - start:.2f}s")
+    return resource
+
+def _load_embeddings():
+    embedding_model = get_embedding_model()
+    if embedding_model is None:
+        raise CustomException("Failed to load embedding model")
+    return embedding_model
+
+def get_embeddings():
+    return get_resource("embeddings", _load_embeddings)
+
+def get_llm():
+    return get_resource("llm", initialize_llm)
+
+def warmup(embeddings=True, llm=True, probe=True):
+    """
+    Loads resources up front instead of on the first request. probe runs one
+    embedding so the model's first-call setup happens here too; skip it in a
+    process that is about to fork, since torch thread pools don't survive fork.
+    """
+    start = time.perf_counter()
+    if embeddings:
+        embedding_model = get_embeddings()
+        if probe:
+            embedding_model.embed_query("warmup")
+    if llm:
+        get_llm()
+    logger.info(f"Warmup finished in {time.perf_counter() - start:.2f}s")
+
+def loaded_resources():
+    return sorted(_resources)
+
+def _after_fork_in_child():
+    for name in FORK_UNSAFE:
+        _resources.pop(name, None)
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -1,14 +1,19 @@
 from langchain.chains import RetrievalQA
 from langchain.memory import ConversationBufferMemory
 from langchain_core.prompts import PromptTemplate
+from cachetools import LRUCache
+import threading
 
-from app.components.llm_setup import initialize_llm
-from app.components.vector_db import load_vector_db
+from app.components.resources import get_llm
+from app.components.vector_db_cache import vector_db_cache
+from app.components.hybrid_retriever import HybridRetriever
+from app.components.context_packer import PackedRetriever, pack_documents
 from app.common.logger import get_logger
 from app.common.custom_exception import CustomException
-from cachetools import LRUCache
+from app.common.tracing import traced, span
 
-from app.config.config import NUM_OF_DOCS_TO_RETRIEVE
+from app.config.config import NUM_OF_DOCS_TO_RETRIEVE, QA_CHAIN_REGISTRY_SIZE, RETRIEVAL_MODE
+from app.config.config import CONTEXT_PACKING_ENABLED
 
 logger = get_logger(__name__)
 
@@ -55,16 +60,9 @@ You are a precise and grounded assistant that answers financial report questions
 """
 
 
-llm = initialize_llm()
-
-# LRU cache for vector DBs
-vector_db_cache = LRUCache(maxsize=5)
-
 def get_vector_db_for_company(file_name=None):
     vector_db_name = "all" if file_name is None else file_name
-    if vector_db_name not in vector_db_cache:
-        vector_db_cache[vector_db_name] = load_vector_db(vector_db_name)
-    return vector_db_cache[vector_db_name]
+    return vector_db_cache.get(vector_db_name)
 
 def get_prompt():
     return PromptTemplate(
@@ -72,26 +70,126 @@ def get_prompt():
         input_variables=["context", "question"]
     )
 
-def build_qa_chain(file_name=None):
+# Ready-to-use QA chains keyed by (index name, k, sections), shared across requests.
+# Each entry remembers the vector db it was built on; when the cache hands out a
+# different one (the index was rebuilt or evicted and reloaded) the chain is rebuilt.
+# A chain keeps its db alive, so entries only exist for dbs vector_db_cache holds
+# and are dropped with them; otherwise the cache's byte budget would not bound memory.
+qa_chain_registry = LRUCache(maxsize=QA_CHAIN_REGISTRY_SIZE)
+qa_chain_registry_lock = threading.Lock()
+
+def _drop_qa_chains(name):
+    with qa_chain_registry_lock:
+        for key in [key for key in qa_chain_registry if key[0] == name]:
+            del qa_chain_registry[key]
+
+vector_db_cache.add_eviction_listener(_drop_qa_chains)
+
+def _hybrid_retriever(vector_db, k, sections):
+    """
+    HybridRetriever for indexes with BM25 postings in hybrid mode, or with section
+    metadata in either mode; None for plain dense search.
+    """
+    lexical_index = getattr(vector_db, "lexical_index", None) if RETRIEVAL_MODE == "hybrid" else None
+    section_index = getattr(vector_db, "section_index", None)
+    if lexical_index is None and section_index is None:
+        return None
+    return HybridRetriever(
+        vector_db=vector_db, lexical_index=lexical_index, section_index=section_index, sections=sections, k=k
+    )
+
+def get_retriever(vector_db, k, sections=None):
+    retriever = _hybrid_retriever(vector_db, k, sections)
+    if retriever is None:
+        retriever = vector_db.as_retriever(search_kwargs={"k": k})
+    if CONTEXT_PACKING_ENABLED:
+        retriever = PackedRetriever(retriever=retriever)
+    return retriever
+
+def retrieve_by_vector(vector_db, query, query_vector, k=NUM_OF_DOCS_TO_RETRIEVE, sections=None):
+    """The documents get_retriever(vector_db, k, sections) returns for query, reusing an already computed embedding."""
+    retriever = _hybrid_retriever(vector_db, k, sections)
+    if retriever is not None:
+        docs = retriever.retrieve(query, query_vector)
+    else:
+        with span("faiss_search"):
+            docs = vector_db.similarity_search_by_vector(query_vector, k=k)
+    if CONTEXT_PACKING_ENABLED:
+        docs = pack_documents(docs)
+    return docs
+
+def _create_qa_chain(vector_db, k, sections=None):
+    retriever = get_retriever(vector_db, k, sections)
+
+    return RetrievalQA.from_chain_type(
+        llm=get_llm(),
+        chain_type="stuff",
+        retriever=retriever,
+        return_source_documents=True,
+        chain_type_kwargs={
+            "prompt": get_prompt()}
+    )
+
+@traced("build_qa_chain")
+def build_qa_chain(file_name=None, k=NUM_OF_DOCS_TO_RETRIEVE, sections=None):
+    """
+    Returns the shared QA chain for this index and retrieval settings, building it
+    only on first use or after the underlying index has been rebuilt. sections, a
+    tuple from resolve_sections, limits retrieval to those 10-K sections.
+    The chain holds no per-request state, so concurrent requests can invoke it.
+    """
     try:
         vector_db = get_vector_db_for_company(file_name=file_name)
         if vector_db is None:
             raise CustomException("Vector database not found")
-        
-        retriever = vector_db.as_retriever(search_kwargs={"k": NUM_OF_DOCS_TO_RETRIEVE})
-
-
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm, 
-            chain_type="stuff", 
-            retriever=retriever,
-            return_source_documents=True,
-            chain_type_kwargs={
-                "prompt": get_prompt()}
-        )
-        logger.info("QA Retriever initialized successfully")
+
+        key = ("all" if file_name is None else file_name, k, sections)
+        with qa_chain_registry_lock:
+            entry = qa_chain_registry.get(key)
+            if entry is not None and entry[0] is vector_db:
+                return entry[1]
+
+        qa_chain = _create_qa_chain(vector_db, k, sections)
+        with qa_chain_registry_lock:
+            # Checked under the registry lock: a db dropped after this check has its
+            # listener call wait for the lock and remove the entry
+            if vector_db_cache.holds(key[0], vector_db):
+                qa_chain_registry[key] = (vector_db, qa_chain)
+        logger.info(f"QA Retriever initialized successfully for {key}")
         return qa_chain
     except Exception as e:
         error_message = CustomException("Failed to initialize retriever", e)
         logger.error(str(error_message))
-        raise error_message
\ No newline at end of file
+        raise error_message
+
+def stream_qa_answer(question, source_documents):
+    """
+    Streams the answer for already retrieved documents, yielding text as the LLM
+    produces it. Uses the same prompt and context layout as the "stuff" chain.
+    """
+    context = "\n\n".join(doc.page_content for doc in source_documents)
+    for chunk in (get_prompt() | get_llm()).stream({"context": context, "question": question}):
+        text = chunk.content if hasattr(chunk, "content") else str(chunk)
+        if text:
+            yield text
+
+async def astream_qa_answer(question, source_documents):
+    """Async form of stream_qa_answer."""
+    context = "\n\n".join(doc.page_content for doc in source_documents)
+    async for chunk in (get_prompt() | get_llm()).astream({"context": context, "question": question}):
+        text = chunk.content if hasattr(chunk, "content") else str(chunk)
+        if text:
+            yield text
+
+def stream_qa(query, file_name=None, k=NUM_OF_DOCS_TO_RETRIEVE, sections=None):
+    """
+    Yields ("sources", documents) as soon as retrieval finishes, then ("token", text)
+    for each piece of the answer as it is generated.
+    """
+    qa_chain = build_qa_chain(file_name=file_name, k=k, sections=sections)
+    with span("retrieval"):
+        source_documents = qa_chain.retriever.invoke(query)
+    yield "sources", source_documents
+    with span("generation"):
+        for text in stream_qa_answer(query, source_documents):
+            yield "token", text
@@ -0,0 +1,66 @@
+import os
+import sqlite3
+from collections import defaultdict
+
+import numpy as np
+
+from app.components.docstore import DOCSTORE_FILE
+
+
+class SectionIndex:
+    """
+    FAISS positions of the chunks in each 10-K section and statement type, read
+    from the chunk metadata once per loaded index. Filters are cached, since the
+    routing rules only ever produce a handful of section combinations.
+    """
+
+    def __init__(self, section_positions):
+        self.section_positions = section_positions
+        self._arrays = {}
+        self._sets = {}
+
+    @property
+    def nbytes(self):
+        return sum(positions.nbytes for positions in self.section_positions.values())
+
+    def positions(self, sections):
+        """Sorted int64 positions of the chunks tagged with any of sections."""
+        key = tuple(sorted(sections))
+        positions = self._arrays.get(key)
+        if positions is None:
+            arrays = [self.section_positions[s] for s in key if s in self.section_positions]
+            positions = np.unique(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int64)
+            self._arrays[key] = positions
+        return positions
+
+    def position_set(self, sections):
+        """positions(sections) as a set, for filtering the lexical ranking."""
+        key = tuple(sorted(sections))
+        positions = self._sets.get(key)
+        if positions is None:
+            positions = self._sets[key] = frozenset(self.positions(key).tolist())
+        return positions
+
+
+def load_section_index(db_path):
+    """The section index of a saved index, or None when its chunks carry no section metadata."""
+    path = os.path.join(db_path, DOCSTORE_FILE)
+    if not os.path.exists(path):
+        return None
+    section_positions = defaultdict(list)
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for pos, section, statement in conn.execute(
+            "SELECT pos, json_extract(metadata, '$.section'), json_extract(metadata, '$.statement') FROM docs"
+        ):
+            for label in (section, statement):
+                if label:
+                    section_positions[label].append(pos)
+    finally:
+        conn.close()
+    if not section_positions:
+        return None
+    return SectionIndex({
+        label: np.asarray(sorted(positions), dtype=np.int64)
+        for label, positions in section_positions.items()
+    })
@@ -0,0 +1,169 @@
+import re
+
+# Where a chunk sits in a 10-K: the item it belongs to, detected from the "Item 1A."
+# style headings, and for the financial statement pages the statement type. Chunks
+# carry both as "section" and "statement" metadata so retrieval can be limited to
+# the parts of a filing a question is about.
+
+ITEM_SECTIONS = {
+    "1": "business",
+    "1a": "risk_factors",
+    "1b": "unresolved_staff_comments",
+    "1c": "cybersecurity",
+    "2": "properties",
+    "3": "legal_proceedings",
+    "4": "mine_safety_disclosures",
+    "5": "market_for_equity",
+    "6": "reserved",
+    "7": "mda",
+    "7a": "market_risk",
+    "8": "financial_statements",
+    "9": "accountant_changes",
+    "9a": "controls_and_procedures",
+    "9b": "other_information",
+    "9c": "foreign_jurisdiction_inspections",
+    "10": "governance",
+    "11": "executive_compensation",
+    "12": "security_ownership",
+    "13": "related_transactions",
+    "14": "accountant_fees",
+    "15": "exhibits",
+    "16": "form_10k_summary",
+}
+
+# Statement pages start with one of these headings, alone on a line near the top
+STATEMENT_HEADINGS = {
+    "income_statement": re.compile(
+        r"(consolidated )?(statements? of (operations|income|earnings)|income statements?)", re.IGNORECASE
+    ),
+    "balance_sheet": re.compile(r"(consolidated )?balance sheets?", re.IGNORECASE),
+    "cash_flow": re.compile(r"(consolidated )?(statements? of cash flows?|cash flows? statements?)", re.IGNORECASE),
+}
+STATEMENT_TITLES = {
+    "income_statement": "Income statement",
+    "balance_sheet": "Balance sheet",
+    "cash_flow": "Cash flow statement",
+}
+HEADING_LINES = 12
+
+SECTIONS = tuple(ITEM_SECTIONS.values()) + tuple(STATEMENT_HEADINGS)
+
+# "Item 1A. Risk Factors" on a line of its own. The period and the capitalised
+# title keep cross-references ("Item 1A of this Form 10-K") from matching.
+ITEM_HEADING = re.compile(r"(?i:item)\s+(\d{1,2}[A-Ca-c]?)\.\s*([A-Z][^.]{0,120})?")
+# A page listing this many items is the table of contents, not the start of one
+TOC_MIN_ITEMS = 4
+
+# Cheap query-to-section routing: any rule whose pattern matches adds its sections
+QUERY_SECTIONS = [
+    (re.compile(r"\brisks?\b|\buncertaint", re.IGNORECASE), ("risk_factors", "market_risk")),
+    (re.compile(r"\b(lawsuits?|litigation|legal proceedings|antitrust|investigations?)\b", re.IGNORECASE),
+     ("legal_proceedings", "risk_factors", "financial_statements")),
+    (re.compile(r"\bcyber", re.IGNORECASE), ("cybersecurity", "risk_factors")),
+    (re.compile(r"\b(interest rates?|foreign (currency|exchange)|market risk|hedg)", re.IGNORECASE),
+     ("market_risk", "financial_statements")),
+    (re.compile(r"\b(dividends?|repurchases?|buybacks?|stock price|holders of record)\b", re.IGNORECASE),
+     ("market_for_equity", "mda", "financial_statements")),
+    (re.compile(r"\b(properties|facilities|headquarters|square feet)\b", re.IGNORECASE), ("properties",)),
+    (re.compile(r"\b(internal control|controls and procedures)\b", re.IGNORECASE), ("controls_and_procedures",)),
+    (re.compile(r"\b(income statements?|statements? of (operations|income))\b", re.IGNORECASE), ("income_statement",)),
+    (re.compile(r"\bbalance sheets?\b", re.IGNORECASE), ("balance_sheet",)),
+    (re.compile(r"\b(cash flow statements?|statements? of cash flows)\b", re.IGNORECASE), ("cash_flow",)),
+    (re.compile(
+        r"\b(revenues?|net sales|net income|operating income|gross (margin|profit)|earnings|eps|per share|"
+        r"operating expenses|cost of (sales|revenues?)|cash flows?|total assets|liabilities|"
+        r"(shareholders|stockholders)'? equity|margins?)\b", re.IGNORECASE),
+     ("mda", "financial_statements")),
+]
+
+def find_statement_heading(lines):
+    """(statement type, line number) of a statement heading near the top of a page's lines, or (None, None)."""
+    for i, line in enumerate(lines[:HEADING_LINES]):
+        for statement, heading in STATEMENT_HEADINGS.items():
+            if heading.fullmatch(line):
+                return statement, i
+    return None, None
+
+def item_headings(text):
+    """(character offset, section) of each item heading in a page, unless the page is a table of contents."""
+    headings = []
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        match = ITEM_HEADING.fullmatch(line.strip())
+        if match and match.group(1).lower() in ITEM_SECTIONS:
+            headings.append((offset, ITEM_SECTIONS[match.group(1).lower()]))
+        offset += len(line)
+    if len({section for _, section in headings}) >= TOC_MIN_ITEMS:
+        return []
+    return headings
+
+
+class SectionTagger:
+    """
+    Adds "section" and "statement" metadata to the chunks of each page. A 10-K
+    item runs until the next item heading, so pages must be tagged in page order;
+    observe every page of a file first when only some of its pages are chunked.
+    """
+
+    def __init__(self):
+        self._current = {}
+        self._page_start = {}
+
+    def observe(self, page):
+        """Records the section in effect at the top of page and returns the page's headings."""
+        source, number = page.metadata.get("source"), page.metadata.get("page")
+        start = self._page_start.setdefault((source, number), self._current.get(source))
+        headings = item_headings(page.page_content)
+        self._current[source] = headings[-1][1] if headings else start
+        return start, headings
+
+    def tag(self, page, chunks):
+        section, headings = self.observe(page)
+        lines = [line.strip() for line in page.page_content.splitlines() if line.strip()]
+        statement, _ = find_statement_heading(lines)
+        for chunk in chunks:
+            # The section in effect where the chunk starts, or else the first one it opens
+            start = chunk.metadata.get("start_index", 0)
+            chunk_section = section
+            for offset, heading_section in headings:
+                if offset <= start or (chunk_section is None and offset < start + len(chunk.page_content)):
+                    chunk_section = heading_section
+            if chunk_section:
+                chunk.metadata["section"] = chunk_section
+            if statement:
+                chunk.metadata["statement"] = statement
+        return chunks
+
+def resolve_sections(names):
+    """
+    Section filter from an API parameter: section names, statement types or item
+    numbers ("1A", "item_7"). Raises ValueError for anything else.
+    """
+    if isinstance(names, str):
+        names = names.split(",")
+    if not isinstance(names, (list, tuple)):
+        raise ValueError("Sections must be a list or a comma-separated string")
+    sections = []
+    for name in names:
+        key = str(name).strip().lower().replace(" ", "_")
+        if not key:
+            continue
+        item = key.removeprefix("item_").removeprefix("item")
+        section = ITEM_SECTIONS.get(item, key)
+        if section not in SECTIONS:
+            raise ValueError(f"Unknown section: {name}. Expected one of {', '.join(SECTIONS)}")
+        if section not in sections:
+            sections.append(section)
+    return tuple(sections) or None
+
+def route_query(query):
+    """The sections a question is most likely answered from, or None to search the whole filing."""
+    sections = []
+    for pattern, rule_sections in QUERY_SECTIONS:
+        if pattern.search(query):
+            sections.extend(section for section in rule_sections if section not in sections)
+    return tuple(sections) or None
+
+def cache_namespace(namespace, sections):
+    """Answer cache namespace for answers retrieved from sections only; routed queries share the plain one."""
+    return f"{namespace}:{'+'.join(sections)}" if sections else namespace
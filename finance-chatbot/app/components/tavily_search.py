@@ -1,25 +1,178 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import numpy as np
 from langchain_tavily import TavilySearch
-from app.config.config import TAVILY_API_KEY
+from app.config.config import TAVILY_API_KEY, TAVILY_BACKEND, TAVILY_TIMEOUT_SECONDS
+from app.config.config import DEFINITION_CACHE_PATH, DEFINITION_CACHE_TTL_SECONDS
+from app.config.config import GLOSSARY_ENABLED, GLOSSARY_PATH, GLOSSARY_SIMILARITY_THRESHOLD
+from app.components.resources import get_embeddings
 from app.common.logger import get_logger
 from app.common.custom_exception import CustomException
 
 logger = get_logger(__name__)
 
+QUESTION_PREFIX = re.compile(
+    r"^(what\s+(is|are)\s+(meant\s+by\s+)?|define\s+|definition\s+of\s+|meaning\s+of\s+"
+    r"|explain\s+(the\s+)?(term|concept)\s+(of\s+)?|what\s+does\s+)((a|an|the)\s+)?"
+)
+QUESTION_SUFFIX = re.compile(r"\s+(mean|stand\s+for)$")
+
+def normalize_term(query):
+    """'What is the P/E ratio?' and 'define p/e ratio' both normalize to 'p/e ratio'."""
+    term = re.sub(r"[?!.,;:\"']+", " ", query.lower())
+    term = re.sub(r"\s+", " ", term).strip()
+    term = QUESTION_PREFIX.sub("", term)
+    return QUESTION_SUFFIX.sub("", term).strip()
+
+
+class DefinitionCache:
+    """Persistent normalized term -> definition cache with a TTL, shared by all workers."""
+
+    def __init__(self, path, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._conn_pid = None
+
+    def _connect(self):
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS definitions ("
+            "term TEXT PRIMARY KEY, definition TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        conn.commit()
+        return conn
+
+    @property
+    def _conn(self):
+        # Opened on first use, and again in a forked child (gunicorn --preload):
+        # a sqlite connection must not be shared between processes
+        if self._conn_pid != os.getpid():
+            self._connection = self._connect()
+            self._conn_pid = os.getpid()
+        return self._connection
+
+    def get(self, term):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT definition, created FROM definitions WHERE term = ?", (term,)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return row[0]
+
+    def put(self, term, definition):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO definitions (term, definition, created) VALUES (?, ?, ?)",
+                (term, definition, time.time())
+            )
+            self._conn.commit()
+
+
+class Glossary:
+    """Local glossary searched by embedding similarity of the query to each term."""
+
+    def __init__(self, path, threshold):
+        self.path = path
+        self.threshold = threshold
+        self._entries = None
+        self._vectors = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._entries is None:
+                embedding_model = get_embeddings()
+                with open(self.path) as f:
+                    entries = json.load(f)
+                vectors = np.asarray(
+                    embedding_model.embed_documents([entry["term"] for entry in entries]), dtype=np.float32
+                )
+                self._vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+                self._embed_query = embedding_model.embed_query
+                self._entries = entries
+                logger.info(f"Loaded {len(entries)} glossary terms from {self.path}")
+
+    def lookup(self, term):
+        if not GLOSSARY_ENABLED or not os.path.exists(self.path):
+            return None
+        self._load()
+        vector = np.asarray(self._embed_query(term), dtype=np.float32)
+        similarities = self._vectors @ (vector / (np.linalg.norm(vector) or 1.0))
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        logger.info(f"Glossary hit for '{term}': {self._entries[best]['term']} ({similarities[best]:.3f})")
+        return self._entries[best]["definition"]
+
+
+definition_cache = DefinitionCache(DEFINITION_CACHE_PATH, DEFINITION_CACHE_TTL_SECONDS)
+glossary = Glossary(GLOSSARY_PATH, GLOSSARY_SIMILARITY_THRESHOLD)
+
+_client = None
+_client_lock = threading.Lock()
+# Remote lookups run here so a slow search service can be abandoned after a timeout
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tavily")
+
+def get_tavily_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TavilySearch(
+                api_key=TAVILY_API_KEY,
+                max_results=1,
+                topics=["finance"],
+                include_domains=["investopedia.com"]
+            )
+        return _client
+
+def _search(query):
+    if TAVILY_BACKEND == "stub":
+        # Offline stand-in: answers only from the glossary and cache
+        return None
+    response = get_tavily_client().run(query)
+    return response["results"][0]["content"]
+
 def tavily_lookup(query):
+    """
+    Returns a definition for the term in query, trying the local glossary, then the
+    persistent cache, then Tavily with a timeout. Returns None if none of them has
+    one, so the pipeline carries on without a definition.
+    """
     try:
-        tool = TavilySearch(
-            api_key=TAVILY_API_KEY,
-            max_results=1,
-            topics=["finance"],
-            include_domains=["investopedia.com"]
-        )
-        response = tool.run(query)
-        logger.info(f"Tavily results: {response["results"][0]["content"]}")
-        return response["results"][0]["content"]
+        term = normalize_term(query)
+        definition = glossary.lookup(term)
+        if definition:
+            return definition
+
+        definition = definition_cache.get(term)
+        if definition:
+            logger.info(f"Definition cache hit for '{term}'")
+            return definition
+
+        definition = _executor.submit(_search, query).result(timeout=TAVILY_TIMEOUT_SECONDS)
+        if definition:
+            logger.info(f"Tavily results: {definition}")
+            definition_cache.put(term, definition)
+        return definition
+    except FutureTimeoutError:
+        logger.warning(f"Tavily lookup timed out after {TAVILY_TIMEOUT_SECONDS}s for '{query}'")
+        return None
     except Exception as e:
         error_message = CustomException("Error calling Tavily API", e)
         logger.error(str(error_message))
         return None
 
 if __name__ == "__main__":
-    print(tavily_lookup("What is the P/E ratio?"))
\ No newline at end of file
+    print(tavily_lookup("What is the P/E ratio?"))
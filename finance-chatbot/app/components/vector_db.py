@@ -1,30 +1,263 @@
 import os
+import sys
+import json
+import math
+import shutil
+import time
+import uuid
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
 
-from app.components.embeddings import get_embedding_model
+from app.components.resources import get_embeddings
+from app.components.docstore import DOCSTORE_FILE, write_docstore, load_docstore
+from app.components.lexical_index import LEXICAL_INDEX_FILE, write_lexical_index, load_lexical_index
+from app.components.section_index import load_section_index
 from app.common.logger import get_logger
 from app.common.custom_exception import CustomException
+from app.common.tracing import traced
 
-from app.config.config import DB_FAISS_PATH
+from app.config.config import DB_FAISS_PATH, EMBEDDING_BATCH_SIZE
+from app.config.config import FAISS_INDEX_TYPE, FAISS_TRAIN_SAMPLE_SIZE
+from app.config.config import FAISS_HNSW_M, FAISS_HNSW_EF_SEARCH, FAISS_IVF_NLIST, FAISS_IVF_NPROBE
+from app.config.config import FAISS_PQ_M, FAISS_PQ_NBITS
+from app.config.config import VECTOR_DB_MMAP
 
 logger = get_logger(__name__)
-embedding_model = get_embedding_model()
-if embedding_model is None:
-    raise CustomException("Embedding model not found")
 
-def load_vector_db(file_name=None):
+def get_db_path(file_name=None):
+    if file_name:
+        return os.path.join(DB_FAISS_PATH, file_name)
+    return os.path.join(DB_FAISS_PATH, 'all')
+
+# Every save writes its index.faiss, docstore and lexical postings into a new
+# generation directory, then points CURRENT at it with one os.replace. A load reads
+# CURRENT once, so it never pairs an index with the chunks of another save, and a
+# loaded index keeps reading its own generation while the next one is written.
+CURRENT_FILE = "CURRENT"
+GENERATIONS_KEPT = 2 # the current generation, and the previous one for indexes still being served
+LEGACY_FILES = ("index.faiss", DOCSTORE_FILE, LEXICAL_INDEX_FILE, "index.pkl")
+
+def get_generation_path(db_path):
+    """Directory with the current files of a saved index; db_path itself for indexes saved before generations."""
     try:
-        if file_name:
-            db_path = os.path.join(DB_FAISS_PATH, file_name)
+        with open(os.path.join(db_path, CURRENT_FILE)) as f:
+            return os.path.join(db_path, f.read().strip())
+    except FileNotFoundError:
+        return db_path
+
+def _generation_version(db_path, generation_path):
+    if generation_path != db_path:
+        return os.path.basename(generation_path)
+    index_file = os.path.join(db_path, "index.faiss")
+    if not os.path.exists(index_file):
+        return None
+    stat = os.stat(index_file)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+def get_index_version(file_name=None):
+    """Cheap fingerprint of a saved index; changes every time the index is re-saved."""
+    db_path = get_db_path(file_name)
+    return _generation_version(db_path, get_generation_path(db_path))
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq8")
+TRAINED_INDEX_TYPES = ("ivf_flat", "ivf_pq", "sq8")
+
+def new_faiss_index(dim, train_vectors=None, index_type=FAISS_INDEX_TYPE):
+    """
+    Creates an empty FAISS index of the configured type, trained on train_vectors
+    when the type needs training. IVF list count and PQ code size shrink to fit
+    small training samples.
+    """
+    if index_type == "flat":
+        description = "Flat"
+    elif index_type == "hnsw":
+        description = f"HNSW{FAISS_HNSW_M}"
+    elif index_type == "sq8":
+        description = "SQ8"
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        num_train = len(train_vectors)
+        nlist = max(1, min(FAISS_IVF_NLIST, num_train // 39))
+        if index_type == "ivf_flat":
+            description = f"IVF{nlist},Flat"
         else:
-            db_path = os.path.join(DB_FAISS_PATH, 'all')
+            pq_m = max(m for m in range(1, FAISS_PQ_M + 1) if dim % m == 0)
+            nbits = max(1, min(FAISS_PQ_NBITS, int(math.log2(num_train))))
+            description = f"IVF{nlist},PQ{pq_m}x{nbits}"
+    else:
+        raise CustomException(f"Invalid FAISS index type: {index_type}. Expected one of {INDEX_TYPES}")
+
+    index = faiss.index_factory(dim, description)
+    if not index.is_trained:
+        index.train(np.asarray(train_vectors, dtype=np.float32))
+    logger.info(f"Created FAISS index {description} ({index_type})")
+    return index
+
+# Index types that can drop vectors in place. HNSW graphs cannot remove vectors,
+# and IVF indexes keep each vector's original label after remove_ids, which no
+# longer matches the positions LangChain renumbers index_to_docstore_id to.
+UPDATABLE_INDEX_TYPES = ("flat", "sq8")
+
+def supports_delete(index):
+    """Whether vectors can be removed from index with positions staying in step with the docstore."""
+    return not isinstance(faiss.downcast_index(index), (faiss.IndexHNSW, faiss.IndexIVF))
+
+def apply_search_params(index):
+    parameter_space = faiss.ParameterSpace()
+    for name, value in (("nprobe", FAISS_IVF_NPROBE), ("efSearch", FAISS_HNSW_EF_SEARCH)):
+        try:
+            parameter_space.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass # parameter does not apply to this index type
+
+def search_index(index, query, k, positions=None):
+    """
+    index.search, restricted to the vectors at positions (an int64 array) when
+    given. The filter is applied inside FAISS while it scans, so a restricted
+    search still returns k hits from the allowed vectors.
+    """
+    if positions is None:
+        return index.search(query, k)
+    selector = faiss.IDSelectorBatch(len(positions), faiss.swig_ptr(positions))
+    inner = faiss.downcast_index(index)
+    # Search parameters replace the index's own nprobe / efSearch, so carry them over
+    if isinstance(inner, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = inner.nprobe
+    elif isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = inner.hnsw.efSearch
+    else:
+        params = faiss.SearchParameters()
+    params.sel = selector
+    return index.search(query, k, params=params)
+
+def _index_heap_bytes(index, index_file, mmapped):
+    """
+    Bytes a loaded FAISS index holds in the heap. A memory-mapped index keeps its
+    vectors in the OS page cache, so only what faiss still reads into memory
+    counts: the HNSW graph or the IVF centroids.
+    """
+    if not mmapped:
+        return os.path.getsize(index_file)
+    inner = faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        hnsw = inner.hnsw
+        return hnsw.neighbors.size() * 4 + hnsw.levels.size() * 4 + hnsw.offsets.size() * 8
+    if isinstance(inner, faiss.IndexIVF):
+        return inner.quantizer.ntotal * inner.d * 4
+    return 0
 
-        if os.path.exists(db_path):
+def get_memory_footprint(db):
+    """
+    Heap bytes a loaded vector db occupies: the FAISS index (see _index_heap_bytes),
+    the lexical postings and section index, and the docstore and position map when
+    they are held in memory. SQLite docstores and position maps read per hit and
+    are not counted.
+    """
+    size = getattr(db, "index_heap_bytes", 0)
+    for structure in (getattr(db, "lexical_index", None), getattr(db, "section_index", None)):
+        if structure is not None:
+            size += structure.nbytes
+    if isinstance(db.index_to_docstore_id, dict):
+        size += sys.getsizeof(db.index_to_docstore_id)
+        size += sum(sys.getsizeof(doc_id) for doc_id in db.index_to_docstore_id.values())
+    if isinstance(db.docstore, InMemoryDocstore):
+        size += sum(
+            sys.getsizeof(doc.page_content) + sys.getsizeof(json.dumps(doc.metadata))
+            for doc in db.docstore._dict.values()
+        )
+    return size
+
+def _read_index(index_file, mmap):
+    """Returns the index and whether it is memory-mapped."""
+    if mmap:
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        try:
+            return faiss.read_index(index_file, flags), True
+        except RuntimeError as e:
+            logger.warning(f"Memory-mapping {index_file} is not supported, reading it into memory: {e}")
+    return faiss.read_index(index_file), False
+
+def _remove_old_generations(db_path):
+    generations = sorted(name for name in os.listdir(db_path) if name.startswith("gen-"))
+    for name in generations[:-GENERATIONS_KEPT]:
+        shutil.rmtree(os.path.join(db_path, name), ignore_errors=True)
+    if len(generations) >= GENERATIONS_KEPT:
+        # Files of an index saved before generations, now older than the previous one
+        for file in LEGACY_FILES:
+            path = os.path.join(db_path, file)
+            if os.path.exists(path):
+                os.remove(path)
+
+@traced("save_vector_db")
+def save_vector_db(db, db_path):
+    """
+    Saves the index as index.faiss plus a compact docstore.sqlite and the lexical
+    postings, all in a new generation directory, and then makes that generation
+    current (see get_generation_path).
+    """
+    os.makedirs(db_path, exist_ok=True)
+    generation = f"gen-{time.time_ns()}"
+    generation_path = os.path.join(db_path, generation)
+    os.makedirs(generation_path)
+    write_docstore(db, generation_path)
+    write_lexical_index(db, generation_path)
+    faiss.write_index(db.index, os.path.join(generation_path, "index.faiss"))
+
+    current_file = os.path.join(db_path, CURRENT_FILE)
+    with open(f"{current_file}.tmp", "w") as f:
+        f.write(generation)
+    os.replace(f"{current_file}.tmp", current_file)
+    _remove_old_generations(db_path)
+
+@traced("load_vector_db")
+def load_vector_db(file_name=None, writable=False):
+    """
+    Loads a saved index. By default the FAISS vectors are memory-mapped, so workers
+    share them through the OS page cache, and chunks are read from SQLite only for
+    the hits a search returns. writable=True loads everything into memory so the
+    index can be updated, merged and re-saved.
+    """
+    try:
+        db_path = get_db_path(file_name)
+        # Resolved once: everything below is read from this one generation
+        generation_path = get_generation_path(db_path)
+
+        if os.path.exists(os.path.join(generation_path, DOCSTORE_FILE)):
+            logger.info(f"Loading vector database from {db_path}")
+            load_start = time.perf_counter()
+            index_file = os.path.join(generation_path, "index.faiss")
+            index, mmapped = _read_index(index_file, mmap=VECTOR_DB_MMAP and not writable)
+            docstore, index_to_docstore_id = load_docstore(generation_path, writable=writable)
+            db = FAISS(
+                embedding_function=get_embeddings(),
+                index=index,
+                docstore=docstore,
+                index_to_docstore_id=index_to_docstore_id
+            )
+            apply_search_params(db.index)
+            db.lexical_index = load_lexical_index(generation_path)
+            db.section_index = load_section_index(generation_path)
+            db.index_version = _generation_version(db_path, generation_path)
+            db.index_heap_bytes = _index_heap_bytes(index, index_file, mmapped)
+            logger.info(f"Loaded vector database from {db_path} in {time.perf_counter() - load_start:.3f}s")
+            return db
+        elif os.path.exists(db_path):
+            # Indexes saved before docstore.sqlite existed
             logger.info(f"Loading vector database from {db_path}")
-            return FAISS.load_local(
+            db = FAISS.load_local(
                 db_path,
-                embedding_model,
+                get_embeddings(),
                 allow_dangerous_deserialization=True)
+            apply_search_params(db.index)
+            db.lexical_index = load_lexical_index(db_path)
+            db.section_index = None
+            db.index_version = _generation_version(db_path, db_path)
+            db.index_heap_bytes = os.path.getsize(os.path.join(db_path, "index.faiss"))
+            return db
         else:
             logger.info(f"No vector database found at {DB_FAISS_PATH}")
             return None
@@ -34,21 +267,164 @@ def load_vector_db(file_name=None):
         return None
 
 
-def create_vector_db(text_chunks, file_name=None):
+def _iter_batches(text_chunks, batch_size):
+    batch = []
+    for chunk in text_chunks:
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _new_db(text_embeddings, metadatas, ids):
+    """Creates the LangChain FAISS store around an index of the configured type."""
+    vectors = [vector for _, vector in text_embeddings]
+    index = new_faiss_index(len(vectors[0]), vectors)
+    db = FAISS(
+        embedding_function=get_embeddings(),
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={}
+    )
+    db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    apply_search_params(db.index)
+    return db
+
+@traced("embed_chunks")
+def _add_chunks(db, text_chunks, batch_size):
+    """
+    Embeds chunks in fixed-size batches and adds each batch to the index as soon as
+    it is embedded, creating the index when db is None. Index types that need
+    training buffer the first FAISS_TRAIN_SAMPLE_SIZE chunks to train on; after
+    that only one batch of chunks and vectors is held outside the index at a time.
+    """
+    num_chunks = 0
+    embedding_seconds = 0.0
+    train_size = FAISS_TRAIN_SAMPLE_SIZE if FAISS_INDEX_TYPE in TRAINED_INDEX_TYPES else 0
+    pending_embeddings, pending_metadatas, pending_ids = [], [], []
+    embedding_model = get_embeddings()
+    for batch in _iter_batches(text_chunks, batch_size):
+        texts = [chunk.page_content for chunk in batch]
+        metadatas = [chunk.metadata for chunk in batch]
+        ids = [chunk.id or str(uuid.uuid4()) for chunk in batch]
+
+        embedding_start = time.perf_counter()
+        vectors = embedding_model.embed_documents(texts)
+        embedding_seconds += time.perf_counter() - embedding_start
+        num_chunks += len(batch)
+
+        text_embeddings = list(zip(texts, vectors))
+        if db is not None:
+            db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            continue
+
+        pending_embeddings.extend(text_embeddings)
+        pending_metadatas.extend(metadatas)
+        pending_ids.extend(ids)
+        if len(pending_embeddings) >= train_size:
+            db = _new_db(pending_embeddings, pending_metadatas, pending_ids)
+            pending_embeddings, pending_metadatas, pending_ids = [], [], []
+
+    if db is None and pending_embeddings:
+        db = _new_db(pending_embeddings, pending_metadatas, pending_ids)
+
+    chunks_per_second = num_chunks / embedding_seconds if embedding_seconds > 0 else float("inf")
+    logger.info(f"Embedded {num_chunks} text chunks in {embedding_seconds:.2f}s ({chunks_per_second:.1f} chunks/s)")
+    if hasattr(embedding_model, "stats"):
+        logger.info(f"Embedding cache stats: {embedding_model.stats()}")
+    return db
+
+@traced("create_vector_db")
+def create_vector_db(text_chunks, file_name=None, batch_size=EMBEDDING_BATCH_SIZE):
+    """Builds the FAISS index from an iterable of chunks, see _add_chunks."""
     try:
-        if not text_chunks:
+        logger.info(f"Creating vector database in embedding batches of {batch_size}")
+        db_path = get_db_path(file_name)
+
+        build_start = time.perf_counter()
+        db = _add_chunks(None, text_chunks, batch_size)
+        if db is None:
             raise CustomException("No text chunks provided")
-        logger.info(f"Creating vector database with {len(text_chunks)} text chunks")
-        if file_name:
-            db_path = os.path.join(DB_FAISS_PATH, file_name)
-        else:
-            db_path = os.path.join(DB_FAISS_PATH, 'all')
-        db = FAISS.from_documents(text_chunks, embedding_model)
-        db.save_local(db_path)       
-        logger.info(f"Successfully created vector database at {db_path}")
+
+        save_vector_db(db, db_path)
+        logger.info(f"Successfully created vector database at {db_path} in {time.perf_counter() - build_start:.2f}s")
         return db
     except Exception as e:
         error_message = CustomException("Error creating vector database", e)
         logger.error(str(error_message))
         return None
-        
+
+@traced("update_vector_db")
+def update_vector_db(text_chunks, delete_ids, file_name=None, batch_size=EMBEDDING_BATCH_SIZE):
+    """
+    Updates a saved index in place: removes the vectors for delete_ids, then
+    embeds and adds text_chunks. Cost is proportional to the chunks that changed.
+    """
+    try:
+        db_path = get_db_path(file_name)
+        db = load_vector_db(file_name, writable=True)
+        if db is None:
+            raise CustomException(f"Vector database not found at {db_path}")
+
+        update_start = time.perf_counter()
+        if delete_ids:
+            if not supports_delete(db.index):
+                raise CustomException("Index type does not support removing vectors")
+            db.delete(list(delete_ids))
+            logger.info(f"Removed {len(delete_ids)} stale vectors from {db_path}")
+        db = _add_chunks(db, text_chunks, batch_size)
+
+        save_vector_db(db, db_path)
+        logger.info(f"Successfully updated vector database at {db_path} in {time.perf_counter() - update_start:.2f}s")
+        return db
+    except Exception as e:
+        error_message = CustomException("Error updating vector database", e)
+        logger.error(str(error_message))
+        return None
+
+def _iter_documents(dbs):
+    for db in dbs:
+        for doc_id in db.index_to_docstore_id.values():
+            doc = db.docstore.search(doc_id)
+            yield Document(page_content=doc.page_content, metadata=doc.metadata, id=doc_id)
+
+@traced("merge_vector_dbs")
+def merge_vector_dbs(source_names, file_name=None):
+    """
+    Builds an index by merging already-built indexes and their docstores.
+    No chunk is re-embedded (non-flat types re-add cached vectors), so this takes
+    seconds rather than a full indexing pass.
+    """
+    try:
+        if not source_names:
+            raise CustomException("No source vector databases provided")
+        db_path = get_db_path(file_name)
+        start = time.perf_counter()
+
+        source_dbs = []
+        for source_name in source_names:
+            db = load_vector_db(source_name, writable=True)
+            if db is None:
+                raise CustomException(f"Vector database {source_name} not found")
+            source_dbs.append(db)
+
+        if FAISS_INDEX_TYPE == "flat":
+            merged_db = source_dbs[0]
+            for db in source_dbs[1:]:
+                merged_db.merge_from(db)
+        else:
+            # Trained and graph indexes can't be concatenated, so rebuild from the
+            # stored chunks; their vectors come straight from the embedding cache.
+            merged_db = _add_chunks(None, _iter_documents(source_dbs), EMBEDDING_BATCH_SIZE)
+
+        save_vector_db(merged_db, db_path)
+        logger.info(
+            f"Merged {len(source_names)} vector databases ({merged_db.index.ntotal} vectors) "
+            f"into {db_path} in {time.perf_counter() - start:.2f}s"
+        )
+        return merged_db
+    except Exception as e:
+        error_message = CustomException("Error merging vector databases", e)
+        logger.error(str(error_message))
+        return None
@@ -0,0 +1,170 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from cachetools import LRUCache
+
+from app.components.vector_db import load_vector_db, get_index_version, get_memory_footprint
+from app.common.logger import get_logger
+from app.common.tracing import registry, cache_metrics, span
+
+from app.config.config import VECTOR_DB_CACHE_MAX_BYTES
+
+logger = get_logger(__name__)
+
+
+class _CacheEntry:
+    def __init__(self, db, version, size):
+        self.db = db
+        self.version = version
+        self.size = size
+
+
+class _BudgetedLRUCache(LRUCache):
+    def __init__(self, maxsize, on_evict):
+        super().__init__(maxsize=maxsize, getsizeof=lambda entry: entry.size)
+        self._on_evict = on_evict
+
+    def popitem(self):
+        key, entry = super().popitem()
+        self._on_evict(key, entry)
+        return key, entry
+
+
+class VectorDBCache:
+    """
+    LRU cache of loaded vector dbs bounded by the heap bytes they occupy, not by
+    count; memory-mapped vectors live in the page cache and are not counted.
+    Concurrent misses for the same index collapse into a single load, and an entry
+    is reloaded when the index on disk has been rebuilt since it was cached.
+    Listeners are told the name of every db dropped, so anything built on one
+    can let go of it too.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._cache = _BudgetedLRUCache(max_bytes, self._on_evict)
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._dropped = []
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.evictions = 0
+
+    def _on_evict(self, name, entry):
+        self.evictions += 1
+        self._dropped.append(name)
+        logger.info(f"Evicted vector database {name} ({entry.size} bytes) from cache")
+
+    def add_eviction_listener(self, listener):
+        """listener(name) is called, outside the cache lock, whenever a cached db is dropped."""
+        self._listeners.append(listener)
+
+    def _notify(self):
+        with self._lock:
+            dropped, self._dropped = self._dropped, []
+        for name in dropped:
+            for listener in self._listeners:
+                listener(name)
+
+    def get(self, name):
+        with span("vector_db_cache.get"):
+            try:
+                return self._get(name)
+            finally:
+                self._notify()
+
+    def holds(self, name, db):
+        """True while db is the cached entry for name."""
+        with self._lock:
+            entry = self._cache.get(name)
+            return entry is not None and entry.db is db
+
+    def _get(self, name):
+        version = get_index_version(name)
+        with self._lock:
+            entry = self._cache.get(name)
+            if entry is not None and entry.version == version:
+                self.hits += 1
+                return entry.db
+            if entry is not None:
+                logger.info(f"Vector database {name} was rebuilt, reloading")
+                del self._cache[name]
+                self._dropped.append(name)
+
+            future = self._loading.get(name)
+            is_loader = future is None
+            if is_loader:
+                future = Future()
+                self._loading[name] = future
+                self.misses += 1
+            else:
+                self.waits += 1
+
+        if not is_loader:
+            return future.result()
+
+        try:
+            start = time.perf_counter()
+            db = load_vector_db(name)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.loads += 1
+                self.load_seconds += elapsed
+                if db is not None:
+                    # The generation actually loaded, which is newer than version if
+                    # the index was re-saved in between
+                    self._put(name, _CacheEntry(db, db.index_version, get_memory_footprint(db)))
+            future.set_result(db)
+            return db
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(name, None)
+
+    def _put(self, name, entry):
+        if entry.size > self.max_bytes:
+            logger.warning(
+                f"Vector database {name} ({entry.size} bytes) exceeds the cache budget "
+                f"of {self.max_bytes} bytes, not caching it"
+            )
+            return
+        self._cache[name] = entry
+
+    def preload(self, names):
+        for name in names:
+            logger.info(f"Preloading vector database {name}")
+            if self.get(name) is None:
+                logger.warning(f"Could not preload vector database {name}")
+
+    def invalidate(self, name):
+        with self._lock:
+            if self._cache.pop(name, None) is not None:
+                self._dropped.append(name)
+        self._notify()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.waits
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "loads": self.loads,
+                "load_seconds": self.load_seconds,
+                "evictions": self.evictions,
+                "entries": len(self._cache),
+                "bytes": self._cache.currsize,
+                "max_bytes": self.max_bytes,
+            }
+
+
+vector_db_cache = VectorDBCache(VECTOR_DB_CACHE_MAX_BYTES)
+registry.add_collector(lambda: cache_metrics("vector_db", vector_db_cache.stats()))
@@ -13,11 +13,17 @@ HF_EMBEDDING_MODEL = "FinLang/finance-embeddings-investopedia" # financial speci
 OPENAI_LLM_MODEL = "gpt-4o-mini"
 HF_LLM_MODEL = "mistralai/Mistral-7B-Instruct-v0.3"
 
+# offline stand-ins for benchmarks: EMBEDDING_BACKEND=hash and LLM_MODEL=fake need no model download or API key
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "hf") # "hf", "hash"
+HASH_EMBEDDING_DIM = 768 # same as the finance embedding model
+FAKE_LLM_LATENCY_SECONDS = float(os.environ.get("FAKE_LLM_LATENCY_SECONDS", "0"))
+
 # assign api keys
 HF_TOKEN = os.environ.get("HF_TOKEN")
 HUGGINFACE_REPO_ID = os.environ.get("HUGGINFACE_REPO_ID")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 TAVILY_API_KEY = os.environ.get("TAVILY_API_KEY")
+SESSION_SECRET_KEY = os.environ.get("SESSION_SECRET_KEY") or None # must be shared by every worker of the async app
 
 
 # assign data paths
@@ -29,6 +35,105 @@ DATA_PATH = "data/"
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 NUM_OF_DOCS_TO_RETRIEVE = 5
-LLM_MODEL = "openai" #"hf", "openai"
+
+# pdf ingestion: pages are extracted in a process pool and streamed into the splitter
+PARALLEL_PDF_LOADING = True
+PDF_LOADER_WORKERS = int(os.environ.get("PDF_LOADER_WORKERS", os.cpu_count() or 1))
+PDF_PAGES_PER_TASK = 8
+
+# vector db build: chunks are embedded and added to the index in fixed-size batches
+EMBEDDING_BATCH_SIZE = 64
+
+# persistent embedding cache keyed by hash(model name + chunk text)
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = "cache/embeddings.sqlite"
+EMBEDDING_CACHE_MAX_ENTRIES = 200000
+
+# faiss index type: "flat", "hnsw", "ivf_flat", "ivf_pq", "sq8" (int8 scalar quantized)
+FAISS_INDEX_TYPE = "flat"
+FAISS_TRAIN_SAMPLE_SIZE = 4096 # chunks buffered to train ivf / pq / sq indexes
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_SEARCH = 64
+FAISS_IVF_NLIST = 256
+FAISS_IVF_NPROBE = 16
+FAISS_PQ_M = 48 # sub-quantizers, must divide the embedding dimension
+FAISS_PQ_NBITS = 8
+
+# serve indexes memory-mapped, with chunks fetched from docstore.sqlite per hit
+VECTOR_DB_MMAP = True
+
+# loaded vector dbs are cached per process up to this many bytes of heap (mmapped vectors are not counted)
+VECTOR_DB_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+QA_CHAIN_REGISTRY_SIZE = 32
+PRELOAD_COMPANIES = [c for c in os.environ.get("PRELOAD_COMPANIES", "").split(",") if c]
+
+# retrieval: "dense" (faiss only) or "hybrid" (faiss + bm25 fused with reciprocal rank fusion)
+RETRIEVAL_MODE = "hybrid"
+HYBRID_CANDIDATES = 20 # candidates taken from each ranking before fusion
+HYBRID_RRF_K = 60
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# context packing: merge overlapping chunks, drop near duplicates, cap prompt context size
+CONTEXT_PACKING_ENABLED = True
+CONTEXT_TOKEN_BUDGET = 1500
+CONTEXT_DUPLICATE_THRESHOLD = 0.8 # jaccard similarity of word 5-grams
+
+# agentic pipeline: run classification, speculative retrieval and search concurrently
+AGENTIC_CONCURRENT = True
+AGENTIC_SPECULATION_THRESHOLD = 0.6 # token jaccard between raw and rewritten query to reuse retrieval
+
+# local definition-query classifier, falls back to the llm when not confident
+LOCAL_CLASSIFIER_ENABLED = True
+CLASSIFIER_EMBEDDING_MARGIN = 0.05 # min cosine gap between class centroids to decide locally
+
+# definition lookups: local glossary, then persistent cache, then tavily
+TAVILY_BACKEND = os.environ.get("TAVILY_BACKEND", "tavily") # "tavily", "stub" (offline, no web search)
+TAVILY_TIMEOUT_SECONDS = 5
+DEFINITION_CACHE_PATH = "cache/definitions.sqlite"
+DEFINITION_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+GLOSSARY_ENABLED = True
+GLOSSARY_PATH = "data/glossary.json"
+GLOSSARY_SIMILARITY_THRESHOLD = 0.85
+
+# async serving: concurrent calls per dependency, and how many may queue for a slot
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "32"))
+SEARCH_CONCURRENCY = int(os.environ.get("SEARCH_CONCURRENCY", "8"))
+EMBEDDING_CONCURRENCY = int(os.environ.get("EMBEDDING_CONCURRENCY", "4"))
+MAX_QUEUED_CALLS = 256
+QUEUE_TIMEOUT_SECONDS = 10
+
+# background indexing: separate process pool, niced so chat traffic keeps the CPU
+INDEX_JOB_WORKERS = int(os.environ.get("INDEX_JOB_WORKERS", "1"))
+INDEX_JOB_NICE = 10
+
+# conversation history: stored server-side, prompts see a rolling summary plus the last turns
+CONVERSATION_DB_PATH = "cache/conversations.sqlite"
+CONVERSATION_RECENT_TURNS = 3
+CONVERSATION_SUMMARY_MAX_WORDS = 150
+CONVERSATION_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# batch question answering: parallel LLM calls, and the largest question x company matrix per request
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", "8"))
+BATCH_MAX_PAIRS = 5000
+
+# tracing: per-stage spans feed the /metrics histograms, requests slower than the threshold log their stages
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "true").lower() == "true"
+TRACE_LOG_THRESHOLD_SECONDS = 1.0
+
+# financial statement facts: line items extracted at index time, direct lookups, ratios and growth rates skip the llm
+FACT_DB_PATH = "vector_db/facts.sqlite"
+FACT_ANSWERS_ENABLED = os.environ.get("FACT_ANSWERS_ENABLED", "true").lower() == "true"
+
+# 10-K sections: chunks are tagged with their item and statement type, searches are pre-filtered to the sections a query routes to
+SECTION_ROUTING_ENABLED = os.environ.get("SECTION_ROUTING_ENABLED", "true").lower() == "true"
+SECTION_FILTER_MIN_CHUNKS = 20 # routed filters matching fewer chunks search the whole index
+
+# semantic answer cache, per company, keyed by query embedding
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95 # cosine similarity
+ANSWER_CACHE_TTL_SECONDS = 24 * 60 * 60
+ANSWER_CACHE_MAX_ENTRIES = 256 # per company
+LLM_MODEL = os.environ.get("LLM_MODEL", "openai") #"hf", "openai", "fake" (offline benchmarks)
 
 logger.info("Configuration loaded successfully")
\ No newline at end of file
@@ -1,8 +1,20 @@
 from flask import Flask, render_template, request, session, redirect, url_for, jsonify
-from app.components.embeddings import get_embedding_model
-from app.components.agentic_rag import agentic_rag_pipeline
-from app.components.create_index import create_index
+from flask import Response, stream_with_context
+from app.components.agentic_rag import agentic_rag_pipeline, agentic_rag_stream
+from app.components.index_jobs import index_jobs, is_index_ready, validate_company
+from app.components.vector_db_cache import vector_db_cache
+from app.components.batch_qa import batch_answer, validate_batch
+from app.components.create_index import list_companies
+from app.components.resources import warmup
+from app.components.answer_cache import answer_cache
+from app.components.sections import resolve_sections
+from app.components.conversation_store import conversation_store, turn_messages
 from app.common.logger import get_logger
+from app.common.tracing import instrument_flask_app
+from app.common.sse import sse_event, format_sources
+from app.common.concurrency import CapacityExceeded, limiter_stats
+from app.config.config import PRELOAD_COMPANIES
+import json
 import os
 
 logger = get_logger(__name__)
@@ -16,42 +28,53 @@ def nl2br(text):
     return Markup(text.replace('\n', '\n'))
 
 app.jinja_env.filters['nl2br'] = nl2br
+instrument_flask_app(app)
+
+vector_db_cache.preload(PRELOAD_COMPANIES)
+
+def get_conversation_id():
+    """The session cookie only holds this id; the messages live in the conversation store."""
+    conversation_id = session.get("conversation_id")
+    if conversation_id is None or not conversation_store.exists(conversation_id):
+        conversation_id = session["conversation_id"] = conversation_store.create()
+    return conversation_id
 
 @app.route("/", methods=["GET"])
 def index():
-    if "messages" not in session:
-        session["messages"] = []
+    if session.get("indexing_status", {}).get("pending") and "selected_company" in session:
+        session["indexing_status"] = index_jobs.status(session["selected_company"])
     
     return render_template("index.html", 
-                         messages=session.get("messages", []),
+                         messages=conversation_store.get_messages(get_conversation_id()),
                          indexing_status=session.get("indexing_status"),
                          error=session.get("error"))
 
 @app.route("/index_documents", methods=["POST"])
 def index_documents():
     company = request.form.get("company")
-    if company:
+    error = validate_company(company) if company else None
+    if error:
+        session["indexing_status"] = {"success": False, "message": error}
+        logger.warning(f"Rejected index request: {error}")
+    elif company:
         # Clear old indexing status and messages when selecting a new company
         old_company = session.get("selected_company")
         if old_company and old_company != company:
             # Clear old status and messages when switching companies
             session.pop("indexing_status", None)
-            session.pop("messages", None)
+            session.pop("conversation_id", None)
             session.pop("sources", None)
         
         try:
-            # Index the selected company's documents
-            create_index_for_company(company)
+            # Indexing runs in the background; the page polls /index_status until it's done
+            index_jobs.submit(company)
             session["selected_company"] = company
-            
+
             # Only clear messages if this is a new company or first time
             if old_company != company:
-                session["messages"] = []
-            
-            session["indexing_status"] = {
-                "success": True,
-                "message": f"Successfully indexed {company} documents!"
-            }
+                session.pop("conversation_id", None)
+
+            session["indexing_status"] = index_jobs.status(company)
             session.pop("error", None)  # Clear any previous errors
         except Exception as e:
             session["indexing_status"] = {
@@ -65,43 +88,33 @@ def index_documents():
 def chat():
     if "selected_company" not in session:
         return jsonify({"success": False, "error": "Please select a company first!"})
+    if not is_index_ready(session["selected_company"]):
+        return jsonify({"success": False, "error": index_jobs.status(session["selected_company"])["message"]})
 
     user_input = request.form.get("prompt")
     if not user_input:
         return jsonify({"success": False, "error": "No input provided"})
+    try:
+        sections = resolve_sections(request.form.get("section", ""))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)})
 
-    if "messages" not in session:
-        session["messages"] = []
-
+    conversation_id = get_conversation_id()
     try:
         result = agentic_rag_pipeline(
             user_input, 
             file_name=session["selected_company"],
-            history=session["messages"]
+            history=conversation_store.get_history(conversation_id),
+            sections=sections
         )
         response = result.get("response", "No response")
         tool_response = result.get("tool_response")
         source_documents = result.get("sources", [])
 
-        # Append user and bot messages to session
-        messages = session["messages"]
-        messages.append({"role": "user", "content": user_input})
-        if tool_response:
-            messages.append({"role": "Search_Tool", "content": tool_response})
-        messages.append({"role": "bot", "content": response})
-        session["messages"] = messages
+        conversation_store.append(conversation_id, turn_messages(user_input, tool_response, response))
 
         # Format sources for JSON response
-        sources = []
-        for i, doc in enumerate(source_documents, 1):
-            source_info = {
-                "number": i,
-                "content": doc.page_content[:1000] + "..." if len(doc.page_content) > 1000 else doc.page_content,
-                "metadata": {
-                    "page": doc.metadata.get("page")
-                }
-            }
-            sources.append(source_info)
+        sources = format_sources(source_documents, max_chars=1000)
 
         return jsonify({
             "success": True,
@@ -109,11 +122,59 @@ def chat():
             "sources": sources
         })
 
+    except CapacityExceeded as e:
+        logger.warning(f"Rejected chat request: {e}")
+        return jsonify({"success": False, "error": str(e)}), e.status_code
     except Exception as e:
         error_message = f"Error: {str(e)}"
         logger.error(f"Error in chat: {str(e)}")
         return jsonify({"success": False, "error": error_message})
 
+@app.route("/chat_stream", methods=["POST"])
+def chat_stream():
+    """
+    Server-Sent Events: sources once retrieval is done, then answer tokens as they
+    arrive. The turn is saved to the conversation store before the final "done" event.
+    """
+    if "selected_company" not in session:
+        return jsonify({"success": False, "error": "Please select a company first!"})
+    if not is_index_ready(session["selected_company"]):
+        return jsonify({"success": False, "error": index_jobs.status(session["selected_company"])["message"]})
+
+    user_input = request.form.get("prompt")
+    if not user_input:
+        return jsonify({"success": False, "error": "No input provided"})
+    try:
+        sections = resolve_sections(request.form.get("section", ""))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)})
+
+    company = session["selected_company"]
+    conversation_id = get_conversation_id()
+    history = conversation_store.get_history(conversation_id)
+
+    def generate():
+        try:
+            for event, data in agentic_rag_stream(user_input, file_name=company, history=history, sections=sections):
+                if event == "sources":
+                    yield sse_event("sources", format_sources(data, max_chars=1000))
+                elif event == "token":
+                    yield sse_event("token", {"text": data})
+                else:
+                    conversation_store.append(
+                        conversation_id, turn_messages(user_input, data["tool_response"], data["response"])
+                    )
+                    yield sse_event("done", {})
+        except Exception as e:
+            logger.error(f"Error in chat_stream: {str(e)}")
+            yield sse_event("error", {"error": f"Error: {str(e)}"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Add a new route to fetch sources for a specific message
 @app.route("/get_sources/<message_index>")
 def get_sources(message_index):
@@ -121,23 +182,53 @@ def get_sources(message_index):
     return {"sources": sources}
 
 
+@app.route("/batch_qa", methods=["POST"])
+def batch_qa():
+    """
+    Answers {"questions": [...], "companies": [...]} for every pair, streaming one
+    JSON object per line as answers complete. companies defaults to every indexed filing,
+    and an optional "sections" list limits retrieval to those 10-K sections.
+    """
+    body = request.get_json(silent=True) or {}
+    questions = body.get("questions")
+    companies = body.get("companies") or [company for company in list_companies() if is_index_ready(company)]
+    sections = body.get("sections")
+    error = validate_batch(questions, companies, sections)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+
+    def generate():
+        for result in batch_answer(questions, companies, sections=sections):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/index_status/<company>")
+def index_status(company):
+    error = validate_company(company)
+    if error:
+        return jsonify({"success": False, "error": error}), 404
+    return jsonify(index_jobs.status(company))
+
+@app.route("/stats")
+def stats():
+    return jsonify({
+        "vector_db_cache": vector_db_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "index_jobs": index_jobs.stats(),
+        "limiters": limiter_stats()
+    })
+
 @app.route("/clear")
 def clear():
-    session.pop("messages", None)
+    conversation_id = session.pop("conversation_id", None)
+    if conversation_id:
+        conversation_store.delete(conversation_id)
     # session.pop("selected_company", None)
     # session.pop("indexing_status", None)
     session.pop("error", None)
     return redirect(url_for("index"))
 
-def create_index_for_company(company):
-    """Index documents for specific company"""
-    try:
-        logger.info(f"Indexing documents for company: {company}")
-        create_index(file_name=company, force_reindex=False)
-        logger.info(f"Successfully indexed documents for {company}")
-    except Exception as e:
-        logger.error(f"Error creating index for {company}: {str(e)}")
-        raise e
-
 if __name__ == "__main__":
+    warmup()
     app.run(host="0.0.0.0", port=5001, debug=False, use_reloader=False)
\ No newline at end of file
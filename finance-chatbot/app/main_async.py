@@ -0,0 +1,290 @@
+"""
+ASGI version of main_agent for high-concurrency serving. Requests await the async
+agentic pipeline directly instead of holding a worker thread each, and the
+limiters in app.common.concurrency cap concurrent LLM, search and embedding calls,
+answering 429/503 when their queues are full.
+
+    uv run uvicorn app.main_async:app --host 0.0.0.0 --port 5001
+"""
+import json
+import os
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qs
+
+from markupsafe import Markup
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.templating import Jinja2Templates
+
+from app.components.agentic_rag import agentic_rag_pipeline_async, agentic_rag_astream
+from app.components.index_jobs import index_jobs, is_index_ready, validate_company
+from app.components.vector_db_cache import vector_db_cache
+from app.components.batch_qa import abatch_answer, validate_batch
+from app.components.create_index import list_companies
+from app.components.resources import warmup
+from app.components.answer_cache import answer_cache
+from app.components.conversation_store import conversation_store, turn_messages
+from app.components.sections import resolve_sections
+from app.common.concurrency import CapacityExceeded, limiter_stats
+from app.common.logger import get_logger
+from app.common.tracing import TracingMiddleware, registry, CONTENT_TYPE
+from app.common.sse import sse_event, format_sources
+from app.config.config import PRELOAD_COMPANIES, SESSION_SECRET_KEY
+
+logger = get_logger(__name__)
+
+if SESSION_SECRET_KEY is None:
+    # Each process would sign cookies with its own key, so a session only survives
+    # as long as its requests land on the worker that created it
+    logger.warning("SESSION_SECRET_KEY is not set; sessions will break with more than one uvicorn worker")
+
+templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "templates"))
+templates.env.filters['nl2br'] = lambda text: Markup(text.replace('\n', '\n'))
+
+async def form_data(request):
+    # Parsed here rather than with request.form() to avoid depending on python-multipart
+    body = (await request.body()).decode()
+    return {key: values[0] for key, values in parse_qs(body).items()}
+
+async def started(events):
+    """
+    Runs an async generator up to its first item, so CapacityExceeded is raised
+    while a status code can still be returned, and gives back the full stream.
+    """
+    try:
+        first = await anext(events)
+    except StopAsyncIteration:
+        return events
+
+    async def resumed():
+        yield first
+        async for item in events:
+            yield item
+    return resumed()
+
+async def get_conversation_id(session):
+    """The session cookie only holds this id; the messages live in the conversation store."""
+    conversation_id = session.get("conversation_id")
+    if conversation_id is None or not await run_in_threadpool(conversation_store.exists, conversation_id):
+        conversation_id = session["conversation_id"] = await run_in_threadpool(conversation_store.create)
+    return conversation_id
+
+async def index(request):
+    session = request.session
+    conversation_id = await get_conversation_id(session)
+    if session.get("indexing_status", {}).get("pending") and "selected_company" in session:
+        session["indexing_status"] = index_jobs.status(session["selected_company"])
+    return templates.TemplateResponse(request, "index.html", {
+        "session": session,
+        "messages": await run_in_threadpool(conversation_store.get_messages, conversation_id),
+        "indexing_status": session.get("indexing_status"),
+        "error": session.get("error")
+    })
+
+async def index_documents(request):
+    session = request.session
+    company = (await form_data(request)).get("company")
+    error = validate_company(company) if company else None
+    if error:
+        session["indexing_status"] = {"success": False, "message": error}
+        logger.warning(f"Rejected index request: {error}")
+    elif company:
+        old_company = session.get("selected_company")
+        if old_company and old_company != company:
+            session.pop("indexing_status", None)
+            session.pop("conversation_id", None)
+            session.pop("sources", None)
+
+        try:
+            index_jobs.submit(company)
+            session["selected_company"] = company
+            session["indexing_status"] = index_jobs.status(company)
+            session.pop("error", None)
+        except Exception as e:
+            session["indexing_status"] = {
+                "success": False,
+                "message": f"Error indexing {company}: {str(e)}"
+            }
+            logger.error(f"Error indexing {company}: {str(e)}")
+    return RedirectResponse(request.url_for("index"), status_code=303)
+
+async def chat(request):
+    session = request.session
+    if "selected_company" not in session:
+        return JSONResponse({"success": False, "error": "Please select a company first!"})
+    if not is_index_ready(session["selected_company"]):
+        return JSONResponse({"success": False, "error": index_jobs.status(session["selected_company"])["message"]})
+
+    form = await form_data(request)
+    user_input = form.get("prompt")
+    if not user_input:
+        return JSONResponse({"success": False, "error": "No input provided"})
+    try:
+        sections = resolve_sections(form.get("section", ""))
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)})
+
+    conversation_id = await get_conversation_id(session)
+    try:
+        result = await agentic_rag_pipeline_async(
+            user_input,
+            file_name=session["selected_company"],
+            history=await run_in_threadpool(conversation_store.get_history, conversation_id),
+            sections=sections
+        )
+    except CapacityExceeded as e:
+        logger.warning(f"Rejected chat request: {e}")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=e.status_code)
+
+    response = result.get("response", "No response")
+    tool_response = result.get("tool_response")
+
+    await run_in_threadpool(
+        conversation_store.append, conversation_id, turn_messages(user_input, tool_response, response)
+    )
+
+    return JSONResponse({
+        "success": True,
+        "response": response,
+        "sources": format_sources(result.get("sources", []), max_chars=1000)
+    })
+
+async def chat_stream(request):
+    """
+    Same events as main_agent's /chat_stream. The pipeline runs on the event loop
+    under the limiters; a request they reject gets a 429/503 instead of a stream.
+    """
+    session = request.session
+    if "selected_company" not in session:
+        return JSONResponse({"success": False, "error": "Please select a company first!"})
+    if not is_index_ready(session["selected_company"]):
+        return JSONResponse({"success": False, "error": index_jobs.status(session["selected_company"])["message"]})
+
+    form = await form_data(request)
+    user_input = form.get("prompt")
+    if not user_input:
+        return JSONResponse({"success": False, "error": "No input provided"})
+    try:
+        sections = resolve_sections(form.get("section", ""))
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)})
+
+    company = session["selected_company"]
+    conversation_id = await get_conversation_id(session)
+    history = await run_in_threadpool(conversation_store.get_history, conversation_id)
+
+    try:
+        events = await started(
+            agentic_rag_astream(user_input, file_name=company, history=history, sections=sections)
+        )
+    except CapacityExceeded as e:
+        logger.warning(f"Rejected chat_stream request: {e}")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=e.status_code)
+    except Exception as e:
+        logger.error(f"Error in chat_stream: {str(e)}")
+        return JSONResponse({"success": False, "error": f"Error: {str(e)}"})
+
+    async def generate():
+        try:
+            async for event, data in events:
+                if event == "sources":
+                    yield sse_event("sources", format_sources(data, max_chars=1000))
+                elif event == "token":
+                    yield sse_event("token", {"text": data})
+                else:
+                    await run_in_threadpool(
+                        conversation_store.append,
+                        conversation_id, turn_messages(user_input, data["tool_response"], data["response"])
+                    )
+                    yield sse_event("done", {})
+        except Exception as e:
+            logger.error(f"Error in chat_stream: {str(e)}")
+            yield sse_event("error", {"error": f"Error: {str(e)}"})
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def batch_qa(request):
+    """
+    Same request and NDJSON response as main_agent's /batch_qa, answered under the
+    limiters; a batch they reject up front gets a 429/503.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    questions = body.get("questions")
+    companies = body.get("companies") or [company for company in list_companies() if is_index_ready(company)]
+    sections = body.get("sections")
+    error = validate_batch(questions, companies, sections)
+    if error:
+        return JSONResponse({"success": False, "error": error}, status_code=400)
+
+    try:
+        results = await started(abatch_answer(questions, companies, sections=sections))
+    except CapacityExceeded as e:
+        logger.warning(f"Rejected batch_qa request: {e}")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=e.status_code)
+
+    async def generate():
+        async for result in results:
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+async def index_status(request):
+    company = request.path_params["company"]
+    error = validate_company(company)
+    if error:
+        return JSONResponse({"success": False, "error": error}, status_code=404)
+    return JSONResponse(index_jobs.status(company))
+
+async def stats(request):
+    return JSONResponse({
+        "vector_db_cache": vector_db_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "index_jobs": index_jobs.stats(),
+        "limiters": limiter_stats()
+    })
+
+async def metrics(request):
+    return Response(registry.render(), headers={"Content-Type": CONTENT_TYPE})
+
+async def clear(request):
+    conversation_id = request.session.pop("conversation_id", None)
+    if conversation_id:
+        await run_in_threadpool(conversation_store.delete, conversation_id)
+    request.session.pop("error", None)
+    return RedirectResponse(request.url_for("index"), status_code=303)
+
+@asynccontextmanager
+async def lifespan(app):
+    await run_in_threadpool(warmup)
+    await run_in_threadpool(vector_db_cache.preload, PRELOAD_COMPANIES)
+    yield
+
+app = Starlette(
+    routes=[
+        Route("/", index, methods=["GET"], name="index"),
+        Route("/index_documents", index_documents, methods=["POST"], name="index_documents"),
+        Route("/chat", chat, methods=["POST"], name="chat"),
+        Route("/chat_stream", chat_stream, methods=["POST"], name="chat_stream"),
+        Route("/batch_qa", batch_qa, methods=["POST"], name="batch_qa"),
+        Route("/index_status/{company}", index_status, name="index_status"),
+        Route("/stats", stats, name="stats"),
+        Route("/metrics", metrics, name="metrics"),
+        Route("/clear", clear, name="clear"),
+    ],
+    middleware=[
+        Middleware(TracingMiddleware),
+        Middleware(SessionMiddleware, secret_key=SESSION_SECRET_KEY or os.urandom(24).hex())
+    ],
+    lifespan=lifespan
+)
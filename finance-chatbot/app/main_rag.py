@@ -1,8 +1,20 @@
 from flask import Flask, render_template, request, session, redirect, url_for, jsonify
-from app.components.embeddings import get_embedding_model
-from app.components.retriever import build_qa_chain
-from app.components.create_index import create_index
+from flask import Response, stream_with_context
+from app.components.retriever import build_qa_chain, stream_qa
+from app.components.index_jobs import index_jobs, is_index_ready, validate_company
+from app.components.vector_db_cache import vector_db_cache
+from app.components.batch_qa import batch_answer, validate_batch
+from app.components.create_index import list_companies
+from app.components.resources import warmup
+from app.components.answer_cache import answer_cache
+from app.components.sections import resolve_sections, cache_namespace
+from app.components.fact_answers import answer_from_facts
 from app.common.logger import get_logger
+from app.common.tracing import instrument_flask_app, span
+from app.common.sse import sse_event, format_sources
+from app.common.concurrency import CapacityExceeded
+from app.config.config import PRELOAD_COMPANIES
+import json
 import os
 
 logger = get_logger(__name__)
@@ -16,11 +28,16 @@ def nl2br(text):
     return Markup(text.replace('\n', '\n'))
 
 app.jinja_env.filters['nl2br'] = nl2br
+instrument_flask_app(app)
+
+vector_db_cache.preload(PRELOAD_COMPANIES)
 
 @app.route("/", methods=["GET"])
 def index():
     if "messages" not in session:
         session["messages"] = []
+    if session.get("indexing_status", {}).get("pending") and "selected_company" in session:
+        session["indexing_status"] = index_jobs.status(session["selected_company"])
     
     return render_template("index.html", 
                          messages=session.get("messages", []),
@@ -30,7 +47,11 @@ def index():
 @app.route("/index_documents", methods=["POST"])
 def index_documents():
     company = request.form.get("company")
-    if company:
+    error = validate_company(company) if company else None
+    if error:
+        session["indexing_status"] = {"success": False, "message": error}
+        logger.warning(f"Rejected index request: {error}")
+    elif company:
         # Clear old indexing status and messages when selecting a new company
         old_company = session.get("selected_company")
         if old_company and old_company != company:
@@ -40,18 +61,15 @@ def index_documents():
             session.pop("sources", None)
         
         try:
-            # Index the selected company's documents
-            create_index_for_company(company)
+            # Indexing runs in the background; the page polls /index_status until it's done
+            index_jobs.submit(company)
             session["selected_company"] = company
-            
+
             # Only clear messages if this is a new company or first time
             if old_company != company:
                 session["messages"] = []
-            
-            session["indexing_status"] = {
-                "success": True,
-                "message": f"Successfully indexed {company} documents!"
-            }
+
+            session["indexing_status"] = index_jobs.status(company)
             session.pop("error", None)  # Clear any previous errors
         except Exception as e:
             session["indexing_status"] = {
@@ -65,30 +83,39 @@ def index_documents():
 def chat():
     if "selected_company" not in session:
         return jsonify({"success": False, "error": "Please select a company first!"})
+    if not is_index_ready(session["selected_company"]):
+        return jsonify({"success": False, "error": index_jobs.status(session["selected_company"])["message"]})
     
     user_input = request.form.get("prompt")
     if not user_input:
         return jsonify({"success": False, "error": "No input provided"})
+    try:
+        sections = resolve_sections(request.form.get("section", ""))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)})
     
     try:
-        qa_chain = build_qa_chain(file_name=session["selected_company"])
-        response = qa_chain.invoke({"query": user_input})
+        company = session["selected_company"]
+        fact_answer = answer_from_facts(company, user_input)
+        if fact_answer is not None:
+            response = {"result": fact_answer["response"], "source_documents": fact_answer["sources"]}
+        else:
+            response = answer_cache.lookup(company, user_input, namespace=cache_namespace("rag", sections))
+        if response is None:
+            qa_chain = build_qa_chain(file_name=company, sections=sections)
+            with span("qa_chain"):
+                response = qa_chain.invoke({"query": user_input})
+            answer_cache.store(company, user_input, {
+                "result": response.get("result"),
+                "source_documents": response.get("source_documents", [])
+            }, namespace=cache_namespace("rag", sections))
         logger.info(f"Response: {response}")
         
         result = response.get("result", "No response")
         source_documents = response.get("source_documents", [])
         
         # Format sources for JSON response
-        sources = []
-        for i, doc in enumerate(source_documents, 1):
-            source_info = {
-                "number": i,
-                "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-                "metadata": {
-                    "page": doc.metadata.get("page")  # Only keep page number
-                }
-            }
-            sources.append(source_info)
+        sources = format_sources(source_documents, max_chars=200)
         
         return jsonify({
             "success": True,
@@ -96,11 +123,73 @@ def chat():
             "sources": sources
         })
         
+    except CapacityExceeded as e:
+        logger.warning(f"Rejected chat request: {e}")
+        return jsonify({"success": False, "error": str(e)}), e.status_code
     except Exception as e:
         error_message = f"Error: {str(e)}"
         logger.error(f"Error in chat: {str(e)}")
         return jsonify({"success": False, "error": error_message})
 
+@app.route("/chat_stream", methods=["POST"])
+def chat_stream():
+    """Server-Sent Events: sources once retrieval is done, then answer tokens as they arrive."""
+    if "selected_company" not in session:
+        return jsonify({"success": False, "error": "Please select a company first!"})
+    if not is_index_ready(session["selected_company"]):
+        return jsonify({"success": False, "error": index_jobs.status(session["selected_company"])["message"]})
+
+    user_input = request.form.get("prompt")
+    if not user_input:
+        return jsonify({"success": False, "error": "No input provided"})
+    try:
+        sections = resolve_sections(request.form.get("section", ""))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)})
+
+    company = session["selected_company"]
+
+    def generate():
+        try:
+            fact_answer = answer_from_facts(company, user_input)
+            if fact_answer is not None:
+                yield sse_event("sources", format_sources(fact_answer["sources"], max_chars=200))
+                yield sse_event("token", {"text": fact_answer["response"]})
+                yield sse_event("done", {})
+                return
+
+            cached = answer_cache.lookup(company, user_input, namespace=cache_namespace("rag", sections))
+            if cached is not None:
+                yield sse_event("sources", format_sources(cached["source_documents"], max_chars=200))
+                yield sse_event("token", {"text": cached["result"]})
+                yield sse_event("done", {})
+                return
+
+            tokens = []
+            source_documents = []
+            for event, data in stream_qa(user_input, file_name=company, sections=sections):
+                if event == "sources":
+                    source_documents = data
+                    yield sse_event("sources", format_sources(data, max_chars=200))
+                else:
+                    tokens.append(data)
+                    yield sse_event("token", {"text": data})
+
+            answer_cache.store(company, user_input, {
+                "result": "".join(tokens),
+                "source_documents": source_documents
+            }, namespace=cache_namespace("rag", sections))
+            yield sse_event("done", {})
+        except Exception as e:
+            logger.error(f"Error in chat_stream: {str(e)}")
+            yield sse_event("error", {"error": f"Error: {str(e)}"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Add a new route to fetch sources for a specific message
 @app.route("/get_sources/<message_index>")
 def get_sources(message_index):
@@ -108,6 +197,42 @@ def get_sources(message_index):
     return {"sources": sources}
 
 
+@app.route("/batch_qa", methods=["POST"])
+def batch_qa():
+    """
+    Answers {"questions": [...], "companies": [...]} for every pair, streaming one
+    JSON object per line as answers complete. companies defaults to every indexed filing,
+    and an optional "sections" list limits retrieval to those 10-K sections.
+    """
+    body = request.get_json(silent=True) or {}
+    questions = body.get("questions")
+    companies = body.get("companies") or [company for company in list_companies() if is_index_ready(company)]
+    sections = body.get("sections")
+    error = validate_batch(questions, companies, sections)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+
+    def generate():
+        for result in batch_answer(questions, companies, sections=sections):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/index_status/<company>")
+def index_status(company):
+    error = validate_company(company)
+    if error:
+        return jsonify({"success": False, "error": error}), 404
+    return jsonify(index_jobs.status(company))
+
+@app.route("/stats")
+def stats():
+    return jsonify({
+        "vector_db_cache": vector_db_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "index_jobs": index_jobs.stats()
+    })
+
 @app.route("/clear")
 def clear():
     session.pop("messages", None)
@@ -116,15 +241,6 @@ def clear():
     session.pop("error", None)
     return redirect(url_for("index"))
 
-def create_index_for_company(company):
-    """Index documents for specific company"""
-    try:
-        logger.info(f"Indexing documents for company: {company}")
-        create_index(file_name=company, force_reindex=False)
-        logger.info(f"Successfully indexed documents for {company}")
-    except Exception as e:
-        logger.error(f"Error creating index for {company}: {str(e)}")
-        raise e
-
 if __name__ == "__main__":
+    warmup()
     app.run(host="0.0.0.0", port=5001, debug=False, use_reloader=False)
\ No newline at end of file
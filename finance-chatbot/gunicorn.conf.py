@@ -0,0 +1,21 @@
+# Gunicorn settings for the Flask apps:
+#
+#     uv run gunicorn -c gunicorn.conf.py app.main_agent:app
+#
+# The app and the embedding model are loaded once in the master and shared
+# copy-on-write by the forked workers, instead of once per worker.
+import os
+
+bind = "0.0.0.0:5001"
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+timeout = 120
+preload_app = True
+
+def when_ready(server):
+    from app.components.resources import warmup
+    # No probe and no LLM client here: torch thread pools and open sockets don't survive fork
+    warmup(llm=False, probe=False)
+
+def post_fork(server, worker):
+    from app.components.resources import warmup
+    warmup()
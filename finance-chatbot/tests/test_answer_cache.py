@@ -0,0 +1,44 @@
+import re
+
+import pytest
+
+from app.components import answer_cache as answer_cache_module
+from app.components.answer_cache import SemanticAnswerCache, period_tokens
+
+
+class WordEmbeddings:
+    """Bag of words over letters only, so queries differing in a year or number embed identically."""
+
+    VOCABULARY = ("what", "was", "is", "the", "revenue", "in", "operating", "margin", "net", "income")
+
+    def embed_query(self, text):
+        words = re.findall(r"[a-z]+", text.lower())
+        return [float(words.count(word)) for word in self.VOCABULARY]
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(answer_cache_module, "get_index_version", lambda company: 1)
+    return SemanticAnswerCache(threshold=0.95, ttl_seconds=60, max_entries=8, embedding_model=WordEmbeddings())
+
+
+def test_hit_for_the_same_question(cache):
+    cache.store("NASDAQ_AAPL_2024", "What was the revenue in 2024?", {"response": "391,035"})
+    assert cache.lookup("NASDAQ_AAPL_2024", "what was the revenue in 2024") == {"response": "391,035"}
+
+
+def test_miss_for_a_question_differing_only_in_its_year(cache):
+    cache.store("NASDAQ_AAPL_2024", "What was the revenue in 2024?", {"response": "391,035"})
+    assert cache.lookup("NASDAQ_AAPL_2024", "What was the revenue in 2023?") is None
+
+
+def test_miss_for_a_question_differing_only_in_its_quarter(cache):
+    cache.store("NASDAQ_AAPL_2024", "Q3 operating margin", {"response": "30.1%"})
+    assert cache.lookup("NASDAQ_AAPL_2024", "Q4 operating margin") is None
+    assert cache.lookup("NASDAQ_AAPL_2024", "third quarter operating margin") == {"response": "30.1%"}
+
+
+def test_period_tokens_are_normalized():
+    assert period_tokens("FY24 net income") == period_tokens("net income in fiscal 2024")
+    assert period_tokens("EPS of $1.50") == period_tokens("EPS of $1.5")
+    assert period_tokens("revenue last year") != period_tokens("revenue this year")